@@ -1,6 +1,7 @@
-from flask import Flask, render_template, request, jsonify, redirect, send_from_directory
-import requests
+from flask import Flask, Response, abort, render_template, request, jsonify, redirect, send_file, send_from_directory, stream_with_context
 from db_queries import (get_all_bottles, 
+                                load_bottle_catalog,
+                                get_bottle_page,
                                 add_bottle, 
                                 remove_bottle, 
                                 get_bottles_from_query, 
@@ -27,55 +28,102 @@ from db_queries import (get_all_bottles,
                                 bottle_exists,
                                 user_exists,
                                 get_event_participants,
+                                migrate_database,
+                                get_review_summary,
+                                add_event_photo,
+                                get_event_photos,
+                                search_bottles,
+                                get_bottle_name_by_id,
+                                get_user_name_by_id,
+                                get_event_bottle_ids,
+                                get_data_versions,
+                                VERSIONED_TABLES,
+                                get_connection_stats,
                                 )
 from flask_cors import CORS
-import base64
 import os
-from duckduckgo_search import DDGS
+import uuid
+from functools import partial
 import json
-import requests
-from urllib.parse import quote_plus
-from openai import OpenAI
-from notes_generator import generate_expert_notes
+from notes_generator import generate_expert_notes_batch
 from description_generator import generate_description
+from conditional_get import conditional
+from event_feed import feed, format_sse
+from fragment_cache import fragments
+from image_candidates import CANDIDATE_MAX_AGE, candidate_path, find_candidates
+from image_pipeline import (IMAGE_ROOT, IMAGE_SIZES, MAX_UPLOAD_BYTES, UploadTooLarge, choose_variant,
+                            create_variants_for_path, image_info, image_url, resolve_original,
+                            save_base64_upload, save_upload)
+import metrics
+from recommendations import MAX_RECOMMENDATIONS, get_recommendations
+from refresh_jobs import runner as refresh_runner
+from similarity import MAX_NEIGHBOURS, get_similar_bottles
 
 
 
 app = Flask(__name__)
+# Leaves room for a photo sent base64-encoded inside a JSON body
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_BYTES * 4 // 3 + 1024 * 1024
 CORS(app)
-
-def get_api_key(filepath: str = "secrets.json", key_name: str = "OPENAI_KEY") -> str:
+metrics.init_app(app)
+# Templates build image URLs with image_url(), which versions them for caching
+app.jinja_env.globals["image_url"] = image_url
+
+API_BOTTLES_MAX_LIMIT = 100
+SIMILAR_BOTTLES_SHOWN = 6  # "Bottles like this" tiles in the bottle popup
+RECOMMENDATIONS_SHOWN = 3  # "Try next" suggestions in the event client
+IMAGE_IMMUTABLE_MAX_AGE = 365 * 24 * 3600  # For image URLs versioned with ?v= by image_url()
+
+# Tables each cached page is rendered from; a write to any of them re-renders it
+BOTTLE_PAGE_TABLES = ("bottles", "reviews", "community_notes", "expert_notes", "tasting_notes", "users")
+USERS_PAGE_TABLES = ("users", "reviews", "community_notes", "bottles", "tasting_notes")
+CATALOG_API_TABLES = ("bottles", "reviews")
+RECOMMENDATION_TABLES = ("reviews", "bottles", "users", "event_drinks")
+
+# sort_by values accepted by /inventory, mapped to their ORDER BY expression
+INVENTORY_SORT_COLUMNS = {
+    "name": "bottles.name",
+    "brand": "bottles.brand",
+    "abv": "bottles.abv",
+    "rating": "COALESCE(bottle_stats.score_sum * 1.0 / bottle_stats.review_count, 0)",
+    "reviews": "COALESCE(bottle_stats.review_count, 0)",
+}
+
+# Bottles classified per LLM request when refreshing expert notes
+NOTES_BATCH_SIZE = 5
+
+# Photos per page in the event console gallery
+EVENT_PHOTOS_PAGE_SIZE = 24
+
+# Seconds between keep-alive comments on idle event streams
+EVENT_STREAM_HEARTBEAT = 15
+
+migrate_database()
+
+@app.errorhandler(413)
+def request_too_large(error):
+    return jsonify({"error": f"Upload is larger than {MAX_UPLOAD_BYTES // (1024 * 1024)} MB"}), 413
+
+def render_cached(tables, render, *key):
     """
-    Reads and returns the API key from a local JSON file.
-
-    Args:
-        filepath (str): Path to the secrets file.
-        key_name (str): Key name to look up inside the JSON.
-
-    Returns:
-        str: The API key as a string.
+    Return the HTML from render(), reusing the copy cached for this route, its
+    query arguments, any extra key parts and the current versions of tables.
     """
-    try:
-        with open(filepath, "r") as f:
-            secrets = json.load(f)
-        api_key = secrets.get(key_name)
-        if not api_key:
-            raise ValueError(f"API key '{key_name}' not found in {filepath}")
-        return api_key
-    except FileNotFoundError:
-        raise FileNotFoundError(f"Secrets file not found at: {filepath}")
-    except json.JSONDecodeError:
-        raise ValueError("Secrets file is not valid JSON")
+    cache_key = (request.endpoint, tuple(sorted(request.args.items(multi=True))), key, get_data_versions(tables))
+    return fragments.get_or_render(cache_key, render)
 
 @app.route('/', methods=["GET"])
+@conditional(())
 def johns_bar():
     return render_template('johns_bar.html')
 
 @app.route('/home', methods=["GET"])
+@conditional(())
 def home():
     return render_template('home.html')
 
 @app.route('/inventory', methods=["GET"])
+@conditional(BOTTLE_PAGE_TABLES)
 def inventory():
     # Build filters from query parameters
     filters = {
@@ -85,61 +133,165 @@ def inventory():
     }
     sort_by = request.args.get("sort_by", "brand")  # Default sort by name
     order = request.args.get("order", "asc")       # Default order ascending
-
-    # Build SQL query dynamically
-    query = "SELECT * FROM bottles WHERE 1=1"
+    sort_column = INVENTORY_SORT_COLUMNS.get(sort_by, INVENTORY_SORT_COLUMNS["brand"])
+    order = "DESC" if order.lower() == "desc" else "ASC"
+
+    # Build SQL query dynamically; ratings come from the precomputed bottle_stats
+    query = """
+        SELECT bottles.* FROM bottles
+        LEFT JOIN bottle_stats ON bottle_stats.bottle_id = bottles.id
+        WHERE 1=1"""
     params = []
     for key, value in filters.items():
         if value:
-            query += f" AND {key} = ?"
+            query += f" AND bottles.{key} = ?"
             params.append(value)
 
-    query += f" ORDER BY {sort_by} {order.upper()}"  # Always add ORDER BY
+    query += f" ORDER BY {sort_column} {order}"  # Always add ORDER BY
 
-    bottles = get_bottles_from_query(query, params)
-    tasting_notes = get_tasting_notes()
-    users = get_all_users_with_reviews()
+    def render():
+        # The cards only show bottle details and aggregates, not individual reviews
+        bottles = load_bottle_catalog(query, params, include_reviews=False)
+        tasting_notes = get_tasting_notes()
+        users = get_all_users_with_reviews()
+        return render_template('inventory.html', bottles=bottles, tasting_notes=tasting_notes, users=users)
 
-    return render_template('inventory.html', bottles=bottles, tasting_notes=tasting_notes, users=users)
+    return render_cached(BOTTLE_PAGE_TABLES, render)
 
 @app.route("/modal/bottle", methods=["POST"])
 def bottle_modal():
     data = request.get_json()
     bottle_id = data.get("bottle_id")
 
-    query = "SELECT * FROM bottles WHERE id = ?"
-    bottles = get_bottles_from_query(query, (bottle_id,))
-    tasting_notes = get_tasting_notes()
-    users = list(get_all_users_with_reviews())
-    
-    if not bottles:
-        return "Bottle not found", 404
-    print(bottles[0])
-    return render_template("modals/bottle_card_popup.html", bottle=bottles[0], tasting_notes=tasting_notes, users=users)
+    def render():
+        query = "SELECT * FROM bottles WHERE id = ?"
+        bottles = get_bottles_from_query(query, (bottle_id,))
+        tasting_notes = get_tasting_notes()
+        users = list(get_all_users_with_reviews())
+
+        if not bottles:
+            return "Bottle not found", 404
+        similar_bottles = get_similar_bottles(bottles[0]["id"], limit=SIMILAR_BOTTLES_SHOWN)
+        return render_template("modals/bottle_card_popup.html", bottle=bottles[0], tasting_notes=tasting_notes,
+                               users=users, similar_bottles=similar_bottles)
+
+    return render_cached(BOTTLE_PAGE_TABLES, render, str(bottle_id))
 
 @app.route('/api/bottles')
+@conditional(CATALOG_API_TABLES)
 def api_bottles():
-    start = int(request.args.get('offset', 0))
-    limit = int(request.args.get('limit', 30))
-    end = min(start + limit, len(get_all_bottles()))
-    bottles = get_all_bottles()[start:end]
-    return jsonify([
-        {
-            "id": b["id"],
-            "brand": b["brand"],
-            "name": b["name"],
-            "abv": b["abv"],
-            "image_path": b["image_path"],
-            "available": b["available"],
-        } for b in bottles
-    ])
+    """
+    Page through the catalog.
+
+    With after_id (0 for the first page) the response is
+    {"bottles": [...], "next_cursor": id or null}; pass next_cursor back as
+    after_id to fetch the following page. Without it the endpoint keeps its
+    original contract for existing callers: a plain list of bottles, paged
+    with offset and limit.
+    """
+    try:
+        limit = max(1, min(int(request.args.get('limit', 30)), API_BOTTLES_MAX_LIMIT))
+        after_id = request.args.get('after_id')
+        after_id = int(after_id) if after_id is not None else None
+        offset = max(0, int(request.args.get('offset', 0)))
+    except ValueError:
+        return jsonify({"error": "limit, offset and after_id must be integers"}), 400
+
+    if after_id is not None:
+        bottles, next_cursor = get_bottle_page(after_id=after_id, limit=limit)
+        return jsonify({"bottles": bottles, "next_cursor": next_cursor})
+    bottles, _ = get_bottle_page(limit=limit, offset=offset)
+    return jsonify(bottles)
+
+@app.route('/api/bottles/<int:bottle_id>/similar')
+@conditional(BOTTLE_PAGE_TABLES)
+def api_similar_bottles(bottle_id):
+    """
+    Bottles with the closest tasting note profile to bottle_id, best first.
+    Each carries its cosine score and the notes the two bottles share most.
+    """
+    try:
+        limit = max(1, min(int(request.args.get('limit', SIMILAR_BOTTLES_SHOWN)), MAX_NEIGHBOURS))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    if get_bottle_name_by_id(bottle_id) is None:
+        return jsonify({"error": "Bottle not found"}), 404
+    return jsonify({"bottle_id": bottle_id, "similar": get_similar_bottles(bottle_id, limit=limit)})
+
+@app.route('/api/search')
+@conditional(CATALOG_API_TABLES)
+def api_search():
+    """
+    Ranked full-text search over bottles and reviews. Words match as prefixes,
+    and each result carries an HTML snippet with the matched terms in <mark>.
+    """
+    query = request.args.get('q', '')
+    try:
+        limit = max(1, min(int(request.args.get('limit', 20)), API_BOTTLES_MAX_LIMIT))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    return jsonify({"query": query, "results": search_bottles(query, limit=limit)})
+
+@app.route('/api/users/<int:user_id>/recommendations')
+@conditional(RECOMMENDATION_TABLES)
+def api_user_recommendations(user_id):
+    """
+    Available bottles the user hasn't reviewed, ranked by the score they are
+    predicted to give them. Pass event_id to only suggest that event's bottles.
+    """
+    if get_user_name_by_id(user_id) is None:
+        return jsonify({"error": "User not found"}), 404
+    try:
+        limit = max(1, min(int(request.args.get('limit', RECOMMENDATIONS_SHOWN)), MAX_RECOMMENDATIONS))
+        event_id = request.args.get('event_id')
+        event_id = int(event_id) if event_id else None
+    except ValueError:
+        return jsonify({"error": "limit and event_id must be integers"}), 400
+
+    candidate_ids = get_event_bottle_ids(event_id) if event_id is not None else None
+    recommendations = get_recommendations(user_id, limit=limit, candidate_ids=candidate_ids)
+    return jsonify({"user_id": user_id, "recommendations": recommendations})
 
 @app.route('/users', methods=["GET"])
+@conditional(USERS_PAGE_TABLES)
 def users():
-    users = get_all_users_with_reviews()
-    return render_template('users.html', users=users)
+    def render():
+        users = get_all_users_with_reviews()
+        return render_template('users.html', users=users)
+
+    return render_cached(USERS_PAGE_TABLES, render)
+
+@app.route('/api/cache_stats')
+def api_cache_stats():
+    """Size and hit rate of this process's rendered-page cache."""
+    return jsonify({"fragments": fragments.stats()})
+
+def collect_cache_metrics():
+    """Fragment cache and connection pool counters, for /metrics."""
+    cache = fragments.stats()
+    connections = get_connection_stats()
+    return [
+        ("fragment_cache_hits_total", "counter", "Rendered pages served from the cache.", cache["hits"]),
+        ("fragment_cache_misses_total", "counter", "Rendered pages that had to be rendered.", cache["misses"]),
+        ("fragment_cache_evictions_total", "counter", "Rendered pages evicted to stay under the size limit.",
+         cache["evictions"]),
+        ("fragment_cache_bytes", "gauge", "Size of the rendered pages held in the cache.", cache["bytes"]),
+        ("sqlite_connections_opened_total", "counter", "SQLite connections opened by the pool.",
+         connections["opened"]),
+    ]
+
+metrics.registry.register_collector(collect_cache_metrics)
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """
+    This process's request latency, SQL and outbound call metrics in the
+    Prometheus text format. Each gunicorn worker keeps its own.
+    """
+    return Response(metrics.registry.render(), mimetype="text/plain; version=0.0.4")
 
 @app.route("/events", methods=["GET"])
+@conditional(VERSIONED_TABLES)
 def events():
     try:
         events = get_all_events()  # Call the database function
@@ -148,6 +300,8 @@ def events():
         return jsonify({"error": str(e)}), 500
 
 @app.route("/event", methods=["GET"])
+# The console page embeds the live feed's cursor
+@conditional(VERSIONED_TABLES, key=feed.latest)
 def event():
     id = request.args.get('id')
     version = request.args.get('version')
@@ -161,25 +315,20 @@ def event():
         users = get_all_users_with_reviews()
         print(event)
 
-            # Fetch all image files in the directory
-        try:
-            images = [
-                f"{event['folder_path']}/{file}" for file in os.listdir(event['folder_path']) if file.lower().endswith(('.png', '.jpg', '.jpeg', '.gif'))
-            ]
-        except FileNotFoundError:
-            images = []  # If the folder doesn't exist, return an empty list
-
-
-
         if not event:
             return "An error occurred: unknown event provided."
+        # Newest photos first; older pages load from /api/events/<id>/photos
+        photos, photos_cursor = get_event_photos(event["id"], limit=EVENT_PHOTOS_PAGE_SIZE)
         print(bottles)
         print(users)
-        return render_template("event_console.html", event=event, bottles=bottles, users=list(users), images=images)
+        # Changes after this point reach the page through the event stream
+        return render_template("event_console.html", event=event, bottles=bottles, users=list(users), photos=photos,
+                               photos_cursor=photos_cursor, feed_cursor=feed.latest())
     else:
         return "An error occurred: unknown URL version provided. Options are client/console.", 500
 
 @app.route("/event_client", methods=["GET"])
+@conditional(VERSIONED_TABLES, key=lambda: request.cookies.get("user_id"), private=True)
 def event_client():
     id = request.args.get('id')
     user_id = request.cookies.get("user_id")
@@ -191,11 +340,62 @@ def event_client():
         print(user_id)
         if int(user_id) not in [int(participant["id"]) for participant in get_event_participants(id)]:
             add_user_to_event([user_id], id)
+            publish_participants(id, [user_id])
         return render_template("event_client.html", event=event, user=user, tasting_notes=tasting_notes)
     else:
         return jsonify({"error": "User ID cookie not found"}), 404
 
 
+@app.route("/api/events/<int:event_id>/stream", methods=["GET"])
+def event_stream(event_id):
+    """
+    Server-Sent Events feed of new reviews, participants, bottles and photos for
+    an event. Resumes after Last-Event-ID (or ?last_event_id=) when given.
+    """
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    latest = feed.latest()
+    try:
+        # A cursor ahead of the feed was issued before a restart; start from now
+        last_sequence = min(int(last_event_id), latest) if last_event_id else latest
+    except ValueError:
+        last_sequence = latest  # Malformed cursor: resume from the current position
+
+    def stream(last_sequence):
+        yield "retry: 5000\n\n"
+        while True:
+            entries = feed.wait(event_id, last_sequence, timeout=EVENT_STREAM_HEARTBEAT)
+            if not entries:
+                yield ": keep-alive\n\n"
+                continue
+            for sequence, kind, data in entries:
+                last_sequence = sequence
+                yield format_sse(sequence, kind, data)
+
+    return Response(
+        stream_with_context(stream(last_sequence)),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def publish_participants(event_id, user_ids):
+    """Push the given event participants to the event's live feed."""
+    user_ids = {str(user_id).strip() for user_id in user_ids}
+    for participant in get_event_participants(event_id):
+        if str(participant["id"]) in user_ids:
+            feed.publish(event_id, "participant", participant)
+
+def publish_bottles(event_id, bottle_ids):
+    """Push the given event bottles to the event's live feed."""
+    bottles = load_bottle_catalog(
+        "SELECT * FROM bottles WHERE id IN (SELECT value FROM json_each(?))",
+        (json.dumps([int(bottle_id) for bottle_id in bottle_ids if str(bottle_id).strip()]),),
+        include_reviews=False,
+    )
+    for bottle in bottles:
+        feed.publish(event_id, "bottle", {
+            key: bottle[key] for key in ("id", "brand", "name", "abv", "description", "image_path")
+        })
+
 @app.route('/bartender', methods=["GET"])
 def admin_page():
     try:
@@ -205,103 +405,135 @@ def admin_page():
         return f"An error occurred: {str(e)}", 500
 
 @app.route("/expert_notes", methods=["GET"])
+@conditional(BOTTLE_PAGE_TABLES)
 def expert_notes():
     tasting_notes = get_tasting_notes()
-    bottles = get_all_bottles()
+    # The page only lists bottles, so skip loading their reviews
+    bottles = load_bottle_catalog("SELECT * FROM bottles", include_reviews=False)
 
     return render_template("expert_notes.html", bottles=bottles, tasting_notes=tasting_notes)
 
+def refresh_bottle_description(bottle, bypass_cache=False):
+    """Generate and store a description for one bottle; True if it was updated."""
+    query = f"{bottle['brand']} {bottle['name']} {bottle['spirit_type']}"
+    description = generate_description(query, bypass_cache=bypass_cache)
+    if description:
+        update_bottle_description(bottle["id"], description)
+        return True
+    return False
+
+def store_expert_notes(bottle, result):
+    """Save the notes from a generated expert-notes result; True if any were stored."""
+    note_ids = []
+    for note in result.get("notes", []):
+        note_id = get_tasting_note_id(note)
+        if note_id is not None:
+            note_ids.append(note_id)
+    print("updating ", result.get("bottle"), "with AI result ",  result, "and tasting note ids ", note_ids )
+
+    if note_ids:
+        update_expert_notes(bottle["id"], note_ids)
+        return True
+    return False
+
+def refresh_bottle_notes_batch(bottles, bypass_cache=False):
+    """
+    Generate expert notes for a group of bottles with one batched classification
+    call, returning a dictionary of bottle ID to True/False or the bottle's error.
+    """
+    queries = [f"{b['brand']} {b['name']} {b['spirit_type']}" for b in bottles]
+    results = generate_expert_notes_batch(queries, bypass_cache=bypass_cache)
+
+    outcomes = {}
+    for bottle, result in zip(bottles, results):
+        if result.get("error"):
+            outcomes[bottle["id"]] = RuntimeError(result["error"])
+        else:
+            outcomes[bottle["id"]] = store_expert_notes(bottle, result)
+    return outcomes
+
 @app.route("/api/refresh", methods=["POST"])
 def refresh_data():
+    """
+    Queue a background refresh of descriptions or expert notes for the bottles
+    missing them. Returns a job ID to poll at /api/refresh/<job_id>.
+    Pass bypass_cache=1 to ignore stored LLM answers.
+    """
     data_type = request.args.get("id")  # "descriptions" or "notes"
-    limit = int(request.args.get("limit", 0) or 0)
+    try:
+        limit = int(request.args.get("limit", 0) or 0)
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    bypass_cache = request.args.get("bypass_cache") == "1"
+
+    if data_type not in ("descriptions", "notes"):
+        return jsonify({"error": "Unknown refresh type received (descriptions or notes)"}), 400
 
-    bottles = get_all_bottles()
-    updated = []
-    skipped = []
-    errors = []
+    bottles = load_bottle_catalog("SELECT * FROM bottles", include_reviews=False)
+    if data_type == "descriptions":
+        targets = [b for b in bottles if not (b.get("description") or "").strip()]
+    else:
+        targets = [b for b in bottles if not b.get("expert_tasting_notes")]
+    if limit:
+        targets = targets[:limit]
 
     if data_type == "descriptions":
-        targets = [
-            b for b in bottles
-            if not (b.get("description") or "").strip()
-        ]
-        if limit:
-            targets = targets[:limit]
-
-        for bottle in targets:
-            try:
-                query = f"{bottle['brand']} {bottle['name']} {bottle['spirit_type']}"
-                description = generate_description(query)
-                if description:
-                    update_bottle_description(bottle["id"], description)
-                    updated.append(bottle["id"])
-                else:
-                    skipped.append(bottle["id"])
-            except Exception as exc:
-                errors.append({"id": bottle["id"], "error": str(exc)})
-
-        return jsonify({"updated": updated, "skipped": skipped, "errors": errors}), 200
-
-    if data_type == "notes":
-        targets = [
-            b for b in bottles
-            if not b.get("expert_tasting_notes")
-        ]
-        if limit:
-            targets = targets[:limit]
-
-        for bottle in targets:
-            try:
-                query = f"{bottle['brand']} {bottle['name']} {bottle['spirit_type']}"
-                result = generate_expert_notes(query)
-
-                note_ids = []
-                for note in result.get("notes", []):
-                    note_id = get_tasting_note_id(note)
-                    if note_id is not None:
-                        note_ids.append(note_id)
-                print("updating ", query, "with AI result ",  result, "and tasting note ids ", note_id )
-
-                if note_ids:
-                    update_expert_notes(bottle["id"], note_ids)
-                    updated.append(bottle["id"])
-                else:
-                    skipped.append(bottle["id"])
-            except Exception as exc:
-                errors.append({"id": bottle["id"], "error": str(exc)})
-
-        return jsonify({"updated": updated, "skipped": skipped, "errors": errors}), 200
-
-    return jsonify({"error": "Unknown refresh type received (descriptions or notes)"}), 400
+        task = partial(refresh_bottle_description, bypass_cache=bypass_cache)
+        job = refresh_runner.submit(data_type, targets, task)
+    else:
+        # Notes are classified several bottles per LLM request
+        task = partial(refresh_bottle_notes_batch, bypass_cache=bypass_cache)
+        job = refresh_runner.submit_batches(data_type, targets, task, NOTES_BATCH_SIZE)
+    return jsonify({"job_id": job.id, "total": job.total, "workers": refresh_runner.max_workers}), 202
 
+@app.route("/api/refresh/<job_id>", methods=["GET"])
+def refresh_status(job_id):
+    """Report progress and per-bottle results of a refresh job."""
+    job = refresh_runner.get(job_id)
+    if not job:
+        return jsonify({"error": f"No refresh job with ID {job_id}"}), 404
+    return jsonify(job.to_dict()), 200
 
 
+
+def request_data():
+    """Return the submitted fields, whether they came as a multipart form or a JSON body."""
+    if request.mimetype == "multipart/form-data":
+        return request.form
+    return request.get_json(silent=True) or {}
+
+def has_photo(data):
+    photo_file = request.files.get("photo")
+    return bool((photo_file and photo_file.filename) or data.get("photo"))
+
+def save_photo(data, image_filepath):
+    """
+    Save the request's photo to image_filepath and create its resized variants.
+    Multipart uploads are streamed to disk; a base64 "photo" field in a JSON body
+    is still accepted.
+    """
+    photo_file = request.files.get("photo")
+    if photo_file and photo_file.filename:
+        save_upload(photo_file.stream, image_filepath)
+    else:
+        save_base64_upload(data["photo"], image_filepath)
+    print(f"Image saved to: {image_filepath}")
+    create_variants_for_path(image_filepath)
+
 # API Queries
 
 @app.route('/api/add_bottle',  methods=["POST"])
 def api_add_bottle():
     UPLOAD_FOLDER = "./database_images/bottles"
-    data = request.json  # Parse JSON data from the request body
-    print(data)
+    data = request_data()
 
     try:
-        # Extract Base64 image data
-        base64_image = data.get("photo")  # Expect Base64-encoded string in "image_path"
         image_filename = None
-       
 
-        if base64_image:
+        if has_photo(data):
             # Generate a unique filename for the image
             image_filename = f"{data['brand'].replace(' ', '_')}_{data['name'].replace(' ', '_')}.png"
-            image_filepath = os.path.join(UPLOAD_FOLDER, image_filename)
-
-            # Decode and save the image
-            with open(image_filepath, "wb") as image_file:
-                base64_image_data = base64_image.split(",")[1]  # Remove "data:image/png;base64,"
-                image_file.write(base64.b64decode(base64_image_data))
-
-            print(f"Image saved to: {image_filepath}")
+            save_photo(data, os.path.join(UPLOAD_FOLDER, image_filename))
 
         abv_data = data['abv'] if data['abv'].endswith("%") else data['abv'] + "%"
 
@@ -322,8 +554,10 @@ def api_add_bottle():
 
         return jsonify({"message": "Bottle added successfully", "id": new_id}), 201
 
+    except UploadTooLarge as e:
+        return jsonify({"error": str(e)}), 413
     except KeyError as e:
-        return jsonify({"error": f"Missing required field: {str(e)}"}), 400
+        return jsonify({"error": f"Missing required field: {e.args[0]!r}"}), 400
     except Exception as e:
         return jsonify({"error": f"An error occurred: {str(e)}"}), 500
 
@@ -332,36 +566,20 @@ def get_images():
     brand = request.args.get("brand", "")
     name = request.args.get("name", "")
     query = f"{brand} {name} whiskey bottle"
+    bypass_cache = request.args.get("refresh") == "1"
 
-    image_data_list = []
+    # Previews are downloaded in parallel, cached per query and served from here
+    previews = find_candidates(query, bypass_cache=bypass_cache)
+    images = [f"/image_candidates/{preview}" for preview in previews]
+    return jsonify({"query": query, "images": images})
 
-    try:
-        with DDGS() as ddgs:
-            results = ddgs.images(query, safesearch='Moderate', size='Medium')
-            for r in results:
-                image_url = r.get("image")
-                try:
-                    # Download image
-                    resp = requests.get(image_url, timeout=5)
-                    if resp.status_code == 200 and resp.content:
-                        # Encode as base64
-                        encoded = base64.b64encode(resp.content).decode("utf-8")
-                        # Guess MIME type from URL extension
-                        mime_type = "image/jpeg"
-                        if image_url.lower().endswith(".png"):
-                            mime_type = "image/png"
-                        elif image_url.lower().endswith(".gif"):
-                            mime_type = "image/gif"
-                        
-                        image_data_list.append(f"data:{mime_type};base64,{encoded}")
-
-                    if len(image_data_list) >= 6:
-                        break
-                except Exception as img_err:
-                    print(f"Error fetching image {image_url}: {img_err}")
-    except Exception as e:
-        print(f"Error fetching images: {e}")
-    return jsonify({"query": query, "images": image_data_list})
+@app.route("/image_candidates/<name>")
+def serve_image_candidate(name):
+    candidate = candidate_path(name)
+    if not candidate:
+        return jsonify({"error": "Image not found or expired"}), 404
+    path, mime_type = candidate
+    return send_file(path, mimetype=mime_type, max_age=CANDIDATE_MAX_AGE)
 
 @app.route('/api/remove_entry', methods=["POST"])
 def api_remove_entry():
@@ -408,25 +626,15 @@ def api_make_unavailable():
 @app.route('/api/add_user',  methods=["POST"])
 def api_add_user():
     UPLOAD_FOLDER = "./database_images/users"
-    data = request.json  # Parse JSON data from the request body
-    print(data)
+    data = request_data()
 
     try:
-        # Extract Base64 image data
-        base64_image = data.get("photo")  # Expect Base64-encoded string in "image_path"
         image_filename = None
 
-        if base64_image:
+        if has_photo(data):
             # Generate a unique filename for the image
             image_filename = f"{data['name'].replace(' ', '_')}.png"
-            image_filepath = os.path.join(UPLOAD_FOLDER, image_filename)
-
-            # Decode and save the image
-            with open(image_filepath, "wb") as image_file:
-                base64_image_data = base64_image.split(",")[1]  # Remove "data:image/png;base64,"
-                image_file.write(base64.b64decode(base64_image_data))
-
-            print(f"Image saved to: {image_filepath}")
+            save_photo(data, os.path.join(UPLOAD_FOLDER, image_filename))
 
         # Add botusertle to the database
         new_id = add_user(
@@ -436,8 +644,10 @@ def api_add_user():
 
         return jsonify({"message": "User added successfully", "id": new_id}), 201
 
+    except UploadTooLarge as e:
+        return jsonify({"error": str(e)}), 413
     except KeyError as e:
-        return jsonify({"error": f"Missing required field: {str(e)}"}), 400
+        return jsonify({"error": f"Missing required field: {e.args[0]!r}"}), 400
     except Exception as e:
         return jsonify({"error": f"An error occurred: {str(e)}"}), 500
 
@@ -524,6 +734,8 @@ def api_add_review():
             return jsonify({"error": "Failed to add review"}), 500
 
         if review_id:
+            if event_id:
+                feed.publish(event_id, "review", get_review_summary(review_id))
             return jsonify({"message": "Review added successfully", "review_id": review_id}), 201
         else:
             return jsonify({"error": "Failed to add review"}), 500
@@ -568,6 +780,7 @@ def api_add_bottles_to_event():
 
     try:
         add_bottle_to_event(bottle_ids, event_id)
+        publish_bottles(event_id, bottle_ids)
         return redirect(request.referrer)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -581,6 +794,7 @@ def api_add_users_to_event():
 
     try:
         add_user_to_event(user_ids, event_id)
+        publish_participants(event_id, user_ids)
         return redirect(request.referrer)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -598,25 +812,46 @@ def api_user_exists():
     response.set_cookie("user_id", str(user_id), max_age=36000, httponly=True)  # Cookie expires in 1 hour
     return response
 
+def store_event_photo(event, upload_path, size):
+    """
+    Record an uploaded photo in the event's manifest, which moves it to its
+    final name, then create its variants and tell the live console.
+    """
+    width, height, extension = image_info(upload_path)
+    if extension is None:
+        os.remove(upload_path)
+        raise ValueError("Uploaded file is not an image")
+    photo = add_event_photo(event["id"], event["folder_path"], upload_path, extension, size, width, height)
+    create_variants_for_path(photo["path"])
+    feed.publish(event["id"], "photo", {"id": photo["id"], "path": photo["path"]})
+    return photo
+
+def event_upload_path(event):
+    """Return a unique temporary path in the event folder for an incoming photo."""
+    os.makedirs(event["folder_path"], exist_ok=True)
+    return os.path.join(event["folder_path"], f".upload_{uuid.uuid4().hex}")
+
 @app.route('/api/upload_event_photo_file', methods=['POST'])
 def upload_photo():
     event_id = request.form.get("event_id")
     image_file = request.files.get("image_file")
-    event = get_event_by_id(event_id)
 
     if not image_file or not event_id:
         return jsonify({"error": "Invalid data"}), 400
+    event = get_event_by_id(event_id)
+    if not event:
+        return jsonify({"error": "Event not found"}), 404
 
     try:
-
-        # Create event-specific directory
-        os.makedirs(event["folder_path"], exist_ok=True)
-
-        # Save the file
-        file_path = os.path.join(event["folder_path"], f"photo_{len(os.listdir(event['folder_path'])) + 1}.png")
-        image_file.save(file_path)
+        upload_path = event_upload_path(event)
+        size = save_upload(image_file.stream, upload_path)
+        store_event_photo(event, upload_path, size)
 
         return redirect(request.referrer)
+    except UploadTooLarge as e:
+        return jsonify({"error": str(e)}), 413
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         print(f"Error uploading photo: {e}")
         return jsonify({"error": "Failed to upload photo"}), 500
@@ -624,29 +859,41 @@ def upload_photo():
 @app.route('/api/upload_event_photo_b64', methods=['POST'])
 def upload_event_photo():
     event_id = request.form.get("event_id")
-    event = get_event_by_id(event_id)
     image_data = request.form.get("image_data")
     if not event_id or not image_data:
         return jsonify({"error": "Event ID and image data are required"}), 400
+    event = get_event_by_id(event_id)
+    if not event:
+        return jsonify({"error": "Event not found"}), 404
 
     try:
-        # Decode the image
-        header, encoded = image_data.split(",", 1)
-        image = base64.b64decode(encoded)
-
-        # Create event-specific directory
-        os.makedirs(event["folder_path"], exist_ok=True)
-
-        # Save the image
-        file_path = os.path.join(event["folder_path"], f"photo_{len(os.listdir(event['folder_path'])) + 1}.png")
-        with open(file_path, "wb") as f:
-            f.write(image)
-
-        return jsonify({"message": "Photo uploaded successfully", "file_path": file_path}), 200
+        upload_path = event_upload_path(event)
+        size = save_base64_upload(image_data, upload_path)
+        photo = store_event_photo(event, upload_path, size)
+
+        return jsonify({"message": "Photo uploaded successfully", "file_path": photo["path"]}), 200
+    except UploadTooLarge as e:
+        return jsonify({"error": str(e)}), 413
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         print(f"Error uploading photo: {e}")
         return jsonify({"error": "Failed to upload photo"}), 500
-    
+
+@app.route('/api/events/<int:event_id>/photos')
+@conditional(("event_photos",))
+def api_event_photos(event_id):
+    """Page through an event's photos, newest first. Pass next_cursor back as before_id."""
+    try:
+        limit = max(1, min(int(request.args.get('limit', EVENT_PHOTOS_PAGE_SIZE)), API_BOTTLES_MAX_LIMIT))
+        before_id = request.args.get('before_id')
+        before_id = int(before_id) if before_id is not None else None
+    except ValueError:
+        return jsonify({"error": "limit and before_id must be integers"}), 400
+
+    photos, next_cursor = get_event_photos(event_id, before_id=before_id, limit=limit)
+    return jsonify({"photos": photos, "next_cursor": next_cursor})
+
 @app.route('/api/edit_expert_notes', methods=['POST'])
 def edit_expert_notes():
     """
@@ -721,7 +968,36 @@ def check_user():
 
 @app.route('/database_images/<path:filename>')
 def serve_uploaded_image(filename):
-    return send_from_directory('database_images', filename)
+    """
+    Serve an uploaded image. With ?size=thumb|card|large the matching resized
+    variant is served instead, as WebP when the browser accepts it and JPEG otherwise.
+
+    URLs from image_url() carry ?v=, which changes whenever the photo is
+    replaced, so those are cached for a year as immutable. Without it, browsers
+    revalidate (a cheap 304), since photos are replaced under the same name.
+    """
+    size = request.args.get("size")
+    versioned = bool(request.args.get("v"))
+    response = None
+    if size:
+        if size not in IMAGE_SIZES:
+            abort(404)
+        # The variant path is built from filename, so it must not leave IMAGE_ROOT
+        original = resolve_original(filename)
+        if original is None:
+            abort(404)
+        accept_webp = "image/webp" in request.headers.get("Accept", "")
+        variant = choose_variant(original, size, accept_webp)
+        if variant:
+            response = send_from_directory(IMAGE_ROOT, variant,
+                                           max_age=IMAGE_IMMUTABLE_MAX_AGE if versioned else None)
+            response.vary.add("Accept")
+    if response is None:
+        response = send_from_directory(IMAGE_ROOT, filename,
+                                       max_age=IMAGE_IMMUTABLE_MAX_AGE if versioned else None)
+    if versioned:
+        response.cache_control.immutable = True
+    return response
 
 if __name__ == '__main__':
     app.run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,218 @@
+"""
+Time the hot db_queries functions and routes against a synthetic database.
+
+    python benchmarks.py --generate --scale 1
+    python benchmarks.py --compare benchmark_results/<older commit>.json
+
+The database (database/benchmark.db by default) is built by synthetic_data.py,
+and routes go through the Flask test client, so the numbers cover templates and
+JSON encoding but not the network. Results are written as JSON, named after the
+current commit, so two commits can be compared with --compare.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import time
+from datetime import datetime
+
+import db_queries
+import metrics
+import synthetic_data
+
+
+BENCHMARK_DB = "./database/benchmark.db"
+RESULTS_DIR = "./benchmark_results"
+DEFAULT_REPEAT = 5
+# Changes smaller than this are treated as noise by --compare
+NOISE_THRESHOLD = 0.10
+
+
+def git_commit():
+    """Return the checked out commit, with a -dirty suffix for uncommitted changes, or None."""
+    repo = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=repo,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=repo,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return f"{commit}-dirty" if dirty else commit
+
+
+def sql_statement_total():
+    return sum(value for _, _, value in metrics.sql_statements.samples())
+
+
+def busiest_event_id():
+    """Return the event with the most drinks and participants, the worst case for its console."""
+    with db_queries.create_connection() as conn:
+        row = conn.execute("""
+            SELECT event_id FROM (
+                SELECT event_id FROM event_drinks
+                UNION ALL
+                SELECT event_id FROM event_participants
+            )
+            GROUP BY event_id ORDER BY COUNT(*) DESC, event_id LIMIT 1
+        """).fetchone()
+    return row[0] if row else None
+
+
+def row_counts():
+    with db_queries.create_connection() as conn:
+        return {
+            table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in ("bottles", "users", "reviews", "community_notes", "expert_notes",
+                          "events", "event_drinks", "event_participants")
+        }
+
+
+def build_suite(client, event_id):
+    """
+    Return the benchmarks as (name, run, setup) tuples. run() does the work being
+    timed; setup(), if given, runs untimed before every repetition.
+    """
+    from fragment_cache import fragments
+
+    def get(url):
+        def run():
+            response = client.get(url)
+            if response.status_code != 200:
+                raise RuntimeError(f"{url} returned {response.status_code}")
+            return response
+        return run
+
+    return [
+        ("get_all_bottles", db_queries.get_all_bottles, None),
+        # A generator; the queries only run as it is consumed
+        ("get_all_users_with_reviews", lambda: list(db_queries.get_all_users_with_reviews()), None),
+        ("get_event_by_id", lambda: db_queries.get_event_by_id(event_id), None),
+        ("get_all_events", db_queries.get_all_events, None),
+        # Rendered pages are cached until the data changes; time the render itself
+        ("GET /inventory", get("/inventory"), fragments.clear),
+        ("GET /inventory (cached)", get("/inventory"), None),
+        ("GET /api/bottles", get("/api/bottles"), None),
+        ("GET /event?version=console", get(f"/event?id={event_id}&version=console"), None),
+    ]
+
+
+def run_benchmark(run, setup=None, repeat=DEFAULT_REPEAT):
+    """
+    Call run() once to warm caches, then time it repeat times.
+
+    Returns:
+        dict: Wall times in milliseconds and the SQL statements of the last run.
+    """
+    run()
+    timings = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        statements_before = sql_statement_total()
+        started = time.perf_counter()
+        run()
+        timings.append((time.perf_counter() - started) * 1000)
+        statements = sql_statement_total() - statements_before
+    timings.sort()
+    return {
+        "runs": repeat,
+        "min_ms": round(timings[0], 2),
+        "median_ms": round(statistics.median(timings), 2),
+        "mean_ms": round(statistics.fmean(timings), 2),
+        "max_ms": round(timings[-1], 2),
+        "sql_statements": statements,
+    }
+
+
+def run_suite(repeat=DEFAULT_REPEAT, only=None):
+    """
+    Run every benchmark against db_queries.DB_PATH and return the results document.
+
+    Parameters:
+        repeat (int): Timed repetitions of each benchmark.
+        only (list): Names to run, or None for all of them.
+    """
+    with open(os.devnull, "w") as devnull:
+        # Importing the app migrates whatever database DB_PATH points at
+        with contextlib.redirect_stdout(devnull):
+            from app import app
+        event_id = busiest_event_id()
+        client = app.test_client()
+
+        results = {}
+        for name, run, setup in build_suite(client, event_id):
+            if only and name not in only:
+                continue
+            # Some routes still print what they load; keep it off the terminal
+            with contextlib.redirect_stdout(devnull):
+                results[name] = run_benchmark(run, setup, repeat)
+            print(f"{name:<32} median {results[name]['median_ms']:>9.2f} ms"
+                  f"  min {results[name]['min_ms']:>9.2f} ms  {results[name]['sql_statements']:>6} statements")
+
+    return {
+        "commit": git_commit(),
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "database": db_queries.DB_PATH,
+        "event_id": event_id,
+        "rows": row_counts(),
+        "results": results,
+    }
+
+
+def compare(previous, current):
+    """Print each benchmark's median against an earlier results document."""
+    print(f"\nCompared with {previous.get('commit')} ({previous.get('created')}):")
+    if previous.get("rows") != current.get("rows"):
+        print("  Warning: the databases differ in size, so the timings are not like for like.")
+    for name, result in current["results"].items():
+        before = previous.get("results", {}).get(name)
+        if not before:
+            print(f"  {name:<32} new")
+            continue
+        change = result["median_ms"] / before["median_ms"] - 1 if before["median_ms"] else 0.0
+        verdict = ""
+        if change > NOISE_THRESHOLD:
+            verdict = "  SLOWER"
+        elif change < -NOISE_THRESHOLD:
+            verdict = "  faster"
+        print(f"  {name:<32} {before['median_ms']:>9.2f} -> {result['median_ms']:>9.2f} ms"
+              f"  ({change:+.0%}){verdict}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark hot queries and routes on synthetic data.")
+    parser.add_argument("--db", default=BENCHMARK_DB, help=f"Database to benchmark (default {BENCHMARK_DB})")
+    parser.add_argument("--generate", action="store_true",
+                        help="(Re)build the database with synthetic_data.py first; implied if it does not exist")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT,
+                        help=f"Timed runs per benchmark (default {DEFAULT_REPEAT})")
+    parser.add_argument("--only", action="append", help="Run only this benchmark; may be repeated")
+    parser.add_argument("--output", help=f"Results file (default {RESULTS_DIR}/<commit>.json)")
+    parser.add_argument("--compare", help="Earlier results file to compare the medians with")
+    synthetic_data.add_arguments(parser)
+    args = parser.parse_args()
+
+    if args.generate or not os.path.exists(args.db):
+        synthetic_data.generate_from_args(args.db, args)
+    # Must be set before the app is imported, since the import migrates it
+    db_queries.DB_PATH = args.db
+
+    document = run_suite(args.repeat, args.only)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{document['commit'] or 'unknown'}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as file:
+        json.dump(document, file, indent=2)
+    print(f"Results saved to {output}")
+
+    if args.compare:
+        with open(args.compare, "r") as file:
+            compare(json.load(file), document)
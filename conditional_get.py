@@ -0,0 +1,84 @@
+import hashlib
+import json
+import os
+from functools import wraps
+
+from flask import current_app, make_response, request
+
+from db_queries import get_data_versions
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def compute_build_tag():
+    """
+    Identify the running code and templates, so a deploy changes every ETag even
+    when the data hasn't. APP_BUILD (e.g. a git SHA) wins; otherwise it is the
+    newest modification time of the app's Python files and templates, which every
+    worker started from the same checkout agrees on.
+    """
+    if os.environ.get("APP_BUILD"):
+        return os.environ["APP_BUILD"]
+    newest = 0
+    for name in os.listdir(BASE_DIR):
+        if name.endswith(".py"):
+            newest = max(newest, os.path.getmtime(os.path.join(BASE_DIR, name)))
+    for directory, _, files in os.walk(os.path.join(BASE_DIR, "templates")):
+        for name in files:
+            newest = max(newest, os.path.getmtime(os.path.join(directory, name)))
+    return str(int(newest))
+
+
+BUILD_TAG = compute_build_tag()
+
+
+def resource_etag(tables, *parts):
+    """
+    Return the ETag of the current request's resource: a hash of the build, the
+    path and query arguments, the change versions of the tables the response is
+    built from and any extra parts it depends on.
+    """
+    payload = json.dumps(
+        [BUILD_TAG, request.path, sorted(request.args.items(multi=True)), get_data_versions(tables), parts],
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+def conditional(tables, key=None, private=False):
+    """
+    Make a GET view revalidatable. The response gets a strong ETag derived from
+    the versions of the tables it reads, and a request whose If-None-Match still
+    matches is answered 304 before the view runs, so no query or template
+    rendering happens.
+
+    Parameters:
+        tables (tuple): Versioned tables the response is built from.
+        key (callable): Returns anything else the response depends on, such as
+            a cookie; it becomes part of the ETag.
+        private (bool): The response differs per user; browsers may keep it but
+            shared caches may not.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return view(*args, **kwargs)
+
+            etag = resource_etag(tables, key() if key else None)
+            if request.if_none_match.contains(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag)
+            # Always revalidate; a 304 costs one small query instead of a render
+            response.headers["Cache-Control"] = "private, no-cache" if private else "no-cache"
+            if private:
+                response.vary.add("Cookie")
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,257 @@
+import os
+import sqlite3
+
+
+# Tables whose writes bump their row in data_versions (migration 5). Caches of
+# rendered pages key on these counters. Like the migrations themselves, only append.
+VERSIONED_TABLES = (
+    "bottles", "users", "reviews", "community_notes", "expert_notes", "tasting_notes",
+    "events", "event_drinks", "event_participants", "event_photos",
+)
+
+
+def change_counter_statements(tables):
+    """Statements creating data_versions and the triggers that bump it on every write to tables."""
+    statements = [
+        '''
+        CREATE TABLE IF NOT EXISTS data_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        )
+        ''',
+    ]
+    for table in tables:
+        # Start from a random value so a recreated database never repeats the
+        # versions an earlier one handed out while a server was caching pages.
+        statements.append(
+            f"INSERT OR IGNORE INTO data_versions (name, version) VALUES ('{table}', abs(random() % 1000000000))"
+        )
+        for action in ("INSERT", "UPDATE", "DELETE"):
+            statements.append(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_version_{action.lower()} AFTER {action} ON {table} BEGIN
+                UPDATE data_versions SET version = version + 1 WHERE name = '{table}';
+            END
+            ''')
+    return statements
+
+
+def index_event_folders(conn):
+    """
+    Record the photos already sitting in event folders in event_photos, for
+    events whose uploads predate the manifest. Files already recorded are
+    skipped, so it is safe to run again.
+
+    Returns:
+        int: The number of photos added.
+    """
+    # Imported here so the schema can be migrated without Pillow's import cost
+    from image_pipeline import IMAGE_EXTENSIONS, image_info
+
+    added = 0
+    for event_id, folder_path in conn.execute("SELECT id, folder_path FROM events").fetchall():
+        try:
+            files = sorted(os.listdir(folder_path))
+        except (FileNotFoundError, NotADirectoryError, TypeError):
+            continue
+        for file in files:
+            if not file.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            path = os.path.join(folder_path, file)
+            width, height, _ = image_info(path)
+            cursor = conn.execute("""
+                INSERT OR IGNORE INTO event_photos (event_id, filename, size, width, height)
+                VALUES (?, ?, ?, ?, ?)
+            """, (event_id, file, os.path.getsize(path), width, height))
+            added += cursor.rowcount
+    return added
+
+
+# Ordered schema changes applied on top of setup_database().
+# Each entry is (version, description, statements); versions must only ever be
+# appended, never edited, since production databases record what they have run.
+# A statement is SQL, or a function called with the connection for data changes
+# SQL alone can't make.
+MIGRATIONS = [
+    (1, "Add indexes for hot lookups", [
+        "CREATE INDEX IF NOT EXISTS idx_reviews_bottle_id ON reviews (bottle_id)",
+        "CREATE INDEX IF NOT EXISTS idx_reviews_user_id ON reviews (user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_reviews_event_id ON reviews (event_id)",
+        "CREATE INDEX IF NOT EXISTS idx_community_notes_review_id ON community_notes (review_id)",
+        "CREATE INDEX IF NOT EXISTS idx_expert_notes_bottle_id ON expert_notes (bottle_id)",
+        "CREATE INDEX IF NOT EXISTS idx_event_drinks_event_id ON event_drinks (event_id)",
+        "CREATE INDEX IF NOT EXISTS idx_event_participants_event_id ON event_participants (event_id)",
+        "CREATE INDEX IF NOT EXISTS idx_tasting_notes_name ON tasting_notes (name)",
+        "CREATE INDEX IF NOT EXISTS idx_bottles_brand_name ON bottles (brand, name)",
+    ]),
+    (2, "Add bottle aggregate tables", [
+        '''
+        CREATE TABLE IF NOT EXISTS bottle_stats (
+            bottle_id INTEGER PRIMARY KEY,
+            review_count INTEGER NOT NULL DEFAULT 0,
+            score_sum INTEGER NOT NULL DEFAULT 0,
+            last_reviewed DATE,
+            FOREIGN KEY (bottle_id) REFERENCES bottles(id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS bottle_note_stats (
+            bottle_id INTEGER NOT NULL,
+            tasting_note_id INTEGER NOT NULL,
+            note_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (bottle_id, tasting_note_id),
+            FOREIGN KEY (bottle_id) REFERENCES bottles(id),
+            FOREIGN KEY (tasting_note_id) REFERENCES tasting_notes(id)
+        )
+        ''',
+        '''
+        INSERT INTO bottle_stats (bottle_id, review_count, score_sum, last_reviewed)
+        SELECT r.bottle_id, COUNT(*), COALESCE(SUM(r.score), 0), MAX(r.review_date)
+        FROM reviews r
+        JOIN bottles b ON r.bottle_id = b.id
+        GROUP BY r.bottle_id
+        ''',
+        '''
+        INSERT INTO bottle_note_stats (bottle_id, tasting_note_id, note_count)
+        SELECT r.bottle_id, cn.tasting_note_id, COUNT(*)
+        FROM community_notes cn
+        JOIN reviews r ON cn.review_id = r.id
+        JOIN bottles b ON r.bottle_id = b.id
+        JOIN tasting_notes tn ON cn.tasting_note_id = tn.id
+        GROUP BY r.bottle_id, cn.tasting_note_id
+        ''',
+    ]),
+    (3, "Add event photo manifest", [
+        '''
+        CREATE TABLE IF NOT EXISTS event_photos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            event_id INTEGER NOT NULL,
+            filename TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            width INTEGER,
+            height INTEGER,
+            uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE (event_id, filename),
+            FOREIGN KEY (event_id) REFERENCES events(id)
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_event_photos_event_id ON event_photos (event_id, id)",
+    ]),
+    (4, "Add full-text search over bottles and reviews", [
+        # External-content indexes: the text stays in bottles/reviews, the
+        # triggers below keep the index in step, and rowid is the source row's id.
+        '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS bottle_search USING fts5(
+            brand, name, description,
+            content='bottles', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+        ''',
+        '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS review_search USING fts5(
+            review_text,
+            content='reviews', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS bottles_search_insert AFTER INSERT ON bottles BEGIN
+            INSERT INTO bottle_search (rowid, brand, name, description)
+            VALUES (new.id, new.brand, new.name, new.description);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS bottles_search_delete AFTER DELETE ON bottles BEGIN
+            INSERT INTO bottle_search (bottle_search, rowid, brand, name, description)
+            VALUES ('delete', old.id, old.brand, old.name, old.description);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS bottles_search_update AFTER UPDATE OF brand, name, description ON bottles BEGIN
+            INSERT INTO bottle_search (bottle_search, rowid, brand, name, description)
+            VALUES ('delete', old.id, old.brand, old.name, old.description);
+            INSERT INTO bottle_search (rowid, brand, name, description)
+            VALUES (new.id, new.brand, new.name, new.description);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS reviews_search_insert AFTER INSERT ON reviews BEGIN
+            INSERT INTO review_search (rowid, review_text) VALUES (new.id, new.review_text);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS reviews_search_delete AFTER DELETE ON reviews BEGIN
+            INSERT INTO review_search (review_search, rowid, review_text)
+            VALUES ('delete', old.id, old.review_text);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS reviews_search_update AFTER UPDATE OF review_text ON reviews BEGIN
+            INSERT INTO review_search (review_search, rowid, review_text)
+            VALUES ('delete', old.id, old.review_text);
+            INSERT INTO review_search (rowid, review_text) VALUES (new.id, new.review_text);
+        END
+        ''',
+        "INSERT INTO bottle_search (bottle_search) VALUES ('rebuild')",
+        "INSERT INTO review_search (review_search) VALUES ('rebuild')",
+    ]),
+    (5, "Add per-table change counters", change_counter_statements(VERSIONED_TABLES)),
+    # Migration 3 created event_photos empty; without this, galleries of events
+    # from before the upgrade stay empty until someone indexes them by hand
+    (6, "Backfill event photos from event folders", [index_event_folders]),
+]
+
+
+def get_schema_version(conn):
+    """Return the highest migration version applied to the database, or 0."""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        description TEXT NOT NULL,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    conn.commit()
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+def apply_migrations(conn=None):
+    """
+    Apply every migration newer than the database's schema_version, each in its
+    own transaction, and return the list of versions applied.
+    """
+    owns_connection = conn is None
+    if owns_connection:
+        conn = sqlite3.connect('./database/bar_companion.db')
+
+    try:
+        current = get_schema_version(conn)
+        applied = []
+        for version, description, statements in MIGRATIONS:
+            if version <= current:
+                continue
+            with conn:
+                # Explicit BEGIN so DDL is part of the transaction too. IMMEDIATE
+                # takes the write lock up front, so a second process migrating at
+                # the same time waits here and then sees the version as applied.
+                conn.execute("BEGIN IMMEDIATE")
+                already_applied = conn.execute(
+                    "SELECT 1 FROM schema_version WHERE version = ?", (version,)
+                ).fetchone()
+                if already_applied:
+                    continue
+                for statement in statements:
+                    if callable(statement):
+                        statement(conn)
+                    else:
+                        conn.execute(statement)
+                conn.execute(
+                    "INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                    (version, description)
+                )
+            print(f"Applied migration {version}: {description}")
+            applied.append(version)
+        return applied
+    finally:
+        if owns_connection:
+            conn.close()
@@ -1,8 +1,11 @@
 import sqlite3
 
-def setup_database():
-    # Connect to the SQLite database (or create it if it doesn't exist)
-    conn = sqlite3.connect('./database/bar_companion.db')
+def setup_database(conn=None):
+    # Connect to the SQLite database (or create it if it doesn't exist).
+    # A connection passed in by the caller is committed but left open.
+    owns_connection = conn is None
+    if owns_connection:
+        conn = sqlite3.connect('./database/bar_companion.db')
 
     # Create a cursor object
     cursor = conn.cursor()
@@ -230,6 +233,7 @@ def setup_database():
 
     # Commit changes and close the connection
     conn.commit()
-    conn.close()
+    if owns_connection:
+        conn.close()
 
     print("Database and tables created successfully!")
@@ -0,0 +1,143 @@
+import sqlite3
+import threading
+
+from metrics import InstrumentedConnection
+
+
+# Pragmas applied once to every new connection.
+# cache_size is negative so SQLite reads it as KiB rather than pages.
+CONNECTION_PRAGMAS = (
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),
+    ("cache_size", -16000),
+    ("mmap_size", 64 * 1024 * 1024),
+    ("foreign_keys", "ON"),
+)
+
+
+class PooledConnection(InstrumentedConnection):
+    """
+    A pooled connection whose `with conn:` blocks nest. Helpers open their own
+    block on the thread's shared connection even when their caller already has
+    one open, so only the outermost block commits or rolls back. An inner block
+    runs in a savepoint: if it raises, just its own writes are undone and the
+    caller decides what to do with the rest. Each inner block starts with the
+    default row_factory and gives back the one it found.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.depth = 0
+        self._outer_row_factories = []
+
+    def __enter__(self):
+        if self.depth:
+            self._outer_row_factories.append(self.row_factory)
+            self.row_factory = None
+            if not self.in_transaction:
+                # Otherwise releasing the savepoint would commit on its own
+                self.execute("BEGIN")
+            self.execute(f"SAVEPOINT nested_{self.depth}")
+        self.depth += 1
+        return super().__enter__()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.depth -= 1
+        if self.depth:
+            self.row_factory = self._outer_row_factories.pop()
+            if exc_type is not None:
+                self.execute(f"ROLLBACK TO nested_{self.depth}")
+            self.execute(f"RELEASE nested_{self.depth}")
+            return False  # The outermost block decides whether to commit
+        return super().__exit__(exc_type, exc_value, traceback)
+
+
+class ConnectionPool:
+    """
+    Keeps one tuned SQLite connection per thread and database path.
+
+    Connections are opened lazily, have the pragmas in CONNECTION_PRAGMAS applied
+    once, and are handed out again on every later acquire from the same thread.
+    They are created with factory, which by default lets `with` blocks nest
+    (see PooledConnection) and counts and times every statement for the
+    request metrics.
+    invalidate() makes every thread reopen its connection on the next acquire,
+    which is needed after the database file has been deleted or replaced.
+    """
+
+    def __init__(self, pragmas=CONNECTION_PRAGMAS, factory=PooledConnection):
+        self.pragmas = pragmas
+        self.factory = factory
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.opened = 0
+
+    def _open(self, db_path):
+        conn = sqlite3.connect(db_path, factory=self.factory)
+        for name, value in self.pragmas:
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def acquire(self, db_path):
+        """Return this thread's connection to db_path, opening it if needed."""
+        connections = getattr(self._local, "connections", None)
+        if connections is None:
+            connections = self._local.connections = {}
+
+        entry = connections.get(db_path)
+        if entry is not None:
+            generation, conn = entry
+            if generation == self._generation and _is_open(conn):
+                with self._lock:
+                    self.hits += 1
+                if not getattr(conn, "depth", 0):
+                    # Callers set their own row factory. Inside an open `with`
+                    # block it belongs to that block; nested blocks reset it
+                    conn.row_factory = None
+                return conn
+            conn.close()
+
+        conn = self._open(db_path)
+        connections[db_path] = (self._generation, conn)
+        with self._lock:
+            self.misses += 1
+            self.opened += 1
+        return conn
+
+    def close(self):
+        """Close the calling thread's connections."""
+        connections = getattr(self._local, "connections", {})
+        for _, conn in connections.values():
+            conn.close()
+        connections.clear()
+
+    def invalidate(self):
+        """Close this thread's connections and force every other thread to reopen."""
+        with self._lock:
+            self._generation += 1
+        self.close()
+
+    def stats(self):
+        """Return the pool's hit/miss counters as a dictionary."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "opened": self.opened,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+def _is_open(conn):
+    try:
+        conn.total_changes
+        return True
+    except sqlite3.ProgrammingError:
+        return False
+
+
+pool = ConnectionPool()
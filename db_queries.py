@@ -3,68 +3,173 @@ import csv
 import os
 try:
     from database.setup_db import setup_database
+    from database.migrations import apply_migrations, get_schema_version, index_event_folders, VERSIONED_TABLES
 except:
     from setup_db import setup_database
+    from migrations import apply_migrations, get_schema_version, index_event_folders, VERSIONED_TABLES
 import sys
 from flask import jsonify
 import random
 import os
 import pandas as pd
+import json
+import html
+import re
+import threading
+from collections import defaultdict
 from datetime import datetime
+from db_connection import pool
 
 
 DB_PATH = "./database/bar_companion.db"
 
 def create_connection():
-    """Create and return a connection to the SQLite database."""
-    return sqlite3.connect(DB_PATH)
+    """
+    Return this thread's pooled connection to the SQLite database.
+
+    The connection is shared by every call on the thread, so callers must not
+    close it; use `with create_connection() as conn:` to commit or roll back.
+    """
+    return pool.acquire(DB_PATH)
+
+def get_connection_stats():
+    """Return the connection pool's hit/miss counters."""
+    return pool.stats()
+
+def get_data_versions(tables):
+    """
+    Return the change counters of the given tables, in the same order.
+
+    Every insert, update or delete on a versioned table bumps its counter
+    (see VERSIONED_TABLES in database/migrations.py), whichever process wrote it,
+    so anything derived from those tables can be cached against the result.
+    Tables without a counter give None.
+    """
+    with create_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT name, version FROM data_versions WHERE name IN (SELECT value FROM json_each(?))",
+            (json.dumps(list(tables)),),
+        )
+        versions = dict(cursor.fetchall())
+    return tuple(versions.get(table) for table in tables)
 
 
 # bottle functions
-def get_all_bottles():
+
+def load_bottle_catalog(query, params=(), include_reviews=True):
     """
-    Return all bottles in the database as a list of dictionaries,
-    including reviews with reviewer name, score, and notes.
+    Load the bottles selected by query together with their reviews, community
+    note counts and expert notes, using a fixed number of set-based queries.
+
+    Parameters:
+    - query (str): A SELECT over the bottles table returning full bottle rows.
+    - params (tuple): Parameters for query.
+    - include_reviews (bool): Skip the review and community note queries when False.
+
+    Returns:
+    - list of dict: Bottles in query order, each with "reviews", "tasting_notes"
+      and "expert_tasting_notes" entries plus the "review_count", "average_score"
+      and "last_reviewed" aggregates from bottle_stats.
     """
     with create_connection() as conn:
         conn.row_factory = sqlite3.Row  # Enable dictionary-like row access
         cursor = conn.cursor()
+        cursor.execute(query, params)
+        bottle_list = [dict(bottle) for bottle in cursor.fetchall()]
 
-        # Fetch all bottles
-        cursor.execute("SELECT * FROM bottles")
-        bottles = cursor.fetchall()
-
-        bottle_list = []  # List to store bottles with reviews
+        # The bottle ids are passed as a single JSON array so the IN clause
+        # works for any number of bottles without hitting the variable limit.
+        bottle_ids = json.dumps([bottle["id"] for bottle in bottle_list])
 
-        for bottle in bottles:
-            bottle_dict = dict(bottle)  # Convert the bottle row to a dictionary
-            
-            # Fetch reviews for this bottle
+        reviews_by_bottle = defaultdict(list)
+        notes_by_review = defaultdict(list)
+        if include_reviews:
             cursor.execute("""
-                SELECT reviews.id, reviews.score, reviews.review_text, reviews.review_date, users.name AS reviewer_name
+                SELECT reviews.id, reviews.bottle_id, reviews.score, reviews.review_text,
+                       reviews.review_date, users.name AS reviewer_name
                 FROM reviews
                 JOIN users ON reviews.user_id = users.id
-                WHERE reviews.bottle_id = ?
-            """, (bottle["id"],))
+                WHERE reviews.bottle_id IN (SELECT value FROM json_each(?))
+            """, (bottle_ids,))
             reviews = cursor.fetchall()
 
-            bottle_dict["tasting_notes"] = get_tasting_notes_by_bottle_id(bottle["id"])
-            bottle_dict["expert_tasting_notes"] = get_expert_tasting_notes_for_bottle(bottle["id"])
+            cursor.execute("""
+                SELECT cn.review_id, tn.name
+                FROM community_notes cn
+                JOIN reviews r ON cn.review_id = r.id
+                JOIN tasting_notes tn ON cn.tasting_note_id = tn.id
+                WHERE r.bottle_id IN (SELECT value FROM json_each(?))
+            """, (bottle_ids,))
+            for row in cursor.fetchall():
+                notes_by_review[row["review_id"]].append(row["name"])
+
+            for review in reviews:
+                reviews_by_bottle[review["bottle_id"]].append(review)
+
+        expert_by_bottle = defaultdict(list)
+        cursor.execute("""
+            SELECT en.bottle_id, tn.name
+            FROM expert_notes en
+            JOIN tasting_notes tn ON en.tasting_note_id = tn.id
+            WHERE en.bottle_id IN (SELECT value FROM json_each(?))
+        """, (bottle_ids,))
+        for row in cursor.fetchall():
+            expert_by_bottle[row["bottle_id"]].append(row["name"])
+
+        stats_by_bottle = {}
+        cursor.execute("""
+            SELECT bottle_id, review_count, score_sum, last_reviewed
+            FROM bottle_stats
+            WHERE bottle_id IN (SELECT value FROM json_each(?))
+        """, (bottle_ids,))
+        for row in cursor.fetchall():
+            stats_by_bottle[row["bottle_id"]] = row
+
+        # Same shape as get_tasting_notes_by_bottle_id: (name, count), most common first
+        note_counts_by_bottle = defaultdict(list)
+        cursor.execute("""
+            SELECT bns.bottle_id, tn.name, SUM(bns.note_count) AS note_count
+            FROM bottle_note_stats bns
+            JOIN tasting_notes tn ON bns.tasting_note_id = tn.id
+            WHERE bns.bottle_id IN (SELECT value FROM json_each(?))
+            GROUP BY bns.bottle_id, tn.name
+            ORDER BY note_count DESC
+        """, (bottle_ids,))
+        for row in cursor.fetchall():
+            note_counts_by_bottle[row["bottle_id"]].append((row["name"], row["note_count"]))
+
+    for bottle_dict in bottle_list:
+        reviews = reviews_by_bottle[bottle_dict["id"]]
+        stats = stats_by_bottle.get(bottle_dict["id"])
+
+        bottle_dict["review_count"] = stats["review_count"] if stats else 0
+        bottle_dict["average_score"] = (
+            round(stats["score_sum"] / stats["review_count"], 1)
+            if stats and stats["review_count"] else None
+        )
+        bottle_dict["last_reviewed"] = stats["last_reviewed"] if stats else None
+        bottle_dict["tasting_notes"] = note_counts_by_bottle[bottle_dict["id"]]
+        bottle_dict["expert_tasting_notes"] = expert_by_bottle[bottle_dict["id"]]
+        bottle_dict["reviews"] = [
+            {
+                "reviewer_name": review["reviewer_name"],
+                "score": review["score"],
+                "review_text": review["review_text"],
+                "review_date": review["review_date"],
+                "tasting_notes": notes_by_review[review["id"]]
+            }
+            for review in reviews
+        ]
 
-            # Add reviews to the bottle dictionary
-            bottle_dict["reviews"] = [
-                {
-                    "reviewer_name": review["reviewer_name"],
-                    "score": review["score"],
-                    "review_text": review["review_text"],
-                    "review_date": review["review_date"],
-                    "tasting_notes": get_tasting_notes_by_review(review["id"])
-                }
-                for review in reviews
-            ]
-            bottle_list.append(bottle_dict)
+    return bottle_list
 
-        return bottle_list
+def get_all_bottles():
+    """
+    Return all bottles in the database as a list of dictionaries,
+    including reviews with reviewer name, score, and notes.
+    """
+    return load_bottle_catalog("SELECT * FROM bottles")
 
 def get_random_available_bottle_id():
     with create_connection() as conn:
@@ -83,45 +188,167 @@ def get_random_available_bottle_id():
         return random_bottle
 
 def get_bottles_from_query(query, params):
+    """
+    Return the bottles selected by query with their reviews and notes,
+    in the same shape as get_all_bottles.
+    """
+    return load_bottle_catalog(query, params)
+    
+def get_bottle_page(after_id=None, limit=30, offset=0):
+    """
+    Return one page of bottles for the catalog API, ordered by ID.
+
+    Parameters:
+    - after_id (int): Keyset cursor; only bottles with a greater ID are returned.
+    - limit (int): Maximum number of bottles in the page.
+    - offset (int): Rows to skip when no cursor is given.
+
+    Returns:
+    - tuple: (list of bottle dictionaries, next cursor or None on the last page)
+    """
     with create_connection() as conn:
-        conn.row_factory = sqlite3.Row  # Enable dictionary-like row access
+        conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
-        cursor.execute(query, params)
-        bottles = cursor.fetchall()
 
-        bottle_list = []  # List to store bottles with reviews
+        # One extra row tells us whether another page follows
+        if after_id is not None:
+            cursor.execute("""
+                SELECT id, brand, name, abv, image_path, available
+                FROM bottles
+                WHERE id > ?
+                ORDER BY id
+                LIMIT ?
+            """, (after_id, limit + 1))
+        else:
+            cursor.execute("""
+                SELECT id, brand, name, abv, image_path, available
+                FROM bottles
+                ORDER BY id
+                LIMIT ? OFFSET ?
+            """, (limit + 1, offset))
+        rows = [dict(row) for row in cursor.fetchall()]
 
-        for bottle in bottles:
-            bottle_dict = dict(bottle)  # Convert the bottle row to a dictionary
-            bottle_dict["expert_tasting_notes"] = get_expert_tasting_notes_for_bottle(bottle["id"])
-            bottle_dict["tasting_notes"] = get_tasting_notes_by_bottle_id(bottle["id"])
+    bottles = rows[:limit]
+    next_cursor = bottles[-1]["id"] if len(rows) > limit else None
+    return bottles, next_cursor
 
+# Full-text indexes (see migration 4) and the shadow tables FTS5 keeps for them.
+# They are derived from bottles and reviews, so backups and admin views skip them.
+SEARCH_TABLES = ("bottle_search", "review_search")
 
-            
-            # Fetch reviews for this bottle
-            cursor.execute("""
-                SELECT reviews.id, reviews.score, reviews.review_text, reviews.review_date, users.name AS reviewer_name
-                FROM reviews
-                JOIN users ON reviews.user_id = users.id
-                WHERE reviews.bottle_id = ?
-            """, (bottle["id"],))
-            reviews = cursor.fetchall()
+# Review matches count for less than matches in the bottle's own text
+REVIEW_MATCH_WEIGHT = 0.5
+
+# Private-use markers for highlighted terms, swapped for <mark> after escaping
+SNIPPET_START, SNIPPET_END = "\ue000", "\ue001"
+
+def is_search_table(name):
+    return any(name == table or name.startswith(table + "_") for table in SEARCH_TABLES)
+
+def build_match_query(text):
+    """
+    Turn free text into an FTS5 query that requires every word, matching each as
+    a prefix so results appear while the user is still typing. Returns None if
+    the text has no searchable words.
+    """
+    words = re.findall(r"\w+", text.lower())
+    if not words:
+        return None
+    return " ".join(f'"{word}"*' for word in words)
+
+def format_snippet(snippet):
+    """HTML-escape an FTS5 snippet and wrap its highlighted terms in <mark>."""
+    escaped = html.escape(snippet or "")
+    return escaped.replace(SNIPPET_START, "<mark>").replace(SNIPPET_END, "</mark>")
+
+def search_bottles(text, limit=20):
+    """
+    Full-text search over bottle brand, name and description and review text.
+
+    Each bottle appears once, ranked by its best match (bm25; brand and name
+    weigh most, review text least), with a snippet of the text that matched.
+
+    Parameters:
+    - text (str): The user's search text.
+    - limit (int): Maximum number of bottles to return.
+
+    Returns:
+    - list: Bottle dictionaries with "snippet" (HTML, terms in <mark>) and
+      "matched_in" ("bottle" or "review").
+    """
+    match = build_match_query(text)
+    if match is None:
+        return []
+
+    with create_connection() as conn:
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+
+        # Rank first; snippets are only worth building for the page we return
+        cursor.execute("""
+            WITH matches AS (
+                SELECT rowid AS bottle_id,
+                       NULL AS review_id,
+                       bm25(bottle_search, 10.0, 10.0, 1.0) AS rank
+                FROM bottle_search
+                WHERE bottle_search MATCH ?
+                UNION ALL
+                SELECT reviews.bottle_id,
+                       review_search.rowid AS review_id,
+                       bm25(review_search) * ? AS rank
+                FROM review_search
+                JOIN reviews ON reviews.id = review_search.rowid
+                WHERE review_search MATCH ?
+            ),
+            best AS (
+                -- bm25 is negative and lower is better; SQLite takes review_id
+                -- from the row that holds the MIN
+                SELECT bottle_id, review_id, MIN(rank) AS rank
+                FROM matches
+                GROUP BY bottle_id
+            )
+            SELECT bottles.id, bottles.brand, bottles.name, bottles.abv, bottles.spirit_type,
+                   bottles.subtype, bottles.image_path, bottles.available,
+                   best.review_id, best.rank
+            FROM best
+            JOIN bottles ON bottles.id = best.bottle_id
+            ORDER BY best.rank
+            LIMIT ?
+        """, (match, REVIEW_MATCH_WEIGHT, match, limit))
+        results = [dict(row) for row in cursor.fetchall()]
+
+        bottle_ids = [result["id"] for result in results if result["review_id"] is None]
+        review_ids = [result["review_id"] for result in results if result["review_id"] is not None]
+        cursor.execute("""
+            SELECT rowid, snippet(bottle_search, -1, ?, ?, '…', 12)
+            FROM bottle_search
+            WHERE bottle_search MATCH ? AND rowid IN (SELECT value FROM json_each(?))
+        """, (SNIPPET_START, SNIPPET_END, match, json.dumps(bottle_ids)))
+        bottle_snippets = dict(cursor.fetchall())
+        cursor.execute("""
+            SELECT rowid, snippet(review_search, 0, ?, ?, '…', 12)
+            FROM review_search
+            WHERE review_search MATCH ? AND rowid IN (SELECT value FROM json_each(?))
+        """, (SNIPPET_START, SNIPPET_END, match, json.dumps(review_ids)))
+        review_snippets = dict(cursor.fetchall())
+
+    for result in results:
+        review_id = result.pop("review_id")
+        if review_id is None:
+            result["matched_in"] = "bottle"
+            result["snippet"] = format_snippet(bottle_snippets.get(result["id"]))
+        else:
+            result["matched_in"] = "review"
+            result["snippet"] = format_snippet(review_snippets.get(review_id))
+    return results
+
+def rebuild_search_index():
+    """Rebuild the full-text indexes from the bottles and reviews tables."""
+    with create_connection() as conn:
+        conn.execute("INSERT INTO bottle_search (bottle_search) VALUES ('rebuild')")
+        conn.execute("INSERT INTO review_search (review_search) VALUES ('rebuild')")
+    print("Search index rebuilt.")
 
-            # Add reviews to the bottle dictionary
-            bottle_dict["reviews"] = [
-                {
-                    "reviewer_name": review["reviewer_name"],
-                    "score": review["score"],
-                    "review_text": review["review_text"],
-                    "review_date": review["review_date"],
-                    "tasting_notes": get_tasting_notes_by_review(review["id"])
-                }
-                for review in reviews
-            ]
-            bottle_list.append(bottle_dict)
-
-        return bottle_list
-    
 def get_bottle_name_by_id(bottle_id):
     """
     Retrieve the name of a bottle based on its ID.
@@ -140,6 +367,38 @@ def get_bottle_name_by_id(bottle_id):
             return result[0]  # Return the bottle name
         return None  # Return None if no bottle found
 
+def get_bottle_summaries(bottle_ids):
+    """
+    Return the fields shown on a bottle tile for the given IDs, in the order
+    given. IDs with no bottle are left out.
+    """
+    with create_connection() as conn:
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT b.id, b.brand, b.name, b.spirit_type, b.subtype, b.image_path, b.available
+            FROM json_each(?) j
+            JOIN bottles b ON b.id = j.value
+            ORDER BY j.key
+        """, (json.dumps([int(bottle_id) for bottle_id in bottle_ids]),))
+        return [dict(row) for row in cursor.fetchall()]
+
+def get_available_bottle_ids(bottle_ids=None):
+    """
+    Return the IDs of the bottles currently available, optionally only those
+    among bottle_ids.
+    """
+    ids = None if bottle_ids is None else json.dumps([int(bottle_id) for bottle_id in bottle_ids])
+    with create_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT id FROM bottles
+            WHERE available = 1
+              AND (? IS NULL OR id IN (SELECT value FROM json_each(?)))
+            ORDER BY id
+        """, (ids, ids))
+        return [row[0] for row in cursor.fetchall()]
+
 def add_bottle(brand, name, abv, spirit_type, subtype=None, description=None, image_path=None):
     """Add a new bottle to the database."""
     with create_connection() as conn:
@@ -148,16 +407,11 @@ def add_bottle(brand, name, abv, spirit_type, subtype=None, description=None, im
             INSERT INTO bottles (brand, name, abv, spirit_type, subtype, description, image_path)
             VALUES (?, ?, ?, ?, ?, ?, ?)
         ''', (brand, name, abv, spirit_type.capitalize(), subtype, description, image_path))
-        conn.commit()
     return cursor.lastrowid
 
 def remove_bottle(bottle_id):
     """Remove a bottle from the database by its ID."""
-    with create_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM bottles WHERE id = ?", (bottle_id,))
-        conn.commit()
-    return cursor.rowcount
+    return remove_record("bottles", bottle_id)
 
 def update_bottle(bottle_id, **kwargs):
     """
@@ -171,7 +425,6 @@ def update_bottle(bottle_id, **kwargs):
         updates = ", ".join([f"{key} = ?" for key in kwargs.keys()])
         values = list(kwargs.values()) + [bottle_id]
         cursor.execute(f"UPDATE bottles SET {updates} WHERE id = ?", values)
-        conn.commit()
     return cursor.rowcount
 
 #User functions
@@ -183,43 +436,38 @@ def get_all_users_with_reviews():
     with create_connection() as conn:
         conn.row_factory = sqlite3.Row  # Enable dictionary-like row access
         cursor = conn.cursor()
-        
+
         # Fetch all users
         cursor.execute("SELECT * FROM users")
-        users = cursor.fetchall()
-        
-        # Fetch reviews for each user and add them as an entry in the user's dictionary
-        for user in users:
-            user_id = user["id"]
-            cursor.execute("""
-                SELECT reviews.*, 
-                       bottles.name AS bottle_name, 
-                       bottles.brand AS bottle_brand, 
-                       bottles.image_path AS bottle_image_path
-                FROM reviews
-                JOIN bottles ON reviews.bottle_id = bottles.id
-                WHERE reviews.user_id = ?
-            """, (user_id,))
-            reviews = cursor.fetchall()
-            user_dict = dict(user)  # Convert the user row to a dictionary
-            user_dict["reviews"] = [
-                {
-                    **dict(review), 
-                    "bottle_name": review["bottle_name"],
-                    "bottle_brand": review["bottle_brand"],
-                    "bottle_image_path": review["bottle_image_path"],
-                    "tasting_notes": get_tasting_notes_by_review(review["id"])
-                } for review in reviews
-            ]  # Add reviews with bottle names, brands, and image paths
-            yield user_dict  # Yield each user with reviews as a dictionary
+        users = [dict(user) for user in cursor.fetchall()]
+
+        # Fetch every review once and group them by user, rather than querying per user
+        cursor.execute("""
+            SELECT reviews.*,
+                   bottles.name AS bottle_name,
+                   bottles.brand AS bottle_brand,
+                   bottles.image_path AS bottle_image_path
+            FROM reviews
+            JOIN bottles ON reviews.bottle_id = bottles.id
+            ORDER BY reviews.user_id, reviews.id
+        """)
+        reviews_by_user = defaultdict(list)
+        for review in cursor.fetchall():
+            reviews_by_user[review["user_id"]].append(dict(review))
+
+        notes_by_review = load_review_notes(cursor)
+
+    for user in users:
+        user["reviews"] = reviews_by_user[user["id"]]
+        for review in user["reviews"]:
+            review["tasting_notes"] = notes_by_review[review["id"]]
+    # Yield only once the block is closed, so a half-consumed generator never
+    # leaves the thread's shared connection inside an open transaction
+    yield from users
 
 def remove_user(user_id):
     """Remove a user from the database by their ID."""
-    with create_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM users WHERE id = ?", (user_id,))
-        conn.commit()
-    return cursor.rowcount
+    return remove_record("users", user_id)
 
 
 def add_user(name, image_path):
@@ -233,21 +481,20 @@ def add_user(name, image_path):
     Returns:
     - user_id (int): The ID of the newly created user.
     """
-    with create_connection() as conn:
-        cursor = conn.cursor()
-        name = name.capitalize()
-        try:
+    name = name.capitalize()
+    try:
+        with create_connection() as conn:
+            cursor = conn.cursor()
             # Insert the user into the database
             cursor.execute(
                 "INSERT INTO users (name, image_path) VALUES (?, ?)",
                 (name.capitalize(), image_path)
             )
-            conn.commit()
-            # Return the ID of the newly inserted user
-            return cursor.lastrowid
-        except sqlite3.Error as e:
-            print(f"An error occurred while inserting the user: {e}")
-            return None
+        # Return the ID of the newly inserted user
+        return cursor.lastrowid
+    except sqlite3.Error as e:
+        print(f"An error occurred while inserting the user: {e}")
+        return None
 
 def get_user_id_by_name(name):
     """
@@ -266,9 +513,52 @@ def get_user_id_by_name(name):
         if result:
             return result[0]  # Return the user ID
         return None  # Return None if no user found
+
+def get_user_name_by_id(user_id):
+    """
+    Retrieve the name of a user based on their ID.
+
+    Parameters:
+    - user_id (int): The ID of the user.
+
+    Returns:
+    - str: The name of the user if found, None otherwise.
+    """
+    with create_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT name FROM users WHERE id = ?", (user_id,))
+        result = cursor.fetchone()
+        return result[0] if result else None
     
 #Review Functions
 
+REVIEW_SCORE_TABLES = ("reviews",)  # What get_review_scores reads, for caches keyed on get_data_versions
+
+def get_review_scores(after_id=0):
+    """
+    Return (review_id, user_id, bottle_id, score) for every review with an ID
+    greater than after_id, oldest first.
+    """
+    with create_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT id, user_id, bottle_id, score
+            FROM reviews
+            WHERE id > ? AND score IS NOT NULL
+            ORDER BY id
+        """, (after_id,))
+        return cursor.fetchall()
+
+def count_review_scores(up_to_id):
+    """
+    Return how many scored reviews have an ID of up_to_id or less, so a cache
+    built from get_review_scores can tell whether any of its rows were deleted.
+    """
+    with create_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM reviews WHERE id <= ? AND score IS NOT NULL", (up_to_id,))
+        return cursor.fetchone()[0]
+
 def add_review(user_id, bottle_id, notes, score, event_id=None):
     """
     Insert a new review into the database.
@@ -287,28 +577,66 @@ def add_review(user_id, bottle_id, notes, score, event_id=None):
         print("Invalid score provided. Scores must be within 0 - 10 (inclusive).")
         return None
 
-    with create_connection() as conn:
-        cursor = conn.cursor()
-        try:
+    try:
+        # The block rolls back (just its own writes, if nested) when a statement fails
+        with create_connection() as conn:
+            cursor = conn.cursor()
             # Insert the review into the database
             cursor.execute(
                 "INSERT INTO reviews (user_id, bottle_id, review_text, score, event_id) VALUES (?, ?, ?, ?, ?)",
                 (user_id, bottle_id, notes, score, event_id)
             )
-            conn.commit()
-            # Return the ID of the newly inserted review
-            return cursor.lastrowid
-        except sqlite3.Error as e:
-            print(f"An error occurred while inserting the review: {e}")
-            return None
+            review_id = cursor.lastrowid
+
+            # Fold the review into the bottle's aggregates in the same transaction
+            cursor.execute("""
+                INSERT INTO bottle_stats (bottle_id, review_count, score_sum, last_reviewed)
+                SELECT bottle_id, 1, score, review_date FROM reviews WHERE id = ?
+                ON CONFLICT (bottle_id) DO UPDATE SET
+                    review_count = review_count + 1,
+                    score_sum = score_sum + excluded.score_sum,
+                    last_reviewed = MAX(COALESCE(last_reviewed, ''), excluded.last_reviewed)
+            """, (review_id,))
+        # Return the ID of the newly inserted review
+        return review_id
+    except sqlite3.Error as e:
+        print(f"An error occurred while inserting the review: {e}")
+        return None
         
-def remove_review(review_id):
-    """Remove a review from the database by its ID."""
+def get_review_summary(review_id):
+    """
+    Return a review with its reviewer and bottle details, or None if it doesn't exist.
+
+    Parameters:
+    - review_id (int): The ID of the review.
+
+    Returns:
+    - dict: The review row plus reviewer_name, bottle_brand, bottle_name,
+      bottle_image_path and the review's tasting note names.
+    """
     with create_connection() as conn:
+        conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
-        cursor.execute("DELETE FROM reviews WHERE id = ?", (review_id,))
-        conn.commit()
-    return cursor.rowcount
+        cursor.execute("""
+            SELECT reviews.*,
+                   users.name AS reviewer_name,
+                   bottles.brand AS bottle_brand,
+                   bottles.name AS bottle_name,
+                   bottles.image_path AS bottle_image_path
+            FROM reviews
+            JOIN users ON reviews.user_id = users.id
+            JOIN bottles ON reviews.bottle_id = bottles.id
+            WHERE reviews.id = ?
+        """, (review_id,))
+        review = cursor.fetchone()
+
+    if not review:
+        return None
+    return {**dict(review), "tasting_notes": get_tasting_notes_by_review(review_id)}
+
+def remove_review(review_id):
+    """Remove a review from the database by its ID."""
+    return remove_record("reviews", review_id)
 
 
 def get_all_tables_contents():
@@ -321,7 +649,7 @@ def get_all_tables_contents():
 
         # Get the list of all tables in the database
         cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%';")
-        tables = [row["name"] for row in cursor.fetchall()]
+        tables = [row["name"] for row in cursor.fetchall() if not is_search_table(row["name"])]
 
         # Fetch data from each table
         for table in tables:
@@ -388,7 +716,6 @@ def add_event(code, event_date, folder_path, name):
             INSERT INTO events (code, event_date, folder_path, name)
             VALUES (?, ?, ?, ?)
         """, (code, event_date, folder_path, name))
-        conn.commit()
     return cursor.rowcount
 
 def get_event_by_id(event_id):
@@ -418,27 +745,6 @@ def get_event_by_id(event_id):
                 WHERE event_participants.event_id = ?
             """, (event_id,))
             participants = [dict(row) for row in cursor.fetchall()]
-            for participant in participants:
-                cursor.execute("""
-                    SELECT *
-                    FROM reviews
-                    WHERE user_id = ? AND event_id = ?
-                """, (participant["id"], event_id))
-
-                participant["reviews"] = [dict(row) for row in cursor.fetchall()]
-                for review in participant["reviews"]:
-                    review["tasting_notes"] = get_tasting_notes_by_review(review["id"])
-                #for review in participant["reviews"]:
-                #    print("review, ", review.keys())
-                #    print("bottle_id, ", type(review["bottle_id"]))
-                #    cursor.execute("""
-                #        SELECT *
-                #        FROM bottles
-                #        WHERE id = ?
-                #    """, (review["bottle_id"]))
-                #    review["bottle"] = cursor.fetchone()
-
-
 
             # Query to fetch bottles for the event
             cursor.execute("""
@@ -448,15 +754,33 @@ def get_event_by_id(event_id):
                 WHERE event_drinks.event_id = ?
             """, (event_id,))
             bottles = [dict(row) for row in cursor.fetchall()]
-            for bottle in bottles:
-                cursor.execute("""
-                    SELECT reviews.*, users.name AS reviewer_name
-                    FROM reviews
-                    JOIN users ON reviews.user_id = users.id
-                    WHERE bottle_id = ? AND event_id = ?
-                """, (bottle["id"], event_id))
 
-                bottle["reviews"] = [dict(row) for row in cursor.fetchall()]
+            # Every review of the event at once, grouped below by reviewer and by bottle
+            cursor.execute("""
+                SELECT reviews.*, users.name AS reviewer_name
+                FROM reviews
+                LEFT JOIN users ON reviews.user_id = users.id
+                WHERE reviews.event_id = ?
+                ORDER BY reviews.id
+            """, (event_id,))
+            reviews = cursor.fetchall()
+            notes_by_review = load_review_notes(cursor, [review["id"] for review in reviews])
+
+            reviews_by_user = defaultdict(list)
+            reviews_by_bottle = defaultdict(list)
+            for row in reviews:
+                review = dict(row)
+                reviewer_name = review.pop("reviewer_name")
+                reviews_by_user[review["user_id"]].append(
+                    dict(review, tasting_notes=notes_by_review[review["id"]])
+                )
+                if reviewer_name is not None:
+                    reviews_by_bottle[review["bottle_id"]].append(dict(review, reviewer_name=reviewer_name))
+
+            for participant in participants:
+                participant["reviews"] = reviews_by_user[participant["id"]]
+            for bottle in bottles:
+                bottle["reviews"] = reviews_by_bottle[bottle["id"]]
 
             # Return the event details along with participants and bottles
             return {
@@ -471,6 +795,83 @@ def get_event_by_id(event_id):
         print(f"Error retrieving event by ID: {e}")
         return None
     
+def get_event_bottle_ids(event_id):
+    """Return the IDs of the bottles being poured at an event."""
+    with create_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT bottle_id FROM event_drinks WHERE event_id = ?", (event_id,))
+        return [row[0] for row in cursor.fetchall()]
+
+def add_event_photo(event_id, folder_path, upload_path, extension, size, width=None, height=None):
+    """
+    Record an uploaded event photo and move it into the event folder under a
+    name taken from its row ID, so simultaneous uploads can never overwrite
+    each other.
+
+    :param upload_path: Where the upload was written; it is renamed into place.
+    :param extension: File extension for the stored photo, e.g. ".jpg".
+    :return: A dictionary describing the stored photo.
+    """
+    with create_connection() as conn:
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO event_photos (event_id, filename, size, width, height)
+            VALUES (?, ?, ?, ?, ?)
+        """, (event_id, os.path.basename(upload_path), size, width, height))
+        photo_id = cursor.lastrowid
+        filename = f"event_photo_{photo_id}{extension}"
+        cursor.execute("UPDATE event_photos SET filename = ? WHERE id = ?", (filename, photo_id))
+
+        # Still inside the transaction, so a failed move leaves no row behind
+        os.replace(upload_path, os.path.join(folder_path, filename))
+
+        cursor.execute("SELECT * FROM event_photos WHERE id = ?", (photo_id,))
+        photo = dict(cursor.fetchone())
+    photo["path"] = f"{folder_path}/{filename}"
+    return photo
+
+def get_event_photos(event_id, before_id=None, limit=24):
+    """
+    Return one page of an event's photos, newest first.
+
+    :param before_id: Keyset cursor; only photos with a smaller ID are returned.
+    :param limit: Maximum number of photos in the page.
+    :return: (list of photo dictionaries with a "path" for the page, next cursor or None)
+    """
+    with create_connection() as conn:
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT event_photos.*, events.folder_path
+            FROM event_photos
+            JOIN events ON event_photos.event_id = events.id
+            WHERE event_photos.event_id = ? AND event_photos.id < ?
+            ORDER BY event_photos.id DESC
+            LIMIT ?
+        """, (event_id, before_id if before_id is not None else sys.maxsize, limit + 1))
+        rows = [dict(row) for row in cursor.fetchall()]
+
+    photos = rows[:limit]
+    for photo in photos:
+        photo["path"] = f"{photo.pop('folder_path')}/{photo['filename']}"
+    next_cursor = photos[-1]["id"] if len(rows) > limit else None
+    return photos, next_cursor
+
+def index_event_photos():
+    """
+    Add photos already sitting in event folders to event_photos, for events
+    whose uploads predate the manifest. Files already recorded are skipped.
+    Migration 6 does this once on upgrade; run it again after copying photos
+    into event folders by hand.
+
+    :return: The number of photos added.
+    """
+    with create_connection() as conn:
+        added = index_event_folders(conn)
+    print(f"Indexed {added} event photos.")
+    return added
+
 def add_bottle_to_event(bottle_ids, event_id):
     with create_connection() as conn:
         cursor = conn.cursor()
@@ -479,7 +880,6 @@ def add_bottle_to_event(bottle_ids, event_id):
                 INSERT INTO event_drinks (event_id, bottle_id)
                 VALUES (?, ?)
             """, (event_id, bottle_id))
-        conn.commit()
     return jsonify({"message": "Bottles added successfully"}), 200
 
 def add_user_to_event(user_ids, event_id):
@@ -497,56 +897,114 @@ def add_user_to_event(user_ids, event_id):
                 INSERT INTO event_participants (event_id, user_id)
                 VALUES (?, ?)
             """, (event_id, user_id))
-        conn.commit()
     return jsonify({"message": "Users added successfully"}), 200
 
 # Tasting note functions
 
-def get_tasting_notes():
-    """Retrieve all tasting notes and structure them as a list of dictionaries for Jinja template."""
-    structured_notes = []
-
-    with sqlite3.connect('./database/bar_companion.db') as conn:
-        conn.row_factory = sqlite3.Row  # Enable dictionary-like access for rows
-        cursor = conn.cursor()
+class TastingNoteTaxonomy:
+    """
+    Precomputed view of the tasting_notes table.
 
-        # Fetch all tasting notes from the database based on their tier
-        cursor.execute("SELECT * FROM tasting_notes WHERE tier = 3")
-        generic_rows = cursor.fetchall()  # Tier 3 (Top-level notes)
+    Holds the three-tier tree used by the templates, a name -> ID lookup, the
+    flat list of note names and each note's parent ID. Built from a single query;
+    treat it as read-only, since the same instance is shared by every caller
+    until tasting_notes changes.
+    """
 
-        cursor.execute("SELECT * FROM tasting_notes WHERE tier = 2")
-        intermediate_rows = cursor.fetchall()  # Tier 2 (Subgroup notes)
+    def __init__(self, rows):
+        generic_rows = []  # Tier 3 (Top-level notes)
+        children = defaultdict(list)  # (tier, parent name) -> rows, in ID order
+        self.ids = {}
+        self.names = []
+        self.names_by_id = {}
+        for row in rows:
+            if int(row["tier"]) == 3:
+                generic_rows.append(row)
+            else:
+                children[(int(row["tier"]), row["parent"])].append(row)
+            self.ids.setdefault(row["name"], row["id"])  # First match wins, as before
+            self.names.append(row["name"])
+            self.names_by_id[row["id"]] = row["name"]
 
-        cursor.execute("SELECT * FROM tasting_notes WHERE tier = 1")
-        specific_rows = cursor.fetchall()  # Tier 1 (Subsubgroup notes)
+        # Tier 3 notes, and notes whose parent is missing, have no parent ID
+        self.parent_ids = {
+            row["id"]: self.ids.get(row["parent"]) if int(row["tier"]) != 3 else None
+            for row in rows
+        }
 
         # Build the hierarchical structure of notes
-        for generic_row in generic_rows:
-            note = {
+        self.tree = [
+            {
                 "name": generic_row["name"],
                 "parent": generic_row["parent"],
-                "subnotes": []
-            }
-
-            # Add subnotes (tier 2) under each top-level note (tier 3)
-            for intermediate_row in intermediate_rows:
-                if intermediate_row["parent"] == generic_row["name"]:
-                    subnote = {
+                "subnotes": [
+                    {
                         "name": intermediate_row["name"],
-                        "subsubnotes": []
+                        "subsubnotes": [
+                            specific_row["name"]
+                            for specific_row in children[(1, intermediate_row["name"])]
+                        ],
                     }
+                    for intermediate_row in children[(2, generic_row["name"])]
+                ],
+            }
+            for generic_row in generic_rows
+        ]
 
-                    # Add subsubnotes (tier 1) under each subnote (tier 2)
-                    for specific_row in specific_rows:
-                        if specific_row["parent"] == intermediate_row["name"]:
-                            subnote["subsubnotes"].append(specific_row["name"])
 
-                    note["subnotes"].append(subnote)
+# Caches key on the change counters of what they are built from (see
+# get_data_versions), so writes from the CLI or other processes are seen too
+TAXONOMY_TABLES = ("tasting_notes",)
+# Community note counts live in bottle_note_stats, which is kept in step with
+# community_notes and reviews; profiles roll notes up the taxonomy
+NOTE_PROFILE_TABLES = ("expert_notes", "community_notes", "reviews", "bottles", "tasting_notes")
 
-            # Append the note with its subnotes and subsubnotes to the structured list
-            structured_notes.append(note)
+_taxonomy_lock = threading.Lock()
+_taxonomy_cache = None  # (data versions the taxonomy was built at, TastingNoteTaxonomy)
 
-    return structured_notes
+def get_note_profiles():
+    """
+    Return the tasting notes recorded against every bottle.
+
+    Returns:
+    - list of tuples: (bottle_id, tasting_note_id, is_expert, count) rows. Expert
+      notes have a count of 1; community notes count the reviews that chose them.
+    """
+    with create_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT bottle_id, tasting_note_id, 1, 1
+            FROM expert_notes
+            UNION ALL
+            SELECT bottle_id, tasting_note_id, 0, note_count
+            FROM bottle_note_stats
+            WHERE note_count > 0
+        """)
+        return cursor.fetchall()
+
+def get_taxonomy():
+    """Return the cached TastingNoteTaxonomy, rebuilding it if tasting_notes has changed."""
+    global _taxonomy_cache
+    versions = get_data_versions(TAXONOMY_TABLES)
+    with _taxonomy_lock:
+        if _taxonomy_cache is not None and _taxonomy_cache[0] == versions:
+            return _taxonomy_cache[1]
+
+    with create_connection() as conn:
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, name, parent, tier FROM tasting_notes ORDER BY id")
+        taxonomy = TastingNoteTaxonomy(cursor.fetchall())
+
+    with _taxonomy_lock:
+        # Keyed on the versions read before the build, so a write made during
+        # it is picked up by the next call
+        _taxonomy_cache = (versions, taxonomy)
+    return taxonomy
+
+def get_tasting_notes():
+    """Retrieve all tasting notes and structure them as a list of dictionaries for Jinja template."""
+    return get_taxonomy().tree
 
 def get_tasting_note_id(note_name):
     """
@@ -559,19 +1017,7 @@ def get_tasting_note_id(note_name):
     - int: The ID of the tasting note, or None if the note is not found.
     """
     try:
-        # Establish database connection
-        with create_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Query to retrieve the ID of the tasting note by its name
-            cursor.execute("SELECT id FROM tasting_notes WHERE name = ?", (note_name,))
-            result = cursor.fetchone()
-            
-            # Return the ID if found, otherwise return None
-            if result:
-                return result[0]
-            else:
-                return None  # If no matching note is found
+        return get_taxonomy().ids.get(note_name)
     except sqlite3.Error as e:
         print(f"An error occurred while retrieving the tasting note ID: {e}")
         return None
@@ -597,12 +1043,17 @@ def add_note_record(review_id, tasting_note_id):
                 "INSERT INTO community_notes (review_id, tasting_note_id) VALUES (?, ?)",
                 (review_id, tasting_note_id)
             )
-            
-            # Commit the changes
-            conn.commit()
-            
-            # Return True if the insert was successful
-            return True
+
+            # Count the note against the reviewed bottle
+            cursor.execute("""
+                INSERT INTO bottle_note_stats (bottle_id, tasting_note_id, note_count)
+                SELECT bottle_id, ?, 1 FROM reviews WHERE id = ?
+                ON CONFLICT (bottle_id, tasting_note_id) DO UPDATE SET
+                    note_count = note_count + 1
+            """, (tasting_note_id, review_id))
+
+        # Return True if the insert was successful
+        return True
     except sqlite3.Error as e:
         print(f"An error occurred while adding the note record: {e}")
         return False
@@ -613,17 +1064,15 @@ def get_tasting_notes_by_bottle_id(bottle_id):
 
     Parameters:
     - bottle_id (int): The ID of the bottle.
-    - db_connection (sqlite3.Connection): The SQLite database connection.
 
     Returns:
     - list of tuples: Each tuple contains the tasting note name and its count.
     """
     query = """
-    SELECT tn.name, COUNT(*) AS note_count
-    FROM reviews r
-    JOIN community_notes nr ON r.id = nr.review_id
-    JOIN tasting_notes tn ON nr.tasting_note_id = tn.id
-    WHERE r.bottle_id = ?
+    SELECT tn.name, SUM(bns.note_count) AS note_count
+    FROM bottle_note_stats bns
+    JOIN tasting_notes tn ON bns.tasting_note_id = tn.id
+    WHERE bns.bottle_id = ?
     GROUP BY tn.name
     ORDER BY note_count DESC;
     """
@@ -636,6 +1085,30 @@ def get_tasting_notes_by_bottle_id(bottle_id):
     
     return result
 
+def load_review_notes(cursor, review_ids=None):
+    """
+    Look up the tasting notes of many reviews in one query.
+
+    Parameters:
+    - cursor (sqlite3.Cursor): Cursor on the caller's connection.
+    - review_ids (list): Reviews to look up, or None for every review.
+
+    Returns:
+    - defaultdict: Review ID -> list of tasting note names, as get_tasting_notes_by_review returns them.
+    """
+    ids = None if review_ids is None else json.dumps(list(review_ids))
+    cursor.execute("""
+        SELECT cn.review_id, tn.name
+        FROM community_notes cn
+        JOIN tasting_notes tn ON cn.tasting_note_id = tn.id
+        WHERE ? IS NULL OR cn.review_id IN (SELECT value FROM json_each(?))
+        ORDER BY cn.id
+    """, (ids, ids))
+    notes_by_review = defaultdict(list)
+    for review_id, name in cursor.fetchall():
+        notes_by_review[review_id].append(name)
+    return notes_by_review
+
 def get_tasting_notes_by_review(review_id):
     """
     Retrieves the tasting notes for a given review.
@@ -669,16 +1142,7 @@ def get_tasting_note_names():
     Returns:
     - list of strings: The names of the tasting notes
     """
-    query = """
-    SELECT name
-    FROM tasting_notes 
-    """
-    with create_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute(query)
-        result = cursor.fetchall()
-
-    return [row[0] for row in result]
+    return get_taxonomy().names
 
 def update_expert_notes(bottle_id, tasting_note_ids):
     """
@@ -693,9 +1157,6 @@ def update_expert_notes(bottle_id, tasting_note_ids):
         with create_connection() as conn:
             cursor = conn.cursor()
 
-            # Begin a transaction
-            conn.execute("BEGIN TRANSACTION;")
-
             # Delete all existing notes for the given bottle ID
             cursor.execute('''
                 DELETE FROM expert_notes
@@ -708,14 +1169,9 @@ def update_expert_notes(bottle_id, tasting_note_ids):
                 VALUES (?, ?)
             ''', [(bottle_id, note_id) for note_id in tasting_note_ids])
 
-
     except sqlite3.Error as e:
-        # Rollback in case of an error
-        conn.rollback()
+        # The connection context manager has already rolled back
         print(f"An error occurred: {e}")
-    finally:
-        # Close the connection
-        conn.close()
 
 def update_bottle_description(bottle_id, description):
     """
@@ -840,40 +1296,130 @@ def get_event_participants(event_id):
 
 #--------------------------------ADMIN FUNCTIONS--------------------------------------------------------------------------
 
+# Rows that reference a record and must go first now that connections enforce
+# foreign keys, in deletion order for each parent table.
+DEPENDENT_DELETES = {
+    "users": [
+        "DELETE FROM community_notes WHERE review_id IN (SELECT id FROM reviews WHERE user_id = ?)",
+        "DELETE FROM reviews WHERE user_id = ?",
+        "DELETE FROM event_participants WHERE user_id = ?",
+    ],
+    "bottles": [
+        "DELETE FROM bottle_stats WHERE bottle_id = ?",
+        "DELETE FROM bottle_note_stats WHERE bottle_id = ?",
+        "DELETE FROM community_notes WHERE review_id IN (SELECT id FROM reviews WHERE bottle_id = ?)",
+        "DELETE FROM reviews WHERE bottle_id = ?",
+        "DELETE FROM expert_notes WHERE bottle_id = ?",
+        "DELETE FROM event_drinks WHERE bottle_id = ?",
+    ],
+    "reviews": [
+        "DELETE FROM community_notes WHERE review_id = ?",
+    ],
+    "events": [
+        "UPDATE reviews SET event_id = NULL WHERE event_id = ?",
+        "DELETE FROM event_photos WHERE event_id = ?",
+        "DELETE FROM event_participants WHERE event_id = ?",
+        "DELETE FROM event_drinks WHERE event_id = ?",
+    ],
+    "tasting_notes": [
+        "DELETE FROM bottle_note_stats WHERE tasting_note_id = ?",
+        "DELETE FROM community_notes WHERE tasting_note_id = ?",
+        "DELETE FROM expert_notes WHERE tasting_note_id = ?",
+    ],
+}
+
+# Bottles whose aggregates change when a record of the given table is removed
+STATS_AFFECTED_BOTTLES = {
+    "users": "SELECT DISTINCT bottle_id FROM reviews WHERE user_id = ?",
+    "reviews": "SELECT bottle_id FROM reviews WHERE id = ?",
+    "community_notes": """
+        SELECT r.bottle_id FROM community_notes cn
+        JOIN reviews r ON cn.review_id = r.id
+        WHERE cn.id = ?
+    """,
+}
+
+def refresh_bottle_stats(cursor, bottle_ids=None):
+    """
+    Recompute bottle_stats and bottle_note_stats from reviews and community notes.
+
+    Parameters:
+    - cursor (sqlite3.Cursor): Cursor inside the caller's transaction.
+    - bottle_ids (list): Bottles to recompute, or None to rebuild every bottle.
+    """
+    ids = None if bottle_ids is None else json.dumps(list(bottle_ids))
+    scope = "(? IS NULL OR bottle_id IN (SELECT value FROM json_each(?)))"
+
+    cursor.execute(f"DELETE FROM bottle_stats WHERE {scope}", (ids, ids))
+    cursor.execute(f"DELETE FROM bottle_note_stats WHERE {scope}", (ids, ids))
+    cursor.execute(f"""
+        INSERT INTO bottle_stats (bottle_id, review_count, score_sum, last_reviewed)
+        SELECT bottle_id, COUNT(*), COALESCE(SUM(score), 0), MAX(review_date)
+        FROM reviews
+        WHERE {scope} AND bottle_id IN (SELECT id FROM bottles)
+        GROUP BY bottle_id
+    """, (ids, ids))
+    cursor.execute(f"""
+        INSERT INTO bottle_note_stats (bottle_id, tasting_note_id, note_count)
+        SELECT bottle_id, cn.tasting_note_id, COUNT(*)
+        FROM community_notes cn
+        JOIN reviews r ON cn.review_id = r.id
+        WHERE {scope}
+          AND bottle_id IN (SELECT id FROM bottles)
+          AND cn.tasting_note_id IN (SELECT id FROM tasting_notes)
+        GROUP BY bottle_id, cn.tasting_note_id
+    """, (ids, ids))
+
+def rebuild_bottle_stats():
+    """Rebuild the aggregates for every bottle from scratch."""
+    with create_connection() as conn:
+        refresh_bottle_stats(conn.cursor())
+    print("Bottle stats rebuilt.")
+
 def remove_record(table, record_id):
     """
     Remove a record from a specified table by its ID.
     If the table is 'users', remove all their reviews as well.
     If the table is 'bottles', remove all reviews associated with the bottle.
+    Any other rows referencing the record (see DEPENDENT_DELETES) are removed
+    in the same transaction.
     """
     with create_connection() as conn:
         cursor = conn.cursor()
 
-        if table == "users":
-            # Remove reviews associated with the user
-            cursor.execute("DELETE FROM reviews WHERE user_id = ?", (record_id,))
-            print(f"Removed {cursor.rowcount} reviews for user ID {record_id}.")
-        
-        elif table == "bottles":
-            # Remove reviews associated with the bottle
-            cursor.execute("DELETE FROM reviews WHERE bottle_id = ?", (record_id,))
-            print(f"Removed {cursor.rowcount} reviews for bottle ID {record_id}.")
+        affected_bottles = []
+        if table in STATS_AFFECTED_BOTTLES:
+            cursor.execute(STATS_AFFECTED_BOTTLES[table], (record_id,))
+            affected_bottles = [row[0] for row in cursor.fetchall()]
+
+        for statement in DEPENDENT_DELETES.get(table, []):
+            cursor.execute(statement, (record_id,))
+            if statement.startswith("DELETE FROM reviews"):
+                print(f"Removed {cursor.rowcount} reviews for {table} ID {record_id}.")
 
         # Remove the record from the specified table
         query = f"DELETE FROM {table} WHERE id = ?"
         cursor.execute(query, (record_id,))
-        conn.commit()
+        removed = cursor.rowcount
 
-    return cursor.rowcount
+        if affected_bottles:
+            refresh_bottle_stats(cursor, affected_bottles)
+
+    return removed
 
 
 def delete_database():
-    """Delete the existing database file."""
+    """Delete the existing database file along with its WAL and shared-memory files."""
+    # Pooled connections still point at the old file, so drop them first
+    pool.invalidate()
     if os.path.exists(DB_PATH):
         os.remove(DB_PATH)
         print(f"Deleted database: {DB_PATH}")
     else:
         print(f"No database file found at: {DB_PATH}")
+    for suffix in ("-wal", "-shm"):
+        if os.path.exists(DB_PATH + suffix):
+            os.remove(DB_PATH + suffix)
 
 def insert_data_from_csv():
     CSV_FILE = './database/bottles_sample_data.csv'
@@ -889,10 +1435,33 @@ def insert_data_from_csv():
 def refresh_database():
     """Refresh the database: delete, recreate, and insert data."""
     delete_database()
-    setup_database()  # Function from `setup.py` to recreate the schema
+    setup_database(create_connection())  # Function from `setup.py` to recreate the schema
+    migrate_database()
     insert_data_from_csv()  # Function from `insert_data.py` to populate sample data
     print("Database refreshed successfully.")
 
+def migrate_database():
+    """
+    Bring the database schema up to date by applying any pending migrations.
+    A new, empty database gets the baseline schema from setup_database() first,
+    since the migrations build on its tables.
+    """
+    # Not a `with` block: apply_migrations runs each migration in a transaction
+    # of its own, which an enclosing block on the same connection would absorb
+    conn = create_connection()
+    has_schema = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'bottles'"
+    ).fetchone()
+    if not has_schema:
+        setup_database(conn)
+    applied = apply_migrations(conn)
+    version = get_schema_version(conn)
+    if applied:
+        print(f"Database migrated to schema version {version}.")
+    else:
+        print(f"Database already at schema version {version}.")
+    return applied
+
 def view_database():
         # Connect to the SQLite database
     with create_connection() as conn:
@@ -914,20 +1483,19 @@ def backup_database():
     Backs up all tables in the bar_companion.db database to separate CSV files
     in a directory named ./database_backup/{today's date}.
     """
-    # Database and backup directory
-    database_path = "./database/bar_companion.db"
+    # Backup directory
     backup_dir = f"./database_backup/{datetime.now().strftime('%Y-%m-%d')}"
 
     # Create the backup directory if it doesn't exist
     os.makedirs(backup_dir, exist_ok=True)
 
     # Connect to the database
-    with sqlite3.connect(database_path) as conn:
+    with create_connection() as conn:
         cursor = conn.cursor()
 
-        # Get a list of all tables in the database
+        # Get a list of all tables in the database; search indexes are rebuilt on load
         cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        tables = [row[0] for row in cursor.fetchall()]
+        tables = [row[0] for row in cursor.fetchall() if not is_search_table(row[0])]
 
         # Export each table to a CSV file
         for table in tables:
@@ -949,18 +1517,26 @@ def load_csvs(folder_path):
     Args:
         folder_path (str): Path to the folder containing the CSV files.
     """
-    database_path = "./database/bar_companion.db"
-
     # Step 1: Recreate the database schema
     delete_database()
-    setup_database()
+    setup_database(create_connection())
+    migrate_database()
     print("Database schema recreated.")
 
     # Step 2: Load CSV data into the database
-    with sqlite3.connect(database_path) as conn:
+    conn = create_connection()
+    # CSVs load in directory order, not dependency order, so foreign keys are
+    # checked only once everything is in. The pragma must be set outside a transaction.
+    conn.execute("PRAGMA foreign_keys = OFF")
+    try:
         for file_name in os.listdir(folder_path):
             if file_name.endswith(".csv"):
                 table_name = os.path.splitext(file_name)[0]
+                if table_name in ("schema_version", "data_versions"):
+                    continue  # Already written by migrate_database above
+                if is_search_table(table_name):
+                    continue  # Filled by triggers as bottles and reviews load
+
                 file_path = os.path.join(folder_path, file_name)
 
                 # Read the CSV into a DataFrame
@@ -974,6 +1550,18 @@ def load_csvs(folder_path):
                 df.to_sql(table_name, conn, if_exists="append", index=False)
 
                 print(f"Loaded {file_name} into table {table_name}.")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.execute("PRAGMA foreign_keys = ON")
+
+    rebuild_bottle_stats()  # Aggregates are derived data; don't trust the CSV copy
+
+    violations = conn.execute("PRAGMA foreign_key_check").fetchall()
+    if violations:
+        print(f"Warning: {len(violations)} rows reference missing records.")
     
     print("All CSV files have been loaded into the database.")
 
@@ -982,6 +1570,14 @@ def load_csvs(folder_path):
 if __name__ == "__main__":
     if len(sys.argv) > 1 and sys.argv[1] == "refresh":
         refresh_database()
+    elif len(sys.argv) > 1 and sys.argv[1] == "migrate":
+        migrate_database()
+    elif len(sys.argv) > 1 and sys.argv[1] == "rebuild_stats":
+        rebuild_bottle_stats()
+    elif len(sys.argv) > 1 and sys.argv[1] == "rebuild_search":
+        rebuild_search_index()
+    elif len(sys.argv) > 1 and sys.argv[1] == "index_photos":
+        index_event_photos()
     elif len(sys.argv) > 1 and sys.argv[1] == "view":
         view_database()
     elif len(sys.argv) > 1 and sys.argv[1] == "backup":
@@ -1,33 +1,10 @@
-import json
-from openai import OpenAI
+from enrichment_clients import get_openai_client
 from notes_generator import generate_expert_notes
+from llm_cache import cached_completion
 
-def get_api_key(filepath: str = "secrets.json", key_name: str = "OPENAI_KEY") -> str:
-    """
-    Reads and returns the API key from a local JSON file.
 
-    Args:
-        filepath (str): Path to the secrets file.
-        key_name (str): Key name to look up inside the JSON.
-
-    Returns:
-        str: The API key as a string.
-    """
-    try:
-        with open(filepath, "r") as f:
-            secrets = json.load(f)
-        api_key = secrets.get(key_name)
-        if not api_key:
-            raise ValueError(f"API key '{key_name}' not found in {filepath}")
-        return api_key
-    except FileNotFoundError:
-        raise FileNotFoundError(f"Secrets file not found at: {filepath}")
-    except json.JSONDecodeError:
-        raise ValueError("Secrets file is not valid JSON")
-
-
-def generate_description(bottle_query):
-    client = OpenAI(api_key=get_api_key())
+def generate_description(bottle_query, bypass_cache=False):
+    client = get_openai_client()
     context = [
             {
             "role": "system",
@@ -53,12 +30,7 @@ def generate_description(bottle_query):
         },
     ]
     try:
-        response = client.chat.completions.create(
-            model="gpt-5",
-            messages=context
-        )
-        text = response.choices[0].message.content
-        return text
+        return cached_completion(client, "gpt-5", context, bypass=bypass_cache)
     except Exception as e:
         print(f"Error fetching description: {e}")
     return ""
@@ -0,0 +1,94 @@
+import json
+import os
+import threading
+
+import requests
+from openai import OpenAI
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+BASE_DIR = os.path.dirname(__file__)
+
+DEFAULT_SECRETS_PATH = os.path.join(BASE_DIR, "secrets.json")
+
+# Connections kept alive per host; sized for the refresh workers plus image fetches
+HTTP_POOL_SIZE = 16
+
+_lock = threading.Lock()
+_settings = {}  # secrets path -> parsed settings
+_openai_clients = {}  # API key -> OpenAI client
+_session = None
+
+
+def load_settings(filepath=DEFAULT_SECRETS_PATH):
+    """
+    Return the settings from the secrets file, read once per path. Environment
+    variables with the same name as a key (e.g. OPENAI_KEY, SERP_KEY) take
+    precedence, and the file may be missing if everything comes from the environment.
+    """
+    with _lock:
+        if filepath not in _settings:
+            try:
+                with open(filepath, "r", encoding="utf-8") as file:
+                    settings = json.load(file)
+            except FileNotFoundError:
+                settings = {}
+            except json.JSONDecodeError:
+                raise ValueError("Secrets file is not valid JSON")
+            _settings[filepath] = settings
+        return _settings[filepath]
+
+
+def get_api_key(filepath=DEFAULT_SECRETS_PATH, key_name="OPENAI_KEY"):
+    """
+    Return an API key from the environment or the secrets file.
+
+    Args:
+        filepath (str): Path to the secrets file.
+        key_name (str): Key name to look up.
+
+    Returns:
+        str: The API key as a string.
+    """
+    api_key = os.environ.get(key_name) or load_settings(filepath).get(key_name)
+    if not api_key:
+        raise ValueError(f"API key '{key_name}' not found in environment or {filepath}")
+    return api_key
+
+
+def get_openai_client(filepath=DEFAULT_SECRETS_PATH):
+    """Return the long-lived OpenAI client for the configured key."""
+    api_key = get_api_key(filepath=filepath)
+    with _lock:
+        if api_key not in _openai_clients:
+            _openai_clients[api_key] = OpenAI(api_key=api_key)
+        return _openai_clients[api_key]
+
+
+def get_http_session():
+    """
+    Return the shared requests session used for outbound enrichment calls.
+    Connections are pooled and kept alive per host, and idempotent requests are
+    retried with backoff on connection errors and 429/5xx responses.
+    """
+    global _session
+    with _lock:
+        if _session is None:
+            retries = Retry(
+                total=2,
+                backoff_factor=0.5,
+                status_forcelist=(429, 500, 502, 503, 504),
+                allowed_methods=("GET", "HEAD"),
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(
+                pool_connections=HTTP_POOL_SIZE,
+                pool_maxsize=HTTP_POOL_SIZE,
+                max_retries=retries,
+            )
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
@@ -0,0 +1,63 @@
+import json
+import threading
+from collections import deque
+
+
+class EventFeed:
+    """
+    In-process change feed for live event pages.
+
+    Handlers publish small deltas (new reviews, participants, bottles, photos)
+    against an event ID, and each subscriber waits for entries newer than the
+    last sequence number it has seen. Only the most recent `history` entries per
+    event are kept, which is enough for a reconnecting browser to catch up.
+
+    The feed lives in process memory, so subscribers only see changes published
+    by the same server process.
+    """
+
+    def __init__(self, history=200):
+        self.history = history
+        self._entries = {}  # event_id -> deque of (sequence, kind, data)
+        self._sequence = 0
+        self._condition = threading.Condition()
+
+    def publish(self, event_id, kind, data):
+        """Record a change for event_id and wake every waiting subscriber."""
+        with self._condition:
+            self._sequence += 1
+            entries = self._entries.setdefault(int(event_id), deque(maxlen=self.history))
+            entries.append((self._sequence, kind, data))
+            self._condition.notify_all()
+            return self._sequence
+
+    def latest(self):
+        """Return the newest sequence number published so far."""
+        with self._condition:
+            return self._sequence
+
+    def since(self, event_id, last_sequence):
+        """Return the entries for event_id newer than last_sequence, oldest first."""
+        with self._condition:
+            entries = self._entries.get(int(event_id), ())
+            return [entry for entry in entries if entry[0] > last_sequence]
+
+    def wait(self, event_id, last_sequence, timeout=15):
+        """Block until there are entries newer than last_sequence or timeout passes."""
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self._has_newer(int(event_id), last_sequence), timeout=timeout
+            )
+        return self.since(event_id, last_sequence)
+
+    def _has_newer(self, event_id, last_sequence):
+        entries = self._entries.get(event_id)
+        return bool(entries) and entries[-1][0] > last_sequence
+
+
+def format_sse(sequence, kind, data):
+    """Encode one feed entry as a Server-Sent Events message."""
+    return f"id: {sequence}\nevent: {kind}\ndata: {json.dumps(data)}\n\n"
+
+
+feed = EventFeed()
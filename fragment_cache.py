@@ -0,0 +1,85 @@
+import os
+import threading
+from collections import OrderedDict
+
+
+# Total size of the rendered pages kept in memory, per process
+FRAGMENT_CACHE_MAX_BYTES = int(os.environ.get("FRAGMENT_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+
+
+class FragmentCache:
+    """
+    In-memory LRU cache of rendered HTML, bounded by the total length of the
+    stored pages.
+
+    Callers put the data versions a page was rendered from into its key, so a
+    write never has to delete anything: the old entries just stop being asked
+    for and fall off the end of the LRU.
+    """
+
+    def __init__(self, max_bytes=FRAGMENT_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> html, least recently used first
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            html = self._entries.get(key)
+            if html is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return html
+
+    def put(self, key, html):
+        size = len(html)
+        if size > self.max_bytes:
+            return  # Would evict everything else and still not fit
+        with self._lock:
+            if key in self._entries:
+                self._size -= len(self._entries.pop(key))
+            self._entries[key] = html
+            self._size += size
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+                self.evictions += 1
+
+    def get_or_render(self, key, render):
+        """
+        Return the cached HTML for key, or call render() and cache what it returns.
+        Only strings are stored, so a view can return an error response from
+        render() and it will be rendered again on the next request.
+        """
+        html = self.get(key)
+        if html is None:
+            html = render()
+            if isinstance(html, str):
+                self.put(key, html)
+        return html
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            }
+
+
+fragments = FragmentCache()
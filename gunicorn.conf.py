@@ -0,0 +1,67 @@
+"""
+Gunicorn settings for serving Bar Companion in production.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Every value can be overridden from the environment, e.g. WEB_THREADS=48.
+
+Sizing for an event night
+-------------------------
+Almost all of our request time is spent waiting: on SQLite (reads are a few
+milliseconds, writes are serialised by the database anyway), on SerpAPI, page
+fetches and OpenAI during /api/refresh, and on image downloads in /get_images.
+Threads handle that mix well, so the default is ONE worker process with many
+threads rather than many processes:
+
+* The live event feed (/api/events/<id>/stream) and the /api/refresh job
+  registry are held in process memory. With more than one worker, a review
+  posted to one worker never reaches a console streaming from another, and a
+  job's status can 404 when polled on a different worker. Only raise
+  WEB_WORKERS behind a proxy that pins each client to one worker.
+* Each open event console holds one thread for its stream. Guests' phones hold
+  none between requests.
+* A typical night is 20-40 guests, each opening a page or posting a review
+  every few seconds at peak, plus one or two consoles. 32 threads leaves room
+  for that, for a refresh job (which runs on its own REFRESH_WORKERS pool of
+  4 threads and returns immediately) and for a few slow /get_images calls,
+  which give up after their shared 6 second deadline.
+* Rendered pages are cached per process (FRAGMENT_CACHE_MAX_BYTES, 32 MB by
+  default) and revalidated with ETags, so repeat page loads cost a counter
+  query rather than a render.
+
+For a large event (100+ guests) raise WEB_THREADS to 64 before adding workers.
+
+Reloading
+---------
+`kill -HUP <master pid>` restarts the workers gracefully: each finishes its
+in-flight requests (up to graceful_timeout) while new ones start. Because the
+app is preloaded in the master, a HUP does not pick up new code. To deploy code,
+restart the container, or send USR2 to start a new master and then QUIT to the
+old one.
+"""
+import os
+
+
+bind = os.environ.get("BIND", "0.0.0.0:5000")
+
+# See "Sizing" above before raising workers
+workers = int(os.environ.get("WEB_WORKERS", 1))
+worker_class = "gthread"
+threads = int(os.environ.get("WEB_THREADS", 32))
+
+# Import the app (and run migrations) once in the master, before forking
+preload_app = True
+
+# Seconds a worker may go silent before it is restarted. With gthread this
+# guards against a hung worker rather than a slow request, since outbound
+# calls carry their own timeouts and the event stream heartbeats every 15s.
+timeout = int(os.environ.get("WEB_TIMEOUT", 60))
+# Time in-flight requests get to finish on HUP or shutdown
+graceful_timeout = int(os.environ.get("WEB_GRACEFUL_TIMEOUT", 30))
+# Phones on the venue Wi-Fi reuse connections between page loads
+keepalive = 5
+
+# Log to the container's stdout/stderr
+accesslog = "-"
+errorlog = "-"
+loglevel = os.environ.get("LOG_LEVEL", "info")
@@ -0,0 +1,156 @@
+import re
+import threading
+import time
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from db_connection import pool
+
+
+HTTP_CACHE_PATH = "./database/http_cache.db"
+HTTP_CACHE_MAX_BYTES = 50 * 1024 * 1024
+
+SEARCH_TTL = 7 * 24 * 3600  # Search results for a bottle rarely change
+PAGE_TTL = 24 * 3600  # After this a page is revalidated with its ETag/Last-Modified
+
+
+def normalize_query(query):
+    """Normalize a search query so trivially different spellings share a cache entry."""
+    return re.sub(r"\s+", " ", query).strip().lower()
+
+
+def normalize_url(url):
+    """Lowercase the scheme and host, sort the query string and drop the fragment."""
+    parts = urlsplit(url.strip())
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or "/", query, ""))
+
+
+class HttpCache:
+    """
+    SQLite-backed cache for outbound HTTP results.
+
+    Entries are keyed by a normalized query or URL and carry an expiry time plus
+    the validators (ETag / Last-Modified) needed to revalidate them. Once the
+    stored bodies exceed max_bytes the least recently used entries are evicted.
+    Hit, miss and revalidation counts are kept per process.
+    """
+
+    def __init__(self, path=HTTP_CACHE_PATH, max_bytes=HTTP_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "stale": 0, "revalidated": 0, "stores": 0, "evictions": 0}
+        self._schema_ready = False
+
+    def _connection(self):
+        conn = pool.acquire(self.path)
+        if not self._schema_ready:
+            with conn:
+                conn.execute('''
+                CREATE TABLE IF NOT EXISTS http_cache (
+                    key TEXT PRIMARY KEY,
+                    body TEXT NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT,
+                    expires_at REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    size INTEGER NOT NULL
+                )
+                ''')
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_http_cache_last_access ON http_cache (last_access)")
+            self._schema_ready = True
+        return conn
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def get(self, key):
+        """
+        Return the cached entry for key as a dictionary with body, etag,
+        last_modified and fresh, or None. Stale entries are still returned so the
+        caller can revalidate them.
+        """
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT body, etag, last_modified, expires_at FROM http_cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            self._count("misses")
+            return None
+
+        now = time.time()
+        with conn:
+            conn.execute("UPDATE http_cache SET last_access = ? WHERE key = ?", (now, key))
+        fresh = row[3] > now
+        self._count("hits" if fresh else "stale")
+        return {"body": row[0], "etag": row[1], "last_modified": row[2], "fresh": fresh}
+
+    def put(self, key, body, ttl, etag=None, last_modified=None):
+        """Store body under key for ttl seconds, then evict down to max_bytes."""
+        conn = self._connection()
+        now = time.time()
+        size = len(body.encode("utf-8"))
+        with conn:
+            conn.execute('''
+                INSERT OR REPLACE INTO http_cache (key, body, etag, last_modified, expires_at, last_access, size)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (key, body, etag, last_modified, now + ttl, now, size))
+        self._count("stores")
+        self._evict(conn)
+
+    def revalidated(self, key, ttl):
+        """Extend a stale entry's lifetime after the origin answered 304 Not Modified."""
+        conn = self._connection()
+        with conn:
+            conn.execute("UPDATE http_cache SET expires_at = ? WHERE key = ?", (time.time() + ttl, key))
+        self._count("revalidated")
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM http_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        with conn:
+            rows = conn.execute("SELECT key, size FROM http_cache ORDER BY last_access").fetchall()
+            for key, size in rows:
+                if total <= self.max_bytes:
+                    break
+                conn.execute("DELETE FROM http_cache WHERE key = ?", (key,))
+                total -= size
+                evicted += 1
+        self._count("evictions", evicted)
+
+    def clear(self):
+        """Drop every cached entry."""
+        conn = self._connection()
+        with conn:
+            conn.execute("DELETE FROM http_cache")
+
+    def stats(self):
+        """Return hit/miss counters for this process plus the cache's current size."""
+        conn = self._connection()
+        entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM http_cache").fetchone()
+        with self._lock:
+            counters = dict(self._counters)
+        lookups = counters["hits"] + counters["stale"] + counters["misses"]
+        counters["hit_rate"] = counters["hits"] / lookups if lookups else 0.0
+        counters["entries"] = entries
+        counters["bytes"] = size
+        return counters
+
+
+http_cache = HttpCache()
+
+
+if __name__ == "__main__":
+    import json
+    import sys
+
+    if len(sys.argv) > 1 and sys.argv[1] == "stats":
+        print(json.dumps(http_cache.stats(), indent=2))
+    elif len(sys.argv) > 1 and sys.argv[1] == "clear":
+        http_cache.clear()
+        print("HTTP cache cleared.")
+    else:
+        print("Usage: python http_cache.py stats|clear")
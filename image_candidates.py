@@ -0,0 +1,252 @@
+import hashlib
+import io
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from duckduckgo_search import DDGS
+from PIL import Image, ImageOps
+
+from enrichment_clients import get_http_session
+from http_cache import HttpCache, normalize_query
+from metrics import track_call
+
+
+CANDIDATE_DIR = "./database/image_candidates"
+CANDIDATE_MAX_AGE = 24 * 3600  # Browser cache lifetime of a served preview
+
+# Search results and the previews made from them are reused for a week per bottle
+IMAGE_SEARCH_CACHE_PATH = "./database/image_search_cache.db"
+IMAGE_SEARCH_TTL = 7 * 24 * 3600
+IMAGE_CACHE_MAX_BYTES = 100 * 1024 * 1024  # Preview files on disk
+
+SEARCH_RESULTS = 12  # Search hits considered per query
+MAX_CANDIDATES = 6
+FETCH_DEADLINE = 6  # Seconds for the whole batch of downloads
+FETCH_WORKERS = 8
+MAX_IMAGE_BYTES = 5 * 1024 * 1024
+PREVIEW_SIZE = 1024  # Longest edge; matches the largest served variant
+
+# Leading bytes of the formats we accept, whatever the server's Content-Type says
+IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+CANDIDATE_TYPES = {".jpg": "image/jpeg", ".png": "image/png"}
+CANDIDATE_PATTERN = re.compile(r"^[0-9a-f]{32}\.(jpg|png)$")
+
+_executor = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix="image-fetch")
+_lock = threading.Lock()
+
+search_cache = HttpCache(path=IMAGE_SEARCH_CACHE_PATH, max_bytes=2 * 1024 * 1024)
+
+
+def sniff_image_type(data):
+    """Return the MIME type for data's leading bytes, or None if it is not a supported image."""
+    for signature, mime_type in IMAGE_SIGNATURES:
+        if data.startswith(signature):
+            return mime_type
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+def download_image(url, deadline):
+    """
+    Stream an image from url, giving up once it exceeds MAX_IMAGE_BYTES, the
+    deadline (a time.monotonic() value) passes, or the body is not an image.
+
+    Returns:
+        bytes: The image body, or None.
+    """
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        return None
+    chunks = []
+    size = 0
+    with track_call("image_fetch"), \
+            get_http_session().get(url, stream=True, timeout=(min(3, remaining), remaining)) as response:
+        if response.status_code != 200:
+            return None
+        content_type = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+        if content_type and not content_type.startswith(("image/", "application/octet-stream", "binary/")):
+            return None
+        declared = response.headers.get("Content-Length")
+        if declared and declared.isdigit() and int(declared) > MAX_IMAGE_BYTES:
+            return None
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            size += len(chunk)
+            if size > MAX_IMAGE_BYTES or time.monotonic() > deadline:
+                return None
+            chunks.append(chunk)
+    data = b"".join(chunks)
+    return data if sniff_image_type(data) else None
+
+
+def make_preview(data):
+    """
+    Downscale image bytes to PREVIEW_SIZE and re-encode them, as PNG when the
+    image has transparency and JPEG otherwise.
+
+    Returns:
+        tuple: (encoded bytes, file extension)
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((PREVIEW_SIZE, PREVIEW_SIZE), Image.LANCZOS)
+        output = io.BytesIO()
+        if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+            image.convert("RGBA").save(output, "PNG", optimize=True)
+            return output.getvalue(), ".png"
+        image.convert("RGB").save(output, "JPEG", quality=85, optimize=True)
+        return output.getvalue(), ".jpg"
+
+
+def store_candidate(data, extension):
+    """
+    Write a preview to CANDIDATE_DIR, named by a hash of its bytes so the same
+    image found for two queries is stored once, and return the file name.
+    """
+    os.makedirs(CANDIDATE_DIR, exist_ok=True)
+    name = hashlib.sha256(data).hexdigest()[:32] + extension
+    path = os.path.join(CANDIDATE_DIR, name)
+    if not os.path.exists(path):
+        with open(path + ".tmp", "wb") as file:
+            file.write(data)
+        os.replace(path + ".tmp", path)
+    return name
+
+
+def candidate_path(name):
+    """
+    Return (absolute path, MIME type) for a stored preview, or None. Names that
+    do not look like ones we issued are rejected before touching the disk.
+    """
+    if not CANDIDATE_PATTERN.match(name):
+        return None
+    path = os.path.join(CANDIDATE_DIR, name)
+    if not os.path.isfile(path):
+        return None
+    return os.path.abspath(path), CANDIDATE_TYPES[os.path.splitext(name)[1]]
+
+
+def prune_candidates():
+    """
+    Delete previews not used within IMAGE_SEARCH_TTL, then the least recently
+    used ones until the directory fits in IMAGE_CACHE_MAX_BYTES.
+
+    Returns:
+        int: The number of files deleted.
+    """
+    cutoff = time.time() - IMAGE_SEARCH_TTL
+    removed = 0
+    with _lock:
+        try:
+            names = os.listdir(CANDIDATE_DIR)
+        except FileNotFoundError:
+            return 0
+        files = []
+        for name in names:
+            path = os.path.join(CANDIDATE_DIR, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in files)
+        for mtime, size, path in sorted(files):
+            if mtime >= cutoff and total <= IMAGE_CACHE_MAX_BYTES:
+                break
+            try:
+                os.remove(path)
+                removed += 1
+                total -= size
+            except OSError:
+                pass
+    return removed
+
+
+def _fetch_candidate(url, deadline):
+    data = download_image(url, deadline)
+    if not data:
+        return None
+    preview, extension = make_preview(data)
+    return store_candidate(preview, extension)
+
+
+def fetch_candidates(image_urls, limit=MAX_CANDIDATES, timeout=FETCH_DEADLINE):
+    """
+    Download image_urls in parallel and turn each into a stored preview.
+
+    Every download shares one deadline, so slow hosts cost at most `timeout`
+    seconds in total. The first `limit` previews to finish are kept, in the
+    order the URLs were given.
+
+    Returns:
+        list: Preview file names for use with candidate_path().
+    """
+    deadline = time.monotonic() + timeout
+    futures = {_executor.submit(_fetch_candidate, url, deadline): index for index, url in enumerate(image_urls)}
+    finished = {}
+    pending = set(futures)
+    while pending and len(finished) < limit:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                name = future.result()
+            except Exception as e:
+                print(f"Error fetching image {image_urls[futures[future]]}: {e}")
+                continue
+            if name:
+                finished[futures[future]] = name
+    for future in pending:
+        future.cancel()
+    return [finished[index] for index in sorted(finished)][:limit]
+
+
+def search_image_urls(query, max_results=SEARCH_RESULTS):
+    """Return image URLs from a DuckDuckGo image search, or an empty list if it fails."""
+    try:
+        with track_call("image_search"), DDGS() as ddgs:
+            results = ddgs.images(query, safesearch='Moderate', size='Medium', max_results=max_results)
+            return [r.get("image") for r in results if r.get("image")][:max_results]
+    except Exception as e:
+        print(f"Error fetching images: {e}")
+        return []
+
+
+def find_candidates(query, bypass_cache=False):
+    """
+    Return preview file names for an image search, reusing the cached search
+    results and previews for the normalized query when they are still on disk.
+
+    A cache hit makes no network calls. If some previews were evicted, the
+    cached search results are downloaded again without repeating the search.
+    """
+    key = "images:" + normalize_query(query)
+    cached = None if bypass_cache else search_cache.get(key)
+    entry = json.loads(cached["body"]) if cached and cached["fresh"] else None
+
+    if entry and entry["previews"]:
+        paths = [os.path.join(CANDIDATE_DIR, name) for name in entry["previews"]]
+        if all(os.path.isfile(path) for path in paths):
+            now = time.time()
+            for path in paths:
+                os.utime(path, (now, now))  # Keep them out of the size-based eviction
+            return entry["previews"]
+
+    image_urls = entry["urls"] if entry else search_image_urls(query)
+    prune_candidates()  # Before storing, so the new previews are never the ones evicted
+    previews = fetch_candidates(image_urls)
+    if image_urls:
+        search_cache.put(key, json.dumps({"urls": image_urls, "previews": previews}), IMAGE_SEARCH_TTL)
+    return previews
@@ -0,0 +1,272 @@
+import base64
+import os
+import sys
+from urllib.parse import quote, urlencode
+
+from PIL import Image, ImageOps
+
+
+IMAGE_ROOT = "./database_images"
+VARIANT_DIR = "variants"  # Under IMAGE_ROOT, mirrors the originals' layout
+
+# Longest edge in pixels for each size bucket templates can ask for
+IMAGE_SIZES = {
+    "thumb": 160,
+    "card": 480,
+    "large": 1024,
+}
+VARIANT_FORMATS = {
+    "webp": {"format": "WEBP", "quality": 80, "method": 4},
+    "jpg": {"format": "JPEG", "quality": 82, "optimize": True, "progressive": True},
+}
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif", ".webp")
+
+# Largest photo accepted by the upload endpoints, in bytes of image data
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", 15 * 1024 * 1024))
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+
+class UploadTooLarge(ValueError):
+    """Raised when an uploaded photo is bigger than the configured maximum."""
+
+
+def save_upload(stream, path, max_bytes=MAX_UPLOAD_BYTES):
+    """
+    Copy an uploaded file's stream to path in chunks, so the photo is never
+    held in memory whole. The file is written beside path and moved into place
+    once complete; nothing is left behind if the upload is too large.
+
+    Returns:
+        int: The number of bytes written.
+    """
+    temporary = path + ".part"
+    size = 0
+    try:
+        with open(temporary, "wb") as file:
+            while True:
+                chunk = stream.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"Photo is larger than {max_bytes // (1024 * 1024)} MB")
+                file.write(chunk)
+        os.replace(temporary, path)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+    return size
+
+
+def save_base64_upload(data_url, path, max_bytes=MAX_UPLOAD_BYTES):
+    """
+    Decode a "data:image/...;base64,..." string (or bare base64) and write it to
+    path. Kept for clients that still send photos inside a JSON body.
+
+    Returns:
+        int: The number of bytes written.
+    """
+    encoded = data_url.split(",", 1)[1] if "," in data_url else data_url
+    if len(encoded) * 3 // 4 > max_bytes:
+        raise UploadTooLarge(f"Photo is larger than {max_bytes // (1024 * 1024)} MB")
+    image = base64.b64decode(encoded)
+    with open(path, "wb") as file:
+        file.write(image)
+    return len(image)
+
+
+def image_info(path):
+    """
+    Return (width, height, file extension) for an image, reading only its header.
+    The extension comes from the detected format, not the file name; unreadable
+    files give (None, None, None).
+    """
+    try:
+        with Image.open(path) as image:
+            extension = {"JPEG": ".jpg", "PNG": ".png", "GIF": ".gif", "WEBP": ".webp"}.get(image.format, ".png")
+            return image.width, image.height, extension
+    except Exception:
+        return None, None, None
+
+
+def resolve_original(filename):
+    """
+    Return filename normalised relative to IMAGE_ROOT, or None if it resolves
+    (through "..", an absolute path or a symlink) to somewhere outside IMAGE_ROOT.
+    """
+    root = os.path.realpath(IMAGE_ROOT)
+    path = os.path.realpath(os.path.join(root, filename))
+    if path == root or os.path.commonpath([root, path]) != root:
+        return None
+    return os.path.relpath(path, root)
+
+
+def image_url(filename, size=None):
+    """
+    Return the URL the app serves an uploaded image at, optionally a size
+    variant. The original's modification time goes in as v, so the URL changes
+    whenever the photo is replaced and the response can be cached for good.
+
+    Parameters:
+        filename (str): Path relative to IMAGE_ROOT, e.g. "bottles/Ardbeg_10.png".
+        size (str): Key of IMAGE_SIZES, or None for the original.
+    """
+    params = {}
+    if size:
+        params["size"] = size
+    original = resolve_original(filename)
+    # Missing files are linked (and 404) without a version
+    if original is not None and os.path.isfile(os.path.join(IMAGE_ROOT, original)):
+        params["v"] = os.stat(os.path.join(IMAGE_ROOT, original)).st_mtime_ns
+    url = "/database_images/" + quote(filename)
+    return f"{url}?{urlencode(params)}" if params else url
+
+
+def variant_path(filename, size, fmt):
+    """
+    Return the path of a resized copy of an uploaded image.
+
+    Parameters:
+        filename (str): Path of the original relative to IMAGE_ROOT, e.g. "bottles/Ardbeg_10.png".
+        size (str): Key of IMAGE_SIZES.
+        fmt (str): Key of VARIANT_FORMATS.
+    """
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(IMAGE_ROOT, VARIANT_DIR, size, f"{stem}.{fmt}")
+
+
+def is_variant(filename):
+    return filename.replace("\\", "/").lstrip("./").startswith(VARIANT_DIR + "/")
+
+
+def _flatten(image):
+    """Return an RGB copy of image, with any transparency composited onto white."""
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel("A"))
+        return background
+    return image.convert("RGB")
+
+
+def create_variants(filename, force=False):
+    """
+    Write every size/format variant of an uploaded image that is missing or older
+    than the original. Images smaller than a bucket are re-encoded, never upscaled.
+
+    Parameters:
+        filename (str): Path of the original relative to IMAGE_ROOT.
+        force (bool): Rewrite variants even if they are up to date.
+
+    Returns:
+        int: The number of variant files written.
+    """
+    filename = resolve_original(filename)
+    if filename is None or is_variant(filename):
+        raise ValueError("Variants are only made for originals inside IMAGE_ROOT")
+    source = os.path.join(IMAGE_ROOT, filename)
+    source_mtime = os.path.getmtime(source)
+    pending = [
+        (size, fmt)
+        for size in IMAGE_SIZES
+        for fmt in VARIANT_FORMATS
+        if force
+        or not os.path.exists(variant_path(filename, size, fmt))
+        or os.path.getmtime(variant_path(filename, size, fmt)) < source_mtime
+    ]
+    if not pending:
+        return 0
+
+    with Image.open(source) as original:
+        original = ImageOps.exif_transpose(original)
+        keeps_alpha = original.mode in ("RGBA", "LA", "P")
+        resized = {}
+        for size, fmt in pending:
+            if size not in resized:
+                image = original.copy()
+                image.thumbnail((IMAGE_SIZES[size], IMAGE_SIZES[size]), Image.LANCZOS)
+                resized[size] = image
+            image = resized[size]
+            if fmt == "jpg" or not keeps_alpha:
+                image = _flatten(image)
+            else:
+                image = image.convert("RGBA")
+
+            target = variant_path(filename, size, fmt)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            options = dict(VARIANT_FORMATS[fmt])
+            # Write beside the target and swap it in so readers never see a partial file
+            temporary = target + ".tmp"
+            image.save(temporary, options.pop("format"), **options)
+            os.replace(temporary, target)
+    return len(pending)
+
+
+def create_variants_for_path(path):
+    """
+    Like create_variants, but for a path as the upload handlers build it
+    (e.g. "./database_images/bottles/x.png"). Failures are printed rather than
+    raised so an unreadable image never fails the upload itself.
+    """
+    try:
+        filename = os.path.relpath(path, IMAGE_ROOT)
+        return create_variants(filename)
+    except Exception as e:
+        print(f"Error creating image variants for {path}: {e}")
+        return 0
+
+
+def choose_variant(filename, size, accept_webp):
+    """
+    Return the variant to serve for a request as a path relative to IMAGE_ROOT,
+    creating it on first use or when the original has been replaced since, or
+    None if the original should be served instead. filename must already have
+    been checked with resolve_original().
+    """
+    if size not in IMAGE_SIZES or is_variant(filename) or not filename.lower().endswith(IMAGE_EXTENSIONS):
+        return None
+    source = os.path.join(IMAGE_ROOT, filename)
+    if not os.path.isfile(source):
+        return None
+
+    fmt = "webp" if accept_webp else "jpg"
+    target = variant_path(filename, size, fmt)
+    if not os.path.exists(target) or os.path.getmtime(target) < os.path.getmtime(source):
+        try:
+            create_variants(filename)
+        except Exception as e:
+            print(f"Error creating image variants for {filename}: {e}")
+            return None
+    return os.path.relpath(target, IMAGE_ROOT)
+
+
+def backfill_variants(force=False):
+    """
+    Create the missing variants for every image already under IMAGE_ROOT.
+
+    Returns:
+        tuple: (images checked, variant files written, images that failed)
+    """
+    checked = written = failed = 0
+    for directory, subdirectories, files in os.walk(IMAGE_ROOT):
+        if os.path.relpath(directory, IMAGE_ROOT) == ".":
+            subdirectories[:] = [name for name in subdirectories if name != VARIANT_DIR]
+        for file in files:
+            if not file.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            filename = os.path.relpath(os.path.join(directory, file), IMAGE_ROOT)
+            checked += 1
+            try:
+                written += create_variants(filename, force=force)
+            except Exception as e:
+                failed += 1
+                print(f"Error creating image variants for {filename}: {e}")
+    return checked, written, failed
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "backfill":
+        checked, written, failed = backfill_variants(force="--force" in sys.argv[2:])
+        print(f"Checked {checked} images, wrote {written} variants, {failed} failed.")
+    else:
+        print("Usage: python image_pipeline.py backfill [--force]")
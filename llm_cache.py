@@ -0,0 +1,45 @@
+import hashlib
+import json
+import os
+
+from http_cache import HttpCache
+from metrics import track_call
+
+
+LLM_CACHE_PATH = "./database/llm_cache.db"
+LLM_CACHE_MAX_BYTES = 20 * 1024 * 1024
+LLM_CACHE_TTL = 30 * 24 * 3600
+
+# Set LLM_CACHE_BYPASS=1 to always call the API (fresh answers are still stored)
+LLM_CACHE_BYPASS = os.environ.get("LLM_CACHE_BYPASS", "") not in ("", "0", "false")
+
+llm_cache = HttpCache(path=LLM_CACHE_PATH, max_bytes=LLM_CACHE_MAX_BYTES)
+
+
+def completion_key(model, messages):
+    """Content address of a chat request: a hash of the model and the exact messages."""
+    payload = json.dumps({"model": model, "messages": messages}, sort_keys=True, ensure_ascii=True)
+    return "chat:" + hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def cached_completion(client, model, messages, bypass=False):
+    """
+    Return the text of a chat completion, reusing a stored answer for an
+    identical model + messages request unless bypass (or LLM_CACHE_BYPASS) is set.
+    Empty answers are not cached.
+    """
+    key = completion_key(model, messages)
+    if not (bypass or LLM_CACHE_BYPASS):
+        cached = llm_cache.get(key)
+        if cached and cached["fresh"]:
+            return cached["body"]
+
+    with track_call("openai"):
+        response = client.chat.completions.create(
+            model=model,
+            messages=messages,
+        )
+    content = response.choices[0].message.content
+    if content:
+        llm_cache.put(key, content, LLM_CACHE_TTL)
+    return content
@@ -0,0 +1,382 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+
+METRICS_PREFIX = "barcompanion"
+
+# Upper bounds, in seconds, of the latency histogram buckets
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+ENRICHMENT_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+STATEMENT_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 1000)
+
+# Whether responses carry the request's breakdown (total, SQL, outbound calls)
+# in a Server-Timing header, which browser dev tools show per request:
+#   off     never (the default)
+#   opt-in  only for requests sending SERVER_TIMING_HEADER: 1 or ?server_timing=1
+#   on      always (1 and true mean the same)
+# Set with the SERVER_TIMING environment variable or app.config["SERVER_TIMING"].
+SERVER_TIMING = os.environ.get("SERVER_TIMING", "off")
+SERVER_TIMING_HEADER = "X-Server-Timing"
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n"))
+        for name, value in labels
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """A monotonically increasing value per label set."""
+
+    kind = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [(self.name, tuple(zip(self.labelnames, key)), value) for key, value in items]
+
+
+class Histogram:
+    """Counts of observations per bucket, plus their sum and count, per label set."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=REQUEST_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._values = {}  # label values -> [count per bucket..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[index] += 1
+                    break
+            entry[-2] += value
+            entry[-1] += 1
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, list(entry)) for key, entry in self._values.items())
+        samples = []
+        for key, entry in items:
+            labels = tuple(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets, entry):
+                cumulative += count
+                samples.append((self.name + "_bucket", labels + (("le", _format_value(float(bound))),), cumulative))
+            samples.append((self.name + "_bucket", labels + (("le", "+Inf"),), entry[-1]))
+            samples.append((self.name + "_sum", labels, entry[-2]))
+            samples.append((self.name + "_count", labels, entry[-1]))
+        return samples
+
+
+class Registry:
+    """
+    The metrics of this process, rendered in the Prometheus text format.
+
+    Collectors are functions called at render time that return
+    (name, type, help, value) tuples, for numbers that already live elsewhere
+    such as cache hit counters.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, help_text, labelnames=()):
+        metric = Counter(f"{METRICS_PREFIX}_{name}", help_text, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labelnames=(), buckets=REQUEST_BUCKETS):
+        metric = Histogram(f"{METRICS_PREFIX}_{name}", help_text, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector):
+        self._collectors.append(collector)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        for collector in self._collectors:
+            try:
+                collected = collector()
+            except Exception as e:
+                print(f"Error collecting metrics: {e}")
+                continue
+            for name, kind, help_text, value in collected:
+                name = f"{METRICS_PREFIX}_{name}"
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                lines.append(f"{name} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+request_duration = registry.histogram(
+    "http_request_duration_seconds", "Time to build each response, by endpoint.",
+    ("method", "endpoint", "status"),
+)
+request_statements = registry.histogram(
+    "http_request_sql_statements", "SQLite statements issued per request, by endpoint.",
+    ("endpoint",), STATEMENT_BUCKETS,
+)
+request_sql_seconds = registry.counter(
+    "http_request_sql_seconds_total", "Time spent in SQLite while handling requests, by endpoint.",
+    ("endpoint",),
+)
+sql_statements = registry.counter(
+    "sql_statements_total", "SQLite statements issued, inside requests or not.",
+)
+sql_seconds = registry.counter(
+    "sql_seconds_total", "Time spent executing SQLite statements and fetching their rows.",
+)
+enrichment_duration = registry.histogram(
+    "enrichment_call_duration_seconds", "Outbound enrichment calls, by service and outcome.",
+    ("service", "outcome"), ENRICHMENT_BUCKETS,
+)
+
+
+class RequestStats:
+    """What one request has spent so far; kept per thread while it is handled."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.statements = 0
+        self.sql_seconds = 0.0
+        self.calls = {}  # service -> [count, seconds]
+
+    def server_timing(self, total):
+        """Return the breakdown as a Server-Timing header value (durations in ms)."""
+        parts = [
+            f"total;dur={total * 1000:.1f}",
+            f'sql;dur={self.sql_seconds * 1000:.1f};desc="{self.statements} statements"',
+        ]
+        for service, (count, seconds) in sorted(self.calls.items()):
+            parts.append(f'{service};dur={seconds * 1000:.1f};desc="{count} calls"')
+        return ", ".join(parts)
+
+
+_local = threading.local()
+
+
+def start_request():
+    _local.request = RequestStats()
+
+
+def current_request():
+    """Return the calling thread's RequestStats, or None outside a request."""
+    return getattr(_local, "request", None)
+
+
+def finish_request(method, endpoint, status):
+    """
+    Record the calling thread's request and stop tracking it.
+
+    Returns:
+        tuple: (RequestStats, total seconds), or None if no request was started.
+    """
+    stats = current_request()
+    if stats is None:
+        return None
+    _local.request = None
+    total = time.perf_counter() - stats.started
+    request_duration.observe(total, method=method, endpoint=endpoint, status=str(status))
+    request_statements.observe(stats.statements, endpoint=endpoint)
+    request_sql_seconds.inc(stats.sql_seconds, endpoint=endpoint)
+    return stats, total
+
+
+def record_statement(seconds, statements=1):
+    sql_statements.inc(statements)
+    sql_seconds.inc(seconds)
+    stats = current_request()
+    if stats is not None:
+        stats.statements += statements
+        stats.sql_seconds += seconds
+
+
+@contextmanager
+def track_call(service):
+    """
+    Time an outbound call (e.g. "openai", "serpapi") into the enrichment
+    histogram and the current request's breakdown. Exceptions are recorded
+    with outcome="error" and re-raised.
+    """
+    started = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        enrichment_duration.observe(seconds, service=service, outcome=outcome)
+        stats = current_request()
+        if stats is not None:
+            entry = stats.calls.setdefault(service, [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """
+    Cursor that reports each statement, and the time to run it and fetch its
+    rows, whether they are fetched with fetchone/fetchmany/fetchall or by
+    iterating over the cursor. SQLite produces rows as they are fetched, so for
+    large reads most of the time is spent there rather than in execute.
+    """
+
+    _iteration_seconds = 0.0  # Iteration time not yet recorded; see __next__
+
+    def execute(self, sql, parameters=(), /):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            record_statement(time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters, /):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            record_statement(time.perf_counter() - started)
+
+    def executescript(self, sql_script, /):
+        started = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            record_statement(time.perf_counter() - started)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            record_statement(time.perf_counter() - started, statements=0)
+
+    def __next__(self):
+        # Called once per row, so the time is added up here and recorded once
+        # the rows run out, rather than paying for the shared counters every
+        # row. A loop that stops early leaves its time uncounted.
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            record_statement(self._iteration_seconds + time.perf_counter() - started, statements=0)
+            self._iteration_seconds = 0.0
+            raise
+        self._iteration_seconds += time.perf_counter() - started
+        return row
+
+    def fetchall(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            record_statement(time.perf_counter() - started, statements=0)
+
+    def fetchmany(self, *args):
+        started = time.perf_counter()
+        try:
+            return super().fetchmany(*args)
+        finally:
+            record_statement(time.perf_counter() - started, statements=0)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """
+    Connection whose cursors are InstrumentedCursors, including the ones the
+    execute shortcuts create. Still a sqlite3.Connection, so pandas and the
+    `with conn:` transaction handling work unchanged.
+    """
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=(), /):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters, /):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script, /):
+        return self.cursor().executescript(sql_script)
+
+
+def server_timing_requested(mode, request):
+    """Return whether a response to request should carry a Server-Timing header under mode."""
+    mode = str(mode).strip().lower()
+    if mode in ("on", "1", "true"):
+        return True
+    if mode == "opt-in":
+        return request.headers.get(SERVER_TIMING_HEADER) == "1" or request.args.get("server_timing") == "1"
+    return False
+
+
+def init_app(app):
+    """
+    Time every request of a Flask app and report it in a Server-Timing header
+    when app.config["SERVER_TIMING"] allows (see SERVER_TIMING).
+    """
+    from flask import request
+
+    app.config.setdefault("SERVER_TIMING", SERVER_TIMING)
+
+    @app.before_request
+    def start_request_timer():
+        start_request()
+
+    @app.after_request
+    def record_request(response):
+        finished = finish_request(request.method, request.endpoint or "unmatched", response.status_code)
+        if finished and server_timing_requested(app.config["SERVER_TIMING"], request):
+            stats, total = finished
+            response.headers["Server-Timing"] = stats.server_timing(total)
+        return response
+
+    @app.teardown_request
+    def record_failed_request(exception):
+        # after_request is skipped when a view raises; count it as a 500
+        if current_request() is not None:
+            finish_request(request.method, request.endpoint or "unmatched", 500)
@@ -1,15 +1,14 @@
 import json
-import os
 import re
 from html.parser import HTMLParser
 from db_queries import get_tasting_note_names
 import requests
-from openai import OpenAI
+from enrichment_clients import DEFAULT_SECRETS_PATH, get_api_key, get_http_session, get_openai_client
+from http_cache import http_cache, normalize_query, normalize_url, SEARCH_TTL, PAGE_TTL
+from llm_cache import cached_completion
+from metrics import track_call
 
 
-BASE_DIR = os.path.dirname(__file__)
-
-DEFAULT_SECRETS_PATH = os.path.join(BASE_DIR, "secrets.json")
 SERPAPI_BASE_URL = "https://serpapi.com/search.json"
 
 
@@ -45,14 +44,6 @@ def collapse_whitespace(text):
     return re.sub(r"\s+", " ", text).strip()
 
 
-def get_api_key(filepath=DEFAULT_SECRETS_PATH, key_name="OPENAI_KEY"):
-    with open(filepath, "r", encoding="utf-8") as file:
-        secrets = json.load(file)
-    api_key = secrets.get(key_name)
-    if not api_key:
-        raise ValueError(f"API key '{key_name}' not found in {filepath}")
-    return api_key
-
 def serpapi_search(query, max_results=10, secrets_path=DEFAULT_SECRETS_PATH):
     api_key = get_api_key(filepath=secrets_path, key_name="SERP_KEY")
     deny_list = ["reddit.com", "archierose.com.au"]
@@ -65,9 +56,16 @@ def serpapi_search(query, max_results=10, secrets_path=DEFAULT_SECRETS_PATH):
         "api_key": api_key,
         "num": min(max_results, 10),
     }
-    response = requests.get(SERPAPI_BASE_URL, params=params, timeout=10)
-    response.raise_for_status()
-    data = response.json()
+    cache_key = f"serpapi:{params['num']}:{normalize_query(query)}"
+    cached = http_cache.get(cache_key)
+    if cached and cached["fresh"]:
+        data = json.loads(cached["body"])
+    else:
+        with track_call("serpapi"):
+            response = get_http_session().get(SERPAPI_BASE_URL, params=params, timeout=10)
+            response.raise_for_status()
+        data = response.json()
+        http_cache.put(cache_key, json.dumps(data), SEARCH_TTL)
 
     results = []
     for item in data.get("organic_results", []):
@@ -100,7 +98,7 @@ def safe_json_loads(text):
             return None
 
 
-def choose_official_url(client, bottle_query, results):
+def choose_official_url(client, bottle_query, results, bypass_cache=False):
     if not results:
         return {"selected_url": None, "confidence": 0.0, "reason": "no results"}
 
@@ -134,11 +132,7 @@ def choose_official_url(client, bottle_query, results):
         },
     ]
 
-    response = client.chat.completions.create(
-        model="gpt-5",
-        messages=messages,
-    )
-    content = response.choices[0].message.content
+    content = cached_completion(client, "gpt-5", messages, bypass=bypass_cache)
     data = safe_json_loads(content) or {}
 
     return {
@@ -159,17 +153,41 @@ def fetch_page_text(url, timeout=10):
             "Chrome/120.0 Safari/537.36"
         )
     }
+    # Pages are cached as extracted text; once stale they are revalidated with
+    # the stored validators so an unchanged page costs a 304 instead of a download.
+    cache_key = f"page:{normalize_url(url)}"
+    cached = http_cache.get(cache_key)
+    if cached and cached["fresh"]:
+        return cached["body"]
+    if cached:
+        if cached["etag"]:
+            headers["If-None-Match"] = cached["etag"]
+        if cached["last_modified"]:
+            headers["If-Modified-Since"] = cached["last_modified"]
+
     try:
-        response = requests.get(url, headers=headers, timeout=timeout)
+        with track_call("page_fetch"):
+            response = get_http_session().get(url, headers=headers, timeout=timeout)
+        if response.status_code == 304 and cached:
+            http_cache.revalidated(cache_key, PAGE_TTL)
+            return cached["body"]
         response.raise_for_status()
     except requests.RequestException:
-        return ""
-
-    text = html_to_text(response.text)
-    return collapse_whitespace(text)
+        return cached["body"] if cached else ""
+
+    text = collapse_whitespace(html_to_text(response.text))
+    if text:
+        http_cache.put(
+            cache_key,
+            text,
+            PAGE_TTL,
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified"),
+        )
+    return text
 
 
-def classify_tasting_notes(client, bottle_query, page_text, allowed_notes, max_notes=8):
+def classify_tasting_notes(client, bottle_query, page_text, allowed_notes, max_notes=8, bypass_cache=False):
     allowed_list = json.dumps(allowed_notes, ensure_ascii=True)
     truncated_text = page_text[:6000]
     messages = [
@@ -192,11 +210,7 @@ def classify_tasting_notes(client, bottle_query, page_text, allowed_notes, max_n
         },
     ]
 
-    response = client.chat.completions.create(
-        model="gpt-5",
-        messages=messages,
-    )
-    content = response.choices[0].message.content
+    content = cached_completion(client, "gpt-5", messages, bypass=bypass_cache)
     data = safe_json_loads(content) or {}
 
     notes = data.get("notes", [])
@@ -211,15 +225,112 @@ def classify_tasting_notes(client, bottle_query, page_text, allowed_notes, max_n
     }
 
 
+def classify_tasting_notes_batch(client, items, allowed_notes, max_notes=8, bypass_cache=False):
+    """
+    Classify several bottles' page texts in one request that shares a single
+    allowed-notes header. items is a list of (bottle_query, page_text) pairs.
+
+    Returns a list aligned with items holding the same dictionary as
+    classify_tasting_notes, or None where the answer for that bottle was
+    missing or malformed.
+    """
+    allowed_list = json.dumps(allowed_notes, ensure_ascii=True)
+    sections = []
+    for idx, (bottle_query, page_text) in enumerate(items, start=1):
+        sections.append(
+            f"[{idx}] Bottle: {bottle_query}\n"
+            f"Description text: {page_text[:6000]}"
+        )
+
+    messages = [
+        {
+            "role": "system",
+            "content": (
+                "You are a classifier that extracts tasting notes from official product descriptions. "
+                "Use only the allowed notes list. Do not guess. Classify each numbered bottle independently. "
+                "Return JSON only with key results: an array with one object per bottle, each with keys "
+                "index (the bottle number), notes (array of strings) and evidence (object mapping note to quote)."
+            ),
+        },
+        {
+            "role": "user",
+            "content": (
+                f"Allowed notes: {allowed_list}\n\n"
+                + "\n\n".join(sections)
+                + f"\n\nSelect up to {max_notes} notes per bottle. Return JSON only."
+            ),
+        },
+    ]
+
+    content = cached_completion(client, "gpt-5", messages, bypass=bypass_cache)
+    data = safe_json_loads(content or "") or {}
+
+    allowed_set = set(allowed_notes)
+    classified = [None] * len(items)
+    results = data.get("results")
+    if not isinstance(results, list):
+        return classified
+
+    for result in results:
+        if not isinstance(result, dict):
+            continue
+        index = result.get("index")
+        notes = result.get("notes")
+        evidence = result.get("evidence") or {}
+        if not isinstance(index, int) or not 1 <= index <= len(items):
+            continue
+        if not isinstance(notes, list) or not isinstance(evidence, dict):
+            continue
+        filtered = [note for note in notes if isinstance(note, str) and note in allowed_set]
+        classified[index - 1] = {
+            "notes": filtered[:max_notes],
+            "evidence": {note: evidence.get(note, "") for note in filtered},
+        }
+    return classified
+
+
+def find_note_source(client, bottle_query, results, failed_urls, max_attempts=5, bypass_cache=False):
+    """
+    Pick the most official search result not in failed_urls and fetch its text.
+    URLs whose page can't be read are added to failed_urls. Returns
+    (selection, page_text); page_text is empty when no usable page was found.
+    """
+    selection = {"selected_url": None, "confidence": 0.0, "reason": "no results"}
+
+    while len(failed_urls) < max_attempts:
+        candidates = [
+            item for item in results
+            if item.get("url") and item["url"] not in failed_urls
+        ]
+        if not candidates:
+            break
+
+        selection = choose_official_url(client, bottle_query, candidates, bypass_cache=bypass_cache)
+        url = selection.get("selected_url")
+        candidate_urls = {item["url"] for item in candidates}
+        if not url or url not in candidate_urls:
+            # Asking again would replay the same cached answer
+            break
+
+        print("selection", selection)
+        page_text = fetch_page_text(url)
+        if page_text:
+            return selection, page_text
+        failed_urls.add(url)
+
+    return selection, ""
+
+
 def generate_expert_notes(
     bottle_query,
     secrets_path=DEFAULT_SECRETS_PATH,
     max_results=10,
     max_notes=8,
     max_attempts=5,
+    bypass_cache=False,
 ):
     allowed_notes = get_tasting_note_names()
-    client = OpenAI(api_key=get_api_key(filepath=secrets_path))
+    client = get_openai_client(filepath=secrets_path)
     print("target bottle to generate notes for", bottle_query)
     results = serpapi_search(
         bottle_query,
@@ -229,46 +340,36 @@ def generate_expert_notes(
 
     failed_urls = set()
     selection = {"selected_url": None, "confidence": 0.0, "reason": "no results"}
-    attempts = 0
 
-    while attempts < max_attempts:
-        candidates = [
-            item for item in results
-            if item.get("url") and item["url"] not in failed_urls
-        ]
-        if not candidates:
+    while len(failed_urls) < max_attempts:
+        selection, page_text = find_note_source(
+            client, bottle_query, results, failed_urls,
+            max_attempts=max_attempts, bypass_cache=bypass_cache,
+        )
+        if not page_text:
             break
 
-        selection = choose_official_url(client, bottle_query, candidates)
-        url = selection.get("selected_url")
-        candidate_urls = {item["url"] for item in candidates}
-        if not url or url not in candidate_urls:
-            continue
-
-        print("selection", selection)
-        page_text = fetch_page_text(url)
-        if page_text:
-            classified = classify_tasting_notes(
-                client,
-                bottle_query,
-                page_text,
-                allowed_notes,
-                max_notes=max_notes,
-            )
-
-            if len(classified["notes"]) > 0:
-                print("failed URLS: ", failed_urls)
-                return {
-                    "bottle": bottle_query,
-                    "source_url": url,
-                    "selection": selection,
-                    "notes": classified["notes"],
-                    "evidence": classified["evidence"],
-                }
-            print("retrying, URL was", url,"page text was: ", page_text)
+        url = selection["selected_url"]
+        classified = classify_tasting_notes(
+            client,
+            bottle_query,
+            page_text,
+            allowed_notes,
+            max_notes=max_notes,
+            bypass_cache=bypass_cache,
+        )
 
+        if len(classified["notes"]) > 0:
+            print("failed URLS: ", failed_urls)
+            return {
+                "bottle": bottle_query,
+                "source_url": url,
+                "selection": selection,
+                "notes": classified["notes"],
+                "evidence": classified["evidence"],
+            }
+        print("retrying, URL was", url,"page text was: ", page_text)
         failed_urls.add(url)
-        attempts += 1
 
     return {
         "bottle": bottle_query,
@@ -279,6 +380,83 @@ def generate_expert_notes(
     }
 
 
+def generate_expert_notes_batch(
+    bottle_queries,
+    secrets_path=DEFAULT_SECRETS_PATH,
+    max_results=10,
+    max_notes=8,
+    max_attempts=5,
+    bypass_cache=False,
+):
+    """
+    Generate expert notes for several bottles, classifying all of their pages
+    in one LLM request. Bottles the batch couldn't classify (no page found, a
+    malformed answer or no notes) fall back to generate_expert_notes, which
+    also retries other source URLs.
+
+    Returns a list aligned with bottle_queries of generate_expert_notes results;
+    a bottle whose fallback raised gets an "error" key instead of notes.
+    """
+    allowed_notes = get_tasting_note_names()
+    client = get_openai_client(filepath=secrets_path)
+
+    sources = []
+    for bottle_query in bottle_queries:
+        try:
+            results = serpapi_search(bottle_query, max_results=max_results, secrets_path=secrets_path)
+            selection, page_text = find_note_source(
+                client, bottle_query, results, set(),
+                max_attempts=max_attempts, bypass_cache=bypass_cache,
+            )
+        except Exception as exc:
+            print("batch source lookup failed for", bottle_query, exc)
+            selection, page_text = None, ""
+        sources.append((selection, page_text))
+
+    batch = [(idx, bottle_queries[idx]) for idx, (_, page_text) in enumerate(sources) if page_text]
+    classified = [None] * len(batch)
+    if batch:
+        try:
+            classified = classify_tasting_notes_batch(
+                client,
+                [(bottle_query, sources[idx][1]) for idx, bottle_query in batch],
+                allowed_notes,
+                max_notes=max_notes,
+                bypass_cache=bypass_cache,
+            )
+        except Exception as exc:
+            print("batch classification failed, falling back to single calls", exc)
+
+    outcomes = [None] * len(bottle_queries)
+    for (idx, bottle_query), result in zip(batch, classified):
+        if result and result["notes"]:
+            selection = sources[idx][0]
+            outcomes[idx] = {
+                "bottle": bottle_query,
+                "source_url": selection["selected_url"],
+                "selection": selection,
+                "notes": result["notes"],
+                "evidence": result["evidence"],
+            }
+
+    for idx, bottle_query in enumerate(bottle_queries):
+        if outcomes[idx] is not None:
+            continue
+        try:
+            outcomes[idx] = generate_expert_notes(
+                bottle_query,
+                secrets_path=secrets_path,
+                max_results=max_results,
+                max_notes=max_notes,
+                max_attempts=max_attempts,
+                bypass_cache=bypass_cache,
+            )
+        except Exception as exc:
+            outcomes[idx] = {"bottle": bottle_query, "notes": [], "evidence": {}, "error": str(exc)}
+
+    return outcomes
+
+
 if __name__ == "__main__":
     import sys
 
@@ -0,0 +1,266 @@
+import heapq
+import math
+import sys
+import threading
+from collections import OrderedDict
+
+from db_queries import (REVIEW_SCORE_TABLES, count_review_scores, get_available_bottle_ids, get_bottle_summaries,
+                        get_data_versions, get_review_scores)
+
+
+# Users who scored both bottles before their similarity counts at full strength
+SIMILARITY_SHRINK = 5.0
+# Pseudo-reviews pulling a bottle's average towards the overall average
+BIAS_SHRINK = 3.0
+# How much the bottle's average counts against the user's own similar bottles
+PRIOR_WEIGHT = 1.0
+
+MAX_RECOMMENDATIONS = 50
+# Each user's top list is ranked once and reused until a review or bottle changes
+TOP_LIST_TABLES = REVIEW_SCORE_TABLES + ("bottles",)
+TOP_LIST_CACHE_SIZE = 10000  # Lists kept; the least recently used go first
+
+
+class Recommender:
+    """
+    Item-item collaborative filtering over the users' review scores.
+
+    Scores are centred on each user's own average, so a generous and a harsh
+    reviewer who agree on which bottle is better count as agreeing. Two bottles
+    are similar when the same users rate them above or below their average
+    together. A user's predicted score for a bottle is their average plus a
+    similarity-weighted mix of how they rated the bottles they know, blended with
+    the bottle's overall lean; a user with no reviews gets the best liked bottles.
+
+    Ratings are kept per user and the similarity sums per pair of bottles that
+    share a reviewer, so memory grows with the reviews rather than users x
+    bottles. A new review only re-adds its reviewer's pairs, and predictions are
+    made on request for the candidates asked about. Methods take the instance
+    lock; share one per process.
+    """
+
+    def __init__(self, rows=()):
+        self.last_review_id = 0
+        self.user_scores = {}  # user ID -> {bottle ID: [score sum, review count]}
+        self.centred = {}  # user ID -> {bottle ID: score minus the user's average}
+        self.means = {}  # user ID -> average score
+        self.pairs = {}  # bottle ID -> {bottle ID: [sum of centred products, co-raters]}
+        self.centred_sums = {}  # bottle ID -> sum of its raters' centred scores
+        self.rater_counts = {}  # bottle ID -> number of users who rated it
+        self.rating_sum = 0.0
+        self.rating_count = 0
+        self._lock = threading.Lock()
+        self.update(rows)
+
+    def _add_user(self, centred, sign):
+        """Add (sign 1) or remove (sign -1) one user's centred scores from the pair sums."""
+        for bottle, value in centred.items():
+            row = self.pairs.setdefault(bottle, {})
+            signed = sign * value
+            for other, other_value in centred.items():
+                pair = row.get(other)
+                if pair is None:  # Only when adding; a removed pair was added before
+                    row[other] = [signed * other_value, 1]
+                    continue
+                pair[0] += signed * other_value
+                pair[1] += sign
+                if pair[1] == 0:
+                    del row[other]
+            self.centred_sums[bottle] = self.centred_sums.get(bottle, 0.0) + signed
+            self.rater_counts[bottle] = self.rater_counts.get(bottle, 0) + sign
+
+    def update(self, rows):
+        """
+        Fold new (review_id, user_id, bottle_id, score) rows into the model.
+        Rows at or below last_review_id were already applied and are skipped.
+
+        Returns:
+            int: The number of reviews applied.
+        """
+        with self._lock:
+            rows = [row for row in rows if row[0] > self.last_review_id]
+            if not rows:
+                return 0
+
+            touched = {}
+            for review_id, user_id, bottle_id, score in rows:
+                scores = self.user_scores.setdefault(user_id, {})
+                total = scores.setdefault(bottle_id, [0.0, 0])
+                total[0] += score
+                total[1] += 1
+                touched[user_id] = scores
+                self.rating_sum += score
+                self.rating_count += 1
+            self.last_review_id = max(row[0] for row in rows)
+
+            # Take each touched user's old contribution out and put the new one in
+            for user_id, scores in touched.items():
+                self._add_user(self.centred.get(user_id, {}), -1)
+                averages = {bottle: total[0] / total[1] for bottle, total in scores.items()}
+                mean = sum(averages.values()) / len(averages)
+                self.means[user_id] = mean
+                self.centred[user_id] = {bottle: score - mean for bottle, score in averages.items()}
+                self._add_user(self.centred[user_id], 1)
+            return len(rows)
+
+    def _bias(self, bottle):
+        return self.centred_sums.get(bottle, 0.0) / (self.rater_counts.get(bottle, 0) + BIAS_SHRINK)
+
+    def _norm(self, bottle):
+        return math.sqrt(max(self.pairs[bottle][bottle][0], 0.0))
+
+    def recommend(self, user_id, candidate_ids=None, limit=MAX_RECOMMENDATIONS):
+        """
+        Return up to limit (bottle ID, predicted score, because bottle ID) tuples,
+        best first, for bottles the user has not reviewed. because is the reviewed
+        bottle that most raised the prediction, or None.
+
+        Only bottles someone has reviewed can be ranked. Pass candidate_ids to
+        rank just those, e.g. the bottles that are available; they are filtered
+        before the list is cut to limit.
+        """
+        with self._lock:
+            known = self.pairs.keys() if candidate_ids is None else \
+                [bottle for bottle in dict.fromkeys(candidate_ids) if bottle in self.pairs]
+            centred = self.centred.get(user_id, {})
+            candidates = [bottle for bottle in known if bottle not in centred]
+            if not candidates:
+                return []
+
+            # Similarity-weighted sums, from the pairs of each bottle the user rated
+            weighted = dict.fromkeys(candidates, 0.0)
+            weights = dict.fromkeys(candidates, 0.0)
+            because = {}
+            for rated, value in centred.items():
+                rated_norm = self._norm(rated)
+                for bottle, (product, corated) in self.pairs[rated].items():
+                    if bottle not in weighted:
+                        continue
+                    denominator = rated_norm * self._norm(bottle)
+                    if denominator <= 0:
+                        continue
+                    similarity = product / denominator * corated / (corated + SIMILARITY_SHRINK)
+                    contribution = value * similarity
+                    weighted[bottle] += contribution
+                    weights[bottle] += abs(similarity)
+                    if contribution > 0 and contribution > because.get(bottle, (0.0, None))[0]:
+                        because[bottle] = (contribution, rated)
+
+            # No reviews yet: the overall average plus each bottle's lean
+            mean = self.means.get(user_id, self.rating_sum / max(self.rating_count, 1))
+            predictions = [
+                (mean + (weighted[bottle] + PRIOR_WEIGHT * self._bias(bottle)) / (weights[bottle] + PRIOR_WEIGHT), bottle)
+                for bottle in candidates
+            ]
+            best = heapq.nlargest(limit, predictions, key=lambda prediction: prediction[0])
+            return [
+                (bottle, round(score, 1), because.get(bottle, (0.0, None))[1])
+                for score, bottle in best
+            ]
+
+
+_lock = threading.Lock()
+_recommender_cache = None  # (data versions the recommender is up to date with, Recommender)
+_top_lists = None  # (data versions, OrderedDict of (user ID, candidate IDs) -> recommendations)
+
+
+def get_recommender():
+    """
+    Return the shared Recommender with every review folded in. Reviews added
+    since the last call are applied incrementally; removals trigger a rebuild.
+    """
+    global _recommender_cache
+    versions = get_data_versions(REVIEW_SCORE_TABLES)
+    with _lock:
+        cached = _recommender_cache
+    if cached is not None and cached[0] == versions:
+        return cached[1]
+
+    if cached is not None:
+        recommender = cached[1]
+        # Reviews are never edited, so if every review the recommender has seen
+        # is still there, the change was additions and can be folded in
+        if count_review_scores(recommender.last_review_id) == recommender.rating_count:
+            recommender.update(get_review_scores(after_id=recommender.last_review_id))
+            with _lock:
+                _recommender_cache = (versions, recommender)
+            return recommender
+
+    recommender = Recommender(get_review_scores())
+    with _lock:
+        # Keyed on the versions read before the build, so reviews written during
+        # it are picked up by the next call
+        _recommender_cache = (versions, recommender)
+    return recommender
+
+
+def rank_recommendations(user_id, limit=MAX_RECOMMENDATIONS, candidate_ids=None):
+    """Rank the available candidates for user_id; see get_recommendations, which caches this."""
+    # Unavailable bottles are dropped before ranking, so they can't use up the limit
+    candidates = get_available_bottle_ids(candidate_ids)
+    matches = get_recommender().recommend(user_id, candidate_ids=candidates, limit=limit)
+    summaries = {
+        bottle["id"]: bottle
+        for bottle in get_bottle_summaries({match[0] for match in matches} | {match[2] for match in matches if match[2]})
+    }
+    results = []
+    for bottle_id, score, because in matches:
+        bottle = summaries.get(bottle_id)
+        if not bottle:
+            continue
+        reason = summaries.get(because)
+        results.append(dict(
+            bottle,
+            predicted_score=score,
+            because={"id": reason["id"], "brand": reason["brand"], "name": reason["name"]} if reason else None,
+        ))
+    return results
+
+
+def get_recommendations(user_id, limit=5, candidate_ids=None):
+    """
+    Return the available bottles the user is most likely to enjoy and has not reviewed.
+
+    The user's top MAX_RECOMMENDATIONS are ranked on the first request and kept
+    until the reviews or bottles change (by their data versions), so later
+    requests only slice the stored list.
+
+    Parameters:
+        user_id (int): The user to recommend for.
+        limit (int): The most bottles to return, up to MAX_RECOMMENDATIONS.
+        candidate_ids (list): Only consider these bottles, e.g. an event's drinks.
+
+    Returns:
+        list: Bottle summaries (see get_bottle_summaries), best first, each with a
+        "predicted_score" and, where one stands out, the reviewed bottle that
+        suggested it as "because".
+    """
+    global _top_lists
+    key = (user_id, None if candidate_ids is None else tuple(candidate_ids))
+    versions = get_data_versions(TOP_LIST_TABLES)
+    with _lock:
+        if _top_lists is None or _top_lists[0] != versions:
+            _top_lists = (versions, OrderedDict())
+        top = _top_lists[1].get(key)
+        if top is not None:
+            _top_lists[1].move_to_end(key)
+
+    if top is None:
+        top = rank_recommendations(user_id, MAX_RECOMMENDATIONS, candidate_ids)
+        with _lock:
+            # A list ranked while the data changed belongs to the old versions
+            if _top_lists[0] == versions:
+                _top_lists[1][key] = top
+                if len(_top_lists[1]) > TOP_LIST_CACHE_SIZE:
+                    _top_lists[1].popitem(last=False)
+    # Copies, so callers can't change the stored list
+    return [dict(bottle) for bottle in top[:limit]]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        for bottle in get_recommendations(int(sys.argv[1]), limit=10):
+            because = f"  (because of {bottle['because']['name']})" if bottle["because"] else ""
+            print(f"{bottle['predicted_score']:>4}  {bottle['brand']} {bottle['name']}{because}")
+    else:
+        print("Usage: python recommendations.py <user_id>")
@@ -0,0 +1,142 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Bottles refreshed at once across all jobs; each one spends most of its time
+# waiting on SerpAPI, page fetches and the LLM, so a handful of threads is plenty.
+DEFAULT_REFRESH_WORKERS = int(os.environ.get("REFRESH_WORKERS", 4))
+
+# Finished jobs kept around for the status endpoint
+MAX_FINISHED_JOBS = 20
+
+
+class RefreshJob:
+    """Progress and per-bottle results of one background refresh."""
+
+    def __init__(self, kind, bottle_ids):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.total = len(bottle_ids)
+        self.results = OrderedDict((bottle_id, {"id": bottle_id, "status": "pending"}) for bottle_id in bottle_ids)
+        self.created_at = time.time()
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    def record(self, bottle_id, status, error=None):
+        with self._lock:
+            result = {"id": bottle_id, "status": status}
+            if error:
+                result["error"] = error
+            self.results[bottle_id] = result
+            if self.completed == self.total:
+                self.finished_at = time.time()
+
+    @property
+    def completed(self):
+        return sum(1 for result in self.results.values() if result["status"] not in ("pending", "running"))
+
+    @property
+    def state(self):
+        if self.finished_at is not None or self.total == 0:
+            return "finished"
+        if any(result["status"] != "pending" for result in self.results.values()):
+            return "running"
+        return "queued"
+
+    def to_dict(self):
+        with self._lock:
+            results = list(self.results.values())
+            return {
+                "job_id": self.id,
+                "kind": self.kind,
+                "state": self.state,
+                "total": self.total,
+                "completed": self.completed,
+                "updated": [result["id"] for result in results if result["status"] == "updated"],
+                "skipped": [result["id"] for result in results if result["status"] == "skipped"],
+                "errors": [
+                    {"id": result["id"], "error": result["error"]}
+                    for result in results if result["status"] == "error"
+                ],
+                "results": results,
+            }
+
+
+class RefreshJobRunner:
+    """
+    Runs refresh jobs on a bounded thread pool shared by every job.
+
+    submit() registers a job and queues one task per bottle, so the HTTP request
+    returns immediately; the caller polls get() for progress. The task function
+    returns True when it updated the bottle and False when it skipped it; any
+    exception is recorded as that bottle's error.
+    """
+
+    def __init__(self, max_workers=DEFAULT_REFRESH_WORKERS):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="refresh")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, kind, bottles, task):
+        job = RefreshJob(kind, [bottle["id"] for bottle in bottles])
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        for bottle in bottles:
+            self._executor.submit(self._run, job, bottle, task)
+        return job
+
+    def submit_batches(self, kind, bottles, batch_task, batch_size):
+        """
+        Like submit, but queue the bottles in groups of batch_size. batch_task
+        receives a list of bottles and returns a dictionary mapping each bottle ID
+        to True (updated), False (skipped) or an Exception (that bottle failed).
+        """
+        job = RefreshJob(kind, [bottle["id"] for bottle in bottles])
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        for start in range(0, len(bottles), batch_size):
+            self._executor.submit(self._run_batch, job, bottles[start:start + batch_size], batch_task)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job, bottle, task):
+        job.record(bottle["id"], "running")
+        try:
+            updated = task(bottle)
+            job.record(bottle["id"], "updated" if updated else "skipped")
+        except Exception as exc:
+            job.record(bottle["id"], "error", str(exc))
+
+    def _run_batch(self, job, bottles, batch_task):
+        for bottle in bottles:
+            job.record(bottle["id"], "running")
+        try:
+            outcomes = batch_task(bottles)
+        except Exception as exc:
+            for bottle in bottles:
+                job.record(bottle["id"], "error", str(exc))
+            return
+        for bottle in bottles:
+            outcome = outcomes.get(bottle["id"], False)
+            if isinstance(outcome, Exception):
+                job.record(bottle["id"], "error", str(outcome))
+            else:
+                job.record(bottle["id"], "updated" if outcome else "skipped")
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.state == "finished"]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+
+
+runner = RefreshJobRunner()
@@ -0,0 +1,165 @@
+import sys
+import threading
+
+import numpy as np
+
+from db_queries import NOTE_PROFILE_TABLES, get_bottle_summaries, get_data_versions, get_note_profiles, get_taxonomy
+
+
+# One expert note counts as much as the note every reviewer of the bottle chose
+EXPERT_WEIGHT = 1.0
+COMMUNITY_WEIGHT = 1.0
+# Share of a note's weight also given to its parent, and again to the grandparent,
+# so "Peat" and "Smoke" still overlap through "Smoky"
+ROLLUP_DECAY = 0.5
+
+MAX_NEIGHBOURS = 12  # Neighbours kept per bottle
+SHARED_NOTES = 3  # Notes listed as the reason two bottles match
+BLOCK_ROWS = 2048  # Rows of the similarity product held in memory at once
+
+
+class SimilarityIndex:
+    """
+    Nearest neighbours of every bottle by tasting note profile.
+
+    Each bottle is a row of a bottle x tasting-note matrix. Expert notes add
+    EXPERT_WEIGHT; community notes add their share of the bottle's most chosen
+    note, so a bottle with many reviews does not outweigh one with a few. Weights
+    are then rolled up the taxonomy and rows scaled to unit length, so one matrix
+    product gives the cosine similarity of every pair. Built once and read-only.
+    """
+
+    def __init__(self, rows, taxonomy):
+        self.note_ids = np.array(sorted(taxonomy.parent_ids), dtype=np.int64)
+        self.note_names = [taxonomy.names_by_id[note_id] for note_id in self.note_ids.tolist()]
+        note_column = {note_id: column for column, note_id in enumerate(self.note_ids.tolist())}
+
+        rows = [row for row in rows if row[1] in note_column]
+        self.bottle_ids = np.array(sorted({row[0] for row in rows}), dtype=np.int64)
+        self.bottle_row = {bottle_id: index for index, bottle_id in enumerate(self.bottle_ids.tolist())}
+
+        profiles = np.zeros((len(self.bottle_ids), len(self.note_ids)), dtype=np.float32)
+        if rows:
+            data = np.array(rows, dtype=np.float64)
+            bottle_index = np.searchsorted(self.bottle_ids, data[:, 0].astype(np.int64))
+            note_index = np.array([note_column[row[1]] for row in rows], dtype=np.int64)
+            expert = data[:, 2] == 1
+            counts = data[:, 3]
+
+            top_counts = np.zeros(len(self.bottle_ids))
+            np.maximum.at(top_counts, bottle_index[~expert], counts[~expert])
+            weights = np.where(
+                expert,
+                EXPERT_WEIGHT * counts,
+                COMMUNITY_WEIGHT * counts / np.maximum(top_counts[bottle_index], 1),
+            )
+            np.add.at(profiles, (bottle_index, note_index), weights.astype(np.float32))
+
+        profiles = profiles @ self._rollup_matrix(taxonomy, note_column)
+        norms = np.linalg.norm(profiles, axis=1, keepdims=True)
+        self.profiles = np.divide(profiles, norms, out=np.zeros_like(profiles), where=norms > 0)
+        self.neighbours, self.scores = self._top_neighbours(self.profiles)
+
+    @staticmethod
+    def _rollup_matrix(taxonomy, note_column):
+        """Return R so that profiles @ R adds each note's decayed weight to its ancestors."""
+        size = len(note_column)
+        parents = np.zeros((size, size), dtype=np.float32)
+        for note_id, parent_id in taxonomy.parent_ids.items():
+            if parent_id in note_column and parent_id != note_id:
+                parents[note_column[note_id], note_column[parent_id]] = 1
+        step = ROLLUP_DECAY * parents
+        return np.eye(size, dtype=np.float32) + step + step @ step
+
+    @staticmethod
+    def _top_neighbours(profiles):
+        """
+        Return (indices, scores) of each row's MAX_NEIGHBOURS most similar other
+        rows, best first. Pairs with nothing in common score 0 and are left as -1.
+        """
+        count = len(profiles)
+        k = min(MAX_NEIGHBOURS, max(count - 1, 0))
+        neighbours = np.full((count, k), -1, dtype=np.int64)
+        scores = np.zeros((count, k), dtype=np.float32)
+        if k == 0:
+            return neighbours, scores
+
+        for start in range(0, count, BLOCK_ROWS):
+            block = profiles[start:start + BLOCK_ROWS] @ profiles.T
+            rows = np.arange(len(block))
+            block[rows, start + rows] = -1  # A bottle is not its own neighbour
+            top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+            top_scores = np.take_along_axis(block, top, axis=1)
+            order = np.argsort(-top_scores, axis=1)
+            top = np.take_along_axis(top, order, axis=1)
+            top_scores = np.take_along_axis(top_scores, order, axis=1)
+            neighbours[start:start + len(block)] = np.where(top_scores > 0, top, -1)
+            scores[start:start + len(block)] = np.maximum(top_scores, 0)
+        return neighbours, scores
+
+    def similar(self, bottle_id, limit=MAX_NEIGHBOURS):
+        """
+        Return up to limit (bottle ID, score, shared note names) tuples for the
+        bottles most like bottle_id. Bottles without notes have no neighbours.
+        """
+        index = self.bottle_row.get(int(bottle_id))
+        if index is None:
+            return []
+        results = []
+        for neighbour, score in zip(self.neighbours[index][:limit], self.scores[index][:limit]):
+            if neighbour < 0:
+                break
+            overlap = self.profiles[index] * self.profiles[neighbour]
+            shared = [
+                self.note_names[column]
+                for column in np.argsort(-overlap)[:SHARED_NOTES]
+                if overlap[column] > 0
+            ]
+            results.append((int(self.bottle_ids[neighbour]), round(float(score), 3), shared))
+        return results
+
+
+_lock = threading.Lock()
+_index_cache = None  # (data versions the index was built at, SimilarityIndex)
+
+
+def get_similarity_index():
+    """Return the cached SimilarityIndex, rebuilding it if any bottle's notes have changed."""
+    global _index_cache
+    versions = get_data_versions(NOTE_PROFILE_TABLES)
+    with _lock:
+        if _index_cache is not None and _index_cache[0] == versions:
+            return _index_cache[1]
+
+    index = SimilarityIndex(get_note_profiles(), get_taxonomy())
+
+    with _lock:
+        # Keyed on the versions read before the build, so notes written during
+        # it are picked up by the next call
+        _index_cache = (versions, index)
+    return index
+
+
+def get_similar_bottles(bottle_id, limit=6):
+    """
+    Return the bottles with the tasting note profiles closest to bottle_id.
+
+    Returns:
+        list: Bottle summaries (see get_bottle_summaries), best match first, each
+        with a cosine "score" and the "shared_notes" that contribute most to it.
+    """
+    matches = get_similarity_index().similar(bottle_id, limit=limit)
+    bottles = {bottle["id"]: bottle for bottle in get_bottle_summaries([match[0] for match in matches])}
+    results = []
+    for neighbour_id, score, shared in matches:
+        if neighbour_id in bottles:
+            results.append(dict(bottles[neighbour_id], score=score, shared_notes=shared))
+    return results
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        for bottle in get_similar_bottles(int(sys.argv[1]), limit=MAX_NEIGHBOURS):
+            print(f"{bottle['score']:.3f}  {bottle['brand']} {bottle['name']}  ({', '.join(bottle['shared_notes'])})")
+    else:
+        print("Usage: python similarity.py <bottle_id>")
@@ -0,0 +1,297 @@
+"""
+Build a realistic Bar Companion database at a chosen scale, for benchmarking.
+
+    python synthetic_data.py database/benchmark.db --scale 2
+
+The sample CSV holds a few dozen bottles, which hides anything that grows with the
+catalog. This fills a fresh database with thousands of bottles and tens of
+thousands of users and reviews. Popular bottles and keen reviewers get most of
+the reviews, scores follow each bottle's quality, and tasting notes come from the
+setup_db taxonomy, weighted towards a profile picked for each bottle.
+"""
+import argparse
+import csv
+import os
+import random
+import sqlite3
+import time
+from datetime import date, timedelta
+
+try:
+    from database.setup_db import setup_database
+    from database.migrations import apply_migrations
+except ImportError:
+    from setup_db import setup_database
+    from migrations import apply_migrations
+from db_queries import refresh_bottle_stats
+
+
+SAMPLE_CSV = "./database/bottles_sample_data.csv"
+
+# Row counts at --scale 1
+DEFAULT_BOTTLES = 2000
+DEFAULT_USERS = 10000
+DEFAULT_REVIEWS = 50000
+DEFAULT_EVENTS = 40
+
+# Share of reviews written at an event, of bottles still on the shelf and of
+# bottles with expert notes
+EVENT_REVIEW_SHARE = 0.4
+AVAILABLE_SHARE = 0.75
+EXPERT_NOTES_SHARE = 0.6
+# Share of a review's community notes taken from its bottle's profile rather
+# than anywhere in the taxonomy
+PROFILE_NOTE_SHARE = 0.7
+
+NAME_WORDS = [
+    "Cask Strength", "Small Batch", "Single Barrel", "Port Cask", "Sherry Cask", "Peated",
+    "Reserve", "Distiller's Edition", "Double Oak", "Founder's", "Harbour", "Highland",
+    "Coastal", "Botanical", "Navy Strength", "Heritage", "Winter", "Solera", "Rye Cask", "Smoked",
+]
+BRAND_WORDS = [
+    "Copper", "Stillwater", "Ironbark", "Blackwood", "Saltbush", "Red Gum", "Granite",
+    "Old Quarry", "Kestrel", "Lantern", "Tidewater", "Foxglove", "Hollow Creek", "Bellbird",
+]
+FIRST_NAMES = [
+    "Alex", "Sam", "Jordan", "Charlie", "Riley", "Jamie", "Taylor", "Morgan", "Casey", "Quinn",
+    "Avery", "Harper", "Rowan", "Skyler", "Emerson", "Finley", "Hayden", "Reese", "Sage", "Drew",
+]
+LAST_NAMES = [
+    "Smith", "Nguyen", "Williams", "Brown", "Wilson", "Taylor", "Lee", "Martin", "Singh",
+    "Anderson", "Thompson", "White", "Walker", "Kelly", "Chen", "Harris", "Ryan", "Clarke",
+]
+REVIEW_OPENERS = ["Lots of", "Big hit of", "Subtle", "Loved the", "Mostly", "Hints of", "Plenty of"]
+REVIEW_CLOSERS = [
+    "long finish.", "a bit hot on the finish.", "would drink again.", "better with a drop of water.",
+    "smooth all the way through.", "not my style.", "great value.",
+]
+
+
+def load_templates():
+    """Return the sample bottles, whose brands, types and descriptions seed the catalog."""
+    with open(SAMPLE_CSV, "r") as file:
+        return [row for row in csv.DictReader(file) if row["spirit_type"]]
+
+
+def zipf_weights(count, exponent):
+    """Cumulative weights giving item i a share proportional to 1 / (i + 1) ** exponent."""
+    cumulative = []
+    total = 0.0
+    for rank in range(count):
+        total += 1.0 / (rank + 1) ** exponent
+        cumulative.append(total)
+    return cumulative
+
+
+def make_bottles(rng, count, templates):
+    brands = sorted({row["brand"] for row in templates})
+    brands += [f"{word} {kind}" for word in BRAND_WORDS for kind in ("Distillery", "Spirits", "& Sons")]
+    rows = []
+    for bottle_id in range(1, count + 1):
+        template = rng.choice(templates)
+        age = rng.choice(["", "", " 8 Year", " 10 Year", " 12 Year", " 15 Year", " 18 Year"])
+        rows.append((
+            bottle_id,
+            rng.choice(brands),
+            f"{rng.choice(NAME_WORDS)}{age} #{bottle_id}",
+            f"{rng.uniform(37, 64):.1f}%",
+            template["spirit_type"],
+            template["subtype"] or None,
+            template["description"],
+            int(rng.random() < AVAILABLE_SHARE),
+            template["image_path"],
+        ))
+    return rows
+
+
+def make_users(rng, count):
+    rows = []
+    for user_id in range(1, count + 1):
+        rows.append((user_id, f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {user_id}", ""))
+    return rows
+
+
+def make_events(rng, count, bottle_count, user_count, today):
+    """Return event rows plus their drinks and participants as (event_id, id) pairs."""
+    events, drinks, participants = [], [], []
+    for event_id in range(1, count + 1):
+        event_date = today - timedelta(days=rng.randint(0, 3 * 365))
+        code = f"Night{event_id:04d}"
+        events.append((event_id, f"./database_images/events/{code}", f"Tasting Night {event_id}", code,
+                       event_date.isoformat()))
+        drinks += [(event_id, b) for b in rng.sample(range(1, bottle_count + 1), min(bottle_count, rng.randint(8, 20)))]
+        participants += [(event_id, u) for u in rng.sample(range(1, user_count + 1), min(user_count, rng.randint(10, 40)))]
+    return events, drinks, participants
+
+
+def review_text(rng, note_names):
+    if rng.random() < 0.2:
+        return None
+    return f"{rng.choice(REVIEW_OPENERS)} {' and '.join(note_names).lower() or 'oak'}, {rng.choice(REVIEW_CLOSERS)}"
+
+
+def generate(db_path, bottles=DEFAULT_BOTTLES, users=DEFAULT_USERS, reviews=DEFAULT_REVIEWS,
+             events=DEFAULT_EVENTS, seed=0):
+    """
+    Replace db_path with a new database full of synthetic data.
+
+    Parameters:
+        db_path (str): Database file to create; an existing file is deleted.
+        bottles, users, reviews, events (int): Rows to generate of each.
+        seed (int): Seed for the random generator, so a run can be repeated exactly.
+
+    Returns:
+        dict: Row counts of the generated tables.
+    """
+    rng = random.Random(seed)
+    today = date.today()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+
+    conn = sqlite3.connect(db_path)
+    try:
+        setup_database(conn)
+        apply_migrations(conn)
+        # Nothing to lose if the machine dies half way through
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = OFF")
+
+        notes = conn.execute("SELECT id, name, tier FROM tasting_notes").fetchall()
+        note_names = {note_id: name for note_id, name, _ in notes}
+        leaf_notes = [note_id for note_id, _, tier in notes if str(tier) == "1"] or list(note_names)
+
+        bottle_rows = make_bottles(rng, bottles, load_templates())
+        user_rows = make_users(rng, users)
+        event_rows, drink_rows, participant_rows = make_events(rng, events, bottles, users, today)
+
+        # Each bottle has a quality and a handful of notes it is known for
+        quality = [min(9.5, max(2.0, rng.gauss(6.5, 1.2))) for _ in range(bottles + 1)]
+        profiles = [rng.sample(leaf_notes, rng.randint(3, 6)) for _ in range(bottles + 1)]
+        user_bias = [rng.gauss(0, 0.8) for _ in range(users + 1)]
+
+        # A few bottles and a few regulars account for most reviews
+        bottle_ids = list(range(1, bottles + 1))
+        user_ids = list(range(1, users + 1))
+        rng.shuffle(bottle_ids)
+        rng.shuffle(user_ids)
+        bottle_weights = zipf_weights(bottles, 0.8)
+        user_weights = zipf_weights(users, 0.6)
+        event_drinks = {event[0]: [] for event in event_rows}
+        event_users = {event[0]: [] for event in event_rows}
+        for event_id, bottle_id in drink_rows:
+            event_drinks[event_id].append(bottle_id)
+        for event_id, user_id in participant_rows:
+            event_users[event_id].append(user_id)
+        event_dates = {event[0]: event[4] for event in event_rows}
+
+        review_rows, note_rows, seen = [], [], set()
+        attempts = 0
+        while len(review_rows) < reviews and attempts < 20 * reviews:
+            attempts += 1
+            event_id = None
+            if event_rows and rng.random() < EVENT_REVIEW_SHARE:
+                event_id = rng.choice(event_rows)[0]
+                user_id = rng.choice(event_users[event_id])
+                bottle_id = rng.choice(event_drinks[event_id])
+                review_date = event_dates[event_id]
+            if event_id is None or (user_id, bottle_id) in seen:
+                # Small events run out of new pairs; review at home instead
+                event_id = None
+                user_id = rng.choices(user_ids, cum_weights=user_weights)[0]
+                bottle_id = rng.choices(bottle_ids, cum_weights=bottle_weights)[0]
+                review_date = (today - timedelta(days=rng.randint(0, 3 * 365))).isoformat()
+            if (user_id, bottle_id) in seen:
+                continue  # One review per bottle per user, as the UI encourages
+            seen.add((user_id, bottle_id))
+
+            review_id = len(review_rows) + 1
+            chosen = []
+            for _ in range(rng.randint(0, 5)):
+                note_id = rng.choice(profiles[bottle_id]) if rng.random() < PROFILE_NOTE_SHARE else rng.choice(notes)[0]
+                if note_id not in chosen:
+                    chosen.append(note_id)
+            note_rows += [(review_id, note_id) for note_id in chosen]
+            score = min(10, max(0, round(quality[bottle_id] + user_bias[user_id] + rng.gauss(0, 1.5))))
+            review_rows.append((review_id, user_id, event_id, bottle_id,
+                                review_text(rng, [note_names[n] for n in chosen[:2]]), score, review_date))
+
+        expert_rows = [
+            (bottle_id, note_id)
+            for bottle_id in range(1, bottles + 1) if rng.random() < EXPERT_NOTES_SHARE
+            for note_id in profiles[bottle_id]
+        ]
+
+        with conn:
+            cursor = conn.cursor()
+            cursor.executemany("""
+                INSERT INTO bottles (id, brand, name, abv, spirit_type, subtype, description, available, image_path)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, bottle_rows)
+            cursor.executemany("INSERT INTO users (id, name, image_path) VALUES (?, ?, ?)", user_rows)
+            cursor.executemany(
+                "INSERT INTO events (id, folder_path, name, code, event_date) VALUES (?, ?, ?, ?, ?)", event_rows
+            )
+            cursor.executemany("INSERT INTO event_drinks (event_id, bottle_id) VALUES (?, ?)", drink_rows)
+            cursor.executemany("INSERT INTO event_participants (event_id, user_id) VALUES (?, ?)", participant_rows)
+            cursor.executemany("""
+                INSERT INTO reviews (id, user_id, event_id, bottle_id, review_text, score, review_date)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, review_rows)
+            cursor.executemany("INSERT INTO community_notes (review_id, tasting_note_id) VALUES (?, ?)", note_rows)
+            cursor.executemany("INSERT INTO expert_notes (bottle_id, tasting_note_id) VALUES (?, ?)", expert_rows)
+            refresh_bottle_stats(cursor)
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+
+    return {
+        "bottles": len(bottle_rows),
+        "users": len(user_rows),
+        "reviews": len(review_rows),
+        "community_notes": len(note_rows),
+        "expert_notes": len(expert_rows),
+        "events": len(event_rows),
+        "event_drinks": len(drink_rows),
+        "event_participants": len(participant_rows),
+    }
+
+
+def add_arguments(parser):
+    """Add the generator's scale options to an argparse parser."""
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="Multiply every default row count (default 1: "
+                             f"{DEFAULT_BOTTLES} bottles, {DEFAULT_USERS} users, {DEFAULT_REVIEWS} reviews)")
+    parser.add_argument("--bottles", type=int, help="Bottles to generate, overriding --scale")
+    parser.add_argument("--users", type=int, help="Users to generate, overriding --scale")
+    parser.add_argument("--reviews", type=int, help="Reviews to generate, overriding --scale")
+    parser.add_argument("--events", type=int, help="Events to generate, overriding --scale")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default 0)")
+
+
+def generate_from_args(db_path, args):
+    """Run generate() with the options added by add_arguments(), printing a summary."""
+    def scaled(value, default):
+        return value if value is not None else max(1, int(default * args.scale))
+
+    started = time.perf_counter()
+    counts = generate(
+        db_path,
+        bottles=scaled(args.bottles, DEFAULT_BOTTLES),
+        users=scaled(args.users, DEFAULT_USERS),
+        reviews=scaled(args.reviews, DEFAULT_REVIEWS),
+        events=scaled(args.events, DEFAULT_EVENTS),
+        seed=args.seed,
+    )
+    summary = ", ".join(f"{count} {table}" for table, count in counts.items())
+    print(f"Generated {db_path} in {time.perf_counter() - started:.1f}s: {summary}")
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fill a new database with synthetic bottles, users and reviews.")
+    parser.add_argument("db_path", help="Database file to create, e.g. database/benchmark.db")
+    add_arguments(parser)
+    args = parser.parse_args()
+    generate_from_args(args.db_path, args)
@@ -0,0 +1,40 @@
+import contextlib
+import io
+import os
+import sys
+
+import pytest
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The app's modules live at the top level of the repository
+sys.path.insert(0, REPO_ROOT)
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """db_queries pointed at a new, migrated database in tmp_path."""
+    import db_queries
+    import recommendations
+    import similarity
+
+    monkeypatch.setattr(db_queries, "DB_PATH", str(tmp_path / "bar_companion.db"))
+    # Caches key on the data versions, which every new database starts again
+    monkeypatch.setattr(db_queries, "_taxonomy_cache", None)
+    monkeypatch.setattr(recommendations, "_recommender_cache", None)
+    monkeypatch.setattr(recommendations, "_top_lists", None)
+    monkeypatch.setattr(similarity, "_index_cache", None)
+    db_queries.pool.invalidate()
+    with contextlib.redirect_stdout(io.StringIO()):
+        db_queries.migrate_database()
+    yield db_queries
+    db_queries.pool.invalidate()
+
+
+@pytest.fixture
+def client(db):
+    """Flask test client for the app, backed by the db fixture's database."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        from app import app
+    return app.test_client()
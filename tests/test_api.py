@@ -0,0 +1,59 @@
+def add_bottles(db, count):
+    with db.create_connection() as conn:
+        conn.executemany(
+            "INSERT INTO bottles (brand, name, abv, spirit_type) VALUES ('Brand', ?, '40%', 'Gin')",
+            [(f"Bottle {number}",) for number in range(count)],
+        )
+
+
+def test_api_bottles_pages_with_cursor(db, client):
+    add_bottles(db, 5)
+    first = client.get("/api/bottles?after_id=0&limit=3").get_json()
+    assert [bottle["id"] for bottle in first["bottles"]] == [1, 2, 3]
+    assert first["next_cursor"] == 3
+
+    second = client.get(f"/api/bottles?after_id={first['next_cursor']}&limit=3").get_json()
+    assert [bottle["id"] for bottle in second["bottles"]] == [4, 5]
+    assert second["next_cursor"] is None
+
+
+def test_api_bottles_keeps_list_contract_without_cursor(db, client):
+    add_bottles(db, 5)
+    bottles = client.get("/api/bottles?offset=1&limit=2").get_json()
+    assert [bottle["id"] for bottle in bottles] == [2, 3]
+    assert set(bottles[0]) == {"id", "brand", "name", "abv", "image_path", "available"}
+
+
+def test_api_bottles_rejects_malformed_arguments(client):
+    for query in ("after_id=abc", "limit=ten", "offset=1.5"):
+        response = client.get(f"/api/bottles?{query}")
+        assert response.status_code == 400
+        assert "error" in response.get_json()
+
+
+def test_event_stream_ignores_malformed_last_event_id(client):
+    response = client.get("/api/events/1/stream", headers={"Last-Event-ID": "not-a-number"})
+    try:
+        assert response.status_code == 200
+        assert next(response.response) == b"retry: 5000\n\n"
+    finally:
+        response.close()
+
+
+def test_api_search_rejects_malformed_limit(client):
+    response = client.get("/api/search?q=gin&limit=abc")
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "limit must be an integer"}
+
+
+def test_api_similar_bottles_rejects_malformed_limit(db, client):
+    add_bottles(db, 1)
+    response = client.get("/api/bottles/1/similar?limit=abc")
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "limit must be an integer"}
+
+
+def test_api_refresh_rejects_malformed_limit(client):
+    response = client.post("/api/refresh?id=notes&limit=abc")
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "limit must be an integer"}
@@ -0,0 +1,59 @@
+import contextlib
+import sqlite3
+
+import recommendations
+
+
+@contextlib.contextmanager
+def other_process(db):
+    """A connection of its own, like the CLI or another worker writing to the database."""
+    conn = sqlite3.connect(db.DB_PATH)
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def add_reviews(conn, rows):
+    for user_id, bottle_id, score in rows:
+        conn.execute("INSERT INTO reviews (user_id, bottle_id, review_text, score) VALUES (?, ?, '', ?)",
+                     (user_id, bottle_id, score))
+
+
+def test_taxonomy_sees_notes_written_by_another_process(db):
+    assert "Smoked Kelp" not in db.get_tasting_note_names()
+    with other_process(db) as conn:
+        conn.execute("INSERT INTO tasting_notes (name, parent, tier) VALUES ('Smoked Kelp', 'vanillas', '1')")
+    assert "Smoked Kelp" in db.get_tasting_note_names()
+
+
+def test_recommender_follows_reviews_written_by_another_process(db):
+    with other_process(db) as conn:
+        bottle_ids = [
+            conn.execute("INSERT INTO bottles (brand, name, abv, spirit_type) VALUES ('Brand', ?, '40%', 'Gin')",
+                         (f"Bottle {number}",)).lastrowid
+            for number in range(4)
+        ]
+        user_ids = [
+            conn.execute("INSERT INTO users (name, image_path) VALUES (?, '')", (f"User {number}",)).lastrowid
+            for number in range(3)
+        ]
+        add_reviews(conn, [(user_ids[0], bottle_ids[0], 8), (user_ids[0], bottle_ids[1], 4)])
+
+    first = recommendations.get_recommender()
+    assert first.rating_count == 2
+
+    # Additions are folded into the same recommender
+    with other_process(db) as conn:
+        add_reviews(conn, [(user_ids[1], bottle_ids[2], 6), (user_ids[2], bottle_ids[3], 9)])
+    assert recommendations.get_recommender() is first
+    assert first.rating_count == 4
+
+    # A deletion can't be undone incrementally, so the recommender is rebuilt
+    with other_process(db) as conn:
+        conn.execute("DELETE FROM reviews WHERE bottle_id = ?", (bottle_ids[0],))
+    rebuilt = recommendations.get_recommender()
+    assert rebuilt is not first
+    assert rebuilt.rating_count == 3
+    assert bottle_ids[0] not in rebuilt.pairs
@@ -0,0 +1,102 @@
+import sqlite3
+
+import pytest
+
+from db_connection import ConnectionPool
+
+
+@pytest.fixture
+def pool_db(tmp_path):
+    pool = ConnectionPool()
+    db_path = str(tmp_path / "pool.db")
+    with pool.acquire(db_path) as conn:
+        conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)")
+    yield pool, db_path
+    pool.close()
+
+
+def test_nested_block_leaves_outer_transaction_and_row_factory(pool_db):
+    pool, db_path = pool_db
+    with pool.acquire(db_path) as outer:
+        outer.row_factory = sqlite3.Row
+        outer.execute("INSERT INTO items (name) VALUES ('outer')")
+
+        with pool.acquire(db_path) as inner:
+            assert inner is outer
+            assert inner.row_factory is None  # Helpers start from the default
+            inner.execute("INSERT INTO items (name) VALUES ('inner')")
+
+        # The inner block neither committed nor changed the caller's rows
+        assert outer.in_transaction
+        assert outer.row_factory is sqlite3.Row
+        assert outer.execute("SELECT name FROM items ORDER BY id").fetchall()[1]["name"] == "inner"
+
+    assert not outer.in_transaction
+    assert pool.acquire(db_path).execute("SELECT COUNT(*) FROM items").fetchone()[0] == 2
+
+
+def test_outer_rollback_discards_nested_writes(pool_db):
+    pool, db_path = pool_db
+    with pytest.raises(RuntimeError):
+        with pool.acquire(db_path):
+            with pool.acquire(db_path) as inner:
+                inner.execute("INSERT INTO items (name) VALUES ('inner')")
+            raise RuntimeError("outer block fails")
+
+    conn = pool.acquire(db_path)
+    assert conn.execute("SELECT COUNT(*) FROM items").fetchone()[0] == 0
+    assert conn.depth == 0
+
+
+def test_failed_nested_block_undoes_only_its_own_writes(pool_db):
+    pool, db_path = pool_db
+    with pool.acquire(db_path) as outer:
+        outer.execute("INSERT INTO items (name) VALUES ('outer')")
+        with pytest.raises(sqlite3.IntegrityError):
+            with pool.acquire(db_path) as inner:
+                inner.execute("INSERT INTO items (id, name) VALUES (100, 'inner')")
+                inner.execute("INSERT INTO items (id, name) VALUES (100, 'duplicate')")
+        assert outer.in_transaction
+
+    names = pool.acquire(db_path).execute("SELECT name FROM items").fetchall()
+    assert names == [("outer",)]
+
+
+def test_nested_block_after_reads_does_not_commit_early(pool_db):
+    pool, db_path = pool_db
+    with pytest.raises(RuntimeError):
+        with pool.acquire(db_path) as outer:
+            outer.execute("SELECT COUNT(*) FROM items").fetchone()  # No transaction yet
+            with pool.acquire(db_path) as inner:
+                inner.execute("INSERT INTO items (name) VALUES ('inner')")
+            raise RuntimeError("outer block fails")
+
+    assert pool.acquire(db_path).execute("SELECT COUNT(*) FROM items").fetchone()[0] == 0
+
+
+class CallerFailed(Exception):
+    pass
+
+
+def test_write_helpers_join_the_callers_transaction(db, client):
+    from app import app
+
+    # The event helpers answer with jsonify, which needs an app context
+    with app.app_context(), pytest.raises(CallerFailed):
+        with db.create_connection():
+            bottle_id = db.add_bottle("Brand", "Nested", "40%", "gin")
+            db.update_bottle(bottle_id, subtype="London Dry")
+            user_id = db.add_user("nested", "")
+            review_id = db.add_review(user_id, bottle_id, "fine", 7)
+            assert db.add_note_record(review_id, 1)
+            db.update_expert_notes(bottle_id, [1, 2])
+            db.add_event("N1", "2024-01-01", "", "Nested night")
+            db.add_bottle_to_event([bottle_id], 1)
+            db.add_user_to_event([user_id], 1)
+            db.remove_record("reviews", review_id)
+            raise CallerFailed()
+
+    with db.create_connection() as conn:
+        for table in ("bottles", "users", "reviews", "community_notes", "expert_notes",
+                      "events", "event_drinks", "event_participants", "bottle_stats"):
+            assert conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] == 0, table
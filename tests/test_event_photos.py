@@ -0,0 +1,43 @@
+import contextlib
+import io
+
+from PIL import Image
+
+
+def test_upgrade_indexes_photos_already_in_event_folders(db, tmp_path):
+    folder = tmp_path / "event_photos"
+    folder.mkdir()
+    Image.new("RGB", (40, 30), "red").save(folder / "before_upgrade.jpg")
+    (folder / "notes.txt").write_text("not a photo")
+    db.add_event("ABC", "2024-01-01", str(folder), "Old event")
+    # As if the database was last migrated before the backfill existed
+    with db.create_connection() as conn:
+        conn.execute("DELETE FROM schema_version WHERE version = 6")
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert db.migrate_database() == [6]
+        db.migrate_database()
+
+    photos, _ = db.get_event_photos(1)
+    assert [(photo["filename"], photo["width"], photo["height"]) for photo in photos] == [
+        ("before_upgrade.jpg", 40, 30)
+    ]
+
+
+def test_upload_to_unknown_event_is_404(client):
+    response = client.post("/api/upload_event_photo_file", data={
+        "event_id": "999",
+        "image_file": (io.BytesIO(b"not read"), "photo.jpg"),
+    })
+    assert response.status_code == 404
+    assert response.get_json() == {"error": "Event not found"}
+    response = client.post("/api/upload_event_photo_b64", data={"event_id": "999", "image_data": "data:,"})
+    assert response.status_code == 404
+    assert response.get_json() == {"error": "Event not found"}
+
+
+def test_event_photos_reject_malformed_paging(client):
+    for query in ("limit=abc", "before_id=abc"):
+        response = client.get(f"/api/events/1/photos?{query}")
+        assert response.status_code == 400
+        assert "error" in response.get_json()
@@ -0,0 +1,73 @@
+import os
+
+import pytest
+from PIL import Image
+
+import image_pipeline
+
+
+@pytest.fixture
+def image_root(tmp_path, monkeypatch, client):
+    import app
+
+    root = tmp_path / "database_images"
+    (root / "bottles").mkdir(parents=True)
+    Image.new("RGB", (400, 300), "red").save(root / "bottles" / "bottle.png")
+    Image.new("RGB", (40, 30), "blue").save(tmp_path / "outside_secret.png")
+    monkeypatch.setattr(image_pipeline, "IMAGE_ROOT", str(root))
+    monkeypatch.setattr(app, "IMAGE_ROOT", str(root))
+    return root
+
+
+def test_serves_resized_variant(client, image_root):
+    response = client.get("/database_images/bottles/bottle.png?size=thumb", headers={"Accept": "image/webp"})
+    assert response.status_code == 200
+    assert response.mimetype == "image/webp"
+    assert "no-cache" in response.headers["Cache-Control"]
+    assert (image_root / "variants" / "thumb" / "bottles" / "bottle.webp").exists()
+
+
+@pytest.mark.parametrize("path", ["%2e%2e/outside_secret.png", "bottles/%2e%2e/%2e%2e/outside_secret.png"])
+def test_variant_request_cannot_leave_image_root(client, image_root, path):
+    response = client.get(f"/database_images/{path}?size=thumb")
+    assert response.status_code == 404
+    written = [name for _, _, files in os.walk(image_root) for name in files]
+    assert written == ["bottle.png"]
+
+
+def test_unknown_size_is_rejected(client, image_root):
+    assert client.get("/database_images/bottles/bottle.png?size=../../x").status_code == 404
+
+
+def test_replaced_original_gets_new_variant(client, image_root):
+    client.get("/database_images/bottles/bottle.png?size=card")
+    variant = image_root / "variants" / "card" / "bottles" / "bottle.jpg"
+    old_mtime = variant.stat().st_mtime
+
+    source = image_root / "bottles" / "bottle.png"
+    Image.new("RGB", (200, 100), "green").save(source)
+    os.utime(source, (old_mtime + 10, old_mtime + 10))
+    client.get("/database_images/bottles/bottle.png?size=card")
+    with Image.open(variant) as image:
+        assert image.size == (200, 100)
+
+
+def test_versioned_urls_are_cached_immutably(client, image_root):
+    url = image_pipeline.image_url("bottles/bottle.png", "thumb")
+    assert url.startswith("/database_images/bottles/bottle.png?size=thumb&v=")
+    response = client.get(url, headers={"Accept": "image/webp"})
+    assert response.status_code == 200
+    assert response.cache_control.max_age == 31536000
+    assert response.cache_control.immutable
+
+    original = client.get(image_pipeline.image_url("bottles/bottle.png"))
+    assert original.cache_control.immutable
+
+
+def test_replacing_a_photo_changes_its_url(image_root):
+    source = image_root / "bottles" / "bottle.png"
+    before = image_pipeline.image_url("bottles/bottle.png", "card")
+    stat = source.stat()
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert image_pipeline.image_url("bottles/bottle.png", "card") != before
+    assert image_pipeline.image_url("bottles/missing.png", "card") == "/database_images/bottles/missing.png?size=card"
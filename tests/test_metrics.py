@@ -0,0 +1,42 @@
+import sqlite3
+
+import pytest
+
+import metrics
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:", factory=metrics.InstrumentedConnection)
+    conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY)")
+    conn.executemany("INSERT INTO items (id) VALUES (?)", [(number,) for number in range(100)])
+    yield conn
+    conn.close()
+
+
+@pytest.mark.parametrize("read", [
+    lambda cursor: cursor.fetchone(),
+    lambda cursor: cursor.fetchall(),
+    lambda cursor: cursor.fetchmany(10),
+    lambda cursor: list(cursor),
+])
+def test_fetching_rows_is_timed_but_not_counted_as_a_statement(conn, read):
+    cursor = conn.execute("SELECT id FROM items")
+    metrics.start_request()
+    read(cursor)
+    stats, _ = metrics.finish_request("GET", "test", 200)
+    assert stats.statements == 0
+    assert stats.sql_seconds > 0
+
+
+@pytest.mark.parametrize("mode, headers, query, sent", [
+    ("off", {metrics.SERVER_TIMING_HEADER: "1"}, "", False),
+    ("on", {}, "", True),
+    ("opt-in", {}, "", False),
+    ("opt-in", {metrics.SERVER_TIMING_HEADER: "1"}, "", True),
+    ("opt-in", {}, "?server_timing=1", True),
+])
+def test_server_timing_header_follows_config(client, monkeypatch, mode, headers, query, sent):
+    monkeypatch.setitem(client.application.config, "SERVER_TIMING", mode)
+    response = client.get(f"/api/bottles{query}", headers=headers)
+    assert ("Server-Timing" in response.headers) == sent
@@ -0,0 +1,84 @@
+import contextlib
+import io
+
+import metrics
+
+
+def statements_issued(func):
+    """Run func and return how many SQL statements it issued."""
+    before = sum(value for _, _, value in metrics.sql_statements.samples())
+    with contextlib.redirect_stdout(io.StringIO()):
+        func()
+    return sum(value for _, _, value in metrics.sql_statements.samples()) - before
+
+
+def populate(db, count):
+    """Add count bottles and users, each user reviewing two bottles with notes, all at one event."""
+    with db.create_connection() as conn:
+        start_bottle = conn.execute("SELECT COALESCE(MAX(id), 0) FROM bottles").fetchone()[0]
+        start_user = conn.execute("SELECT COALESCE(MAX(id), 0) FROM users").fetchone()[0]
+        event_id = conn.execute("SELECT MIN(id) FROM events").fetchone()[0]
+        if event_id is None:
+            event_id = conn.execute(
+                "INSERT INTO events (folder_path, name, code) VALUES ('', 'Night', 'N1')"
+            ).lastrowid
+        note_ids = [row[0] for row in conn.execute("SELECT id FROM tasting_notes LIMIT 5")]
+
+        for offset in range(1, count + 1):
+            bottle_id = conn.execute(
+                "INSERT INTO bottles (brand, name, abv, spirit_type) VALUES ('Brand', ?, '40%', 'Gin')",
+                (f"Bottle {start_bottle + offset}",),
+            ).lastrowid
+            user_id = conn.execute(
+                "INSERT INTO users (name, image_path) VALUES (?, '')", (f"User {start_user + offset}",)
+            ).lastrowid
+            conn.execute("INSERT INTO event_drinks (event_id, bottle_id) VALUES (?, ?)", (event_id, bottle_id))
+            conn.execute("INSERT INTO event_participants (event_id, user_id) VALUES (?, ?)", (event_id, user_id))
+            conn.execute("INSERT INTO expert_notes (bottle_id, tasting_note_id) VALUES (?, ?)", (bottle_id, note_ids[0]))
+            for reviewed in {bottle_id, max(1, bottle_id - 1)}:
+                review_id = conn.execute(
+                    "INSERT INTO reviews (user_id, bottle_id, event_id, review_text, score) VALUES (?, ?, ?, 'ok', 7)",
+                    (user_id, reviewed, event_id),
+                ).lastrowid
+                conn.executemany(
+                    "INSERT INTO community_notes (review_id, tasting_note_id) VALUES (?, ?)",
+                    [(review_id, note_id) for note_id in note_ids[1:4]],
+                )
+    with contextlib.redirect_stdout(io.StringIO()):
+        db.rebuild_bottle_stats()
+    return event_id
+
+
+def assert_constant(db, func, count=10):
+    """func issues as many statements after the data doubles as before."""
+    populate(db, count)
+    func()  # Warm the connection and the taxonomy cache
+    small = statements_issued(func)
+    populate(db, count)
+    assert statements_issued(func) == small
+
+
+def test_get_all_bottles_query_count_is_constant(db):
+    assert_constant(db, db.get_all_bottles)
+
+
+def test_get_all_users_with_reviews_query_count_is_constant(db):
+    assert_constant(db, lambda: list(db.get_all_users_with_reviews()))
+
+
+def test_get_event_by_id_query_count_is_constant(db):
+    assert_constant(db, lambda: db.get_event_by_id(1))
+
+
+def test_users_carry_their_reviews_and_notes(db):
+    populate(db, 3)
+    users = list(db.get_all_users_with_reviews())
+    assert [len(user["reviews"]) for user in users] == [1, 2, 2]
+    review = users[1]["reviews"][0]
+    assert review["bottle_name"] == "Bottle 1"
+    assert review["tasting_notes"] == db.get_tasting_notes_by_review(review["id"])
+
+    event = db.get_event_by_id(1)
+    assert [len(user["reviews"]) for user in event["users"]] == [1, 2, 2]
+    assert event["users"][1]["reviews"][0]["tasting_notes"] == review["tasting_notes"]
+    assert all(review["reviewer_name"].startswith("User") for bottle in event["bottles"] for review in bottle["reviews"])
@@ -0,0 +1,92 @@
+import random
+
+import recommendations
+from recommendations import MAX_RECOMMENDATIONS, Recommender
+
+
+def random_reviews(count, users=40, bottles=30, seed=1):
+    rng = random.Random(seed)
+    return [
+        (review_id, rng.randint(1, users), rng.randint(1, bottles), rng.randint(1, 10))
+        for review_id in range(1, count + 1)
+    ]
+
+
+def test_incremental_updates_match_a_fresh_build():
+    rows = random_reviews(600)
+    built = Recommender(rows)
+    grown = Recommender(rows[:200])
+    for start in range(200, 600, 50):
+        grown.update(rows[start:start + 50])
+
+    assert grown.last_review_id == built.last_review_id
+    for user_id in range(1, 42):
+        assert grown.recommend(user_id) == built.recommend(user_id)
+
+
+def test_recommendations_skip_reviewed_bottles_and_respect_limit():
+    recommender = Recommender(random_reviews(600))
+    reviewed = set(recommender.centred[3])
+    matches = recommender.recommend(3, limit=4)
+    assert len(matches) == 4
+    assert not reviewed & {bottle_id for bottle_id, _, _ in matches}
+    assert [score for _, score, _ in matches] == sorted((score for _, score, _ in matches), reverse=True)
+    assert all(because is None or because in reviewed for _, _, because in matches)
+
+
+def add_critic_and_newcomer(db):
+    """
+    Add MAX_RECOMMENDATIONS + 11 bottles, all but the last unavailable, a critic
+    who rated the unavailable ones far above the available one, and a newcomer
+    with no reviews. Returns (bottle IDs, critic ID, newcomer ID).
+    """
+    count = MAX_RECOMMENDATIONS + 10
+    with db.create_connection() as conn:
+        bottle_ids = [
+            conn.execute(
+                "INSERT INTO bottles (brand, name, abv, spirit_type, available) VALUES ('Brand', ?, '40%', 'Gin', ?)",
+                (f"Bottle {number}", 0 if number < count else 1),
+            ).lastrowid
+            for number in range(count + 1)
+        ]
+        critic, newcomer = (
+            conn.execute("INSERT INTO users (name, image_path) VALUES (?, '')", (name,)).lastrowid
+            for name in ("Critic", "Newcomer")
+        )
+        for bottle_id in bottle_ids:
+            conn.execute("INSERT INTO reviews (user_id, bottle_id, review_text, score) VALUES (?, ?, '', ?)",
+                         (critic, bottle_id, 10 if bottle_id != bottle_ids[-1] else 2))
+    return bottle_ids, critic, newcomer
+
+
+def test_unavailable_bottles_do_not_crowd_out_available_ones(db):
+    bottle_ids, _, newcomer = add_critic_and_newcomer(db)
+    results = recommendations.get_recommendations(newcomer, limit=3)
+    assert [bottle["id"] for bottle in results] == [bottle_ids[-1]]
+
+
+def test_top_lists_are_reused_until_reviews_change(db, monkeypatch):
+    bottle_ids, critic, newcomer = add_critic_and_newcomer(db)
+    ranked = []
+    rank = recommendations.rank_recommendations
+    monkeypatch.setattr(recommendations, "rank_recommendations",
+                        lambda *args: ranked.append(args) or rank(*args))
+
+    first = recommendations.get_recommendations(newcomer, limit=3)
+    first[0]["predicted_score"] = None  # Callers get copies
+    assert recommendations.get_recommendations(newcomer, limit=3)[0]["predicted_score"] is not None
+    assert len(ranked) == 1
+
+    with db.create_connection() as conn:
+        conn.execute("UPDATE bottles SET available = 1 WHERE id = ?", (bottle_ids[0],))
+    results = recommendations.get_recommendations(newcomer, limit=3)
+    assert len(ranked) == 2
+    assert [bottle["id"] for bottle in results] == [bottle_ids[0], bottle_ids[-1]]
+
+
+def test_recommendations_reject_malformed_arguments(client, db):
+    _, critic, _ = add_critic_and_newcomer(db)
+    for query in ("limit=abc", "event_id=abc"):
+        response = client.get(f"/api/users/{critic}/recommendations?{query}")
+        assert response.status_code == 400
+        assert "error" in response.get_json()
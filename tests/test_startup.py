@@ -0,0 +1,30 @@
+import os
+import sqlite3
+import subprocess
+import sys
+
+from conftest import REPO_ROOT
+from database.setup_db import setup_database
+
+
+def test_app_imports_against_empty_database(tmp_path):
+    """A fresh checkout has no database file; importing the app must create and migrate it."""
+    (tmp_path / "database").mkdir()
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT)
+
+    for _ in range(2):  # The second import finds the schema already in place
+        result = subprocess.run([sys.executable, "-c", "import app"], cwd=tmp_path, env=env,
+                                capture_output=True, text=True, timeout=120)
+        assert result.returncode == 0, result.stderr
+
+    conn = sqlite3.connect(tmp_path / "database" / "bar_companion.db")
+    try:
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        assert {"bottles", "reviews", "bottle_stats", "event_photos", "data_versions"} <= tables
+        # setup_database() seeds the taxonomy, so it must only have run once
+        baseline = sqlite3.connect(":memory:")
+        setup_database(baseline)
+        expected = baseline.execute("SELECT COUNT(*) FROM tasting_notes").fetchone()[0]
+        assert conn.execute("SELECT COUNT(*) FROM tasting_notes").fetchone()[0] == expected
+    finally:
+        conn.close()
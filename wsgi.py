@@ -0,0 +1,14 @@
+"""
+Production entry point: `gunicorn -c gunicorn.conf.py wsgi:app`.
+
+Importing the app applies pending migrations but never starts the development
+server or its interactive debugger; that only happens under `python app.py`.
+"""
+from app import app
+from db_connection import pool
+
+
+# With preload_app the import above runs once in the gunicorn master, on the
+# master's own pooled connection. SQLite connections must not cross a fork, so
+# close it here and let each worker thread open its own.
+pool.close()